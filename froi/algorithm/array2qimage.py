@@ -6,8 +6,6 @@
 import sys as _sys
 import numpy as _np
 from PyQt4 import QtGui as _qt
-from matplotlib import cm as mpl_cm
-from froi import colormap as surfer_cm
 
 from qimageview import qimageview as _qimageview
 from tools import normalize_arr
@@ -23,94 +21,304 @@ bgra_dtype = _np.dtype({'b': (_np.uint8, _bgra[0], 'blue'),
                         'a': (_np.uint8, _bgra[3], 'alpha')})
 
 
-def gray(array, alpha):
-    """Return a rgba array which color ranges from black to white."""
+# Compiled lookup tables of colormaps, keyed on (colormap, alpha).
+_lut_cache = {}
+_LUT_CACHE_SIZE = 64
 
-    new_array_shape = array.shape + (4,)
-    new_array = _np.zeros(new_array_shape, dtype=_np.uint8)
-    new_array[..., 0] = array
-    new_array[..., 1] = array
-    new_array[..., 2] = array
-    new_array[..., 3] = alpha * array.clip(0, 1)
-    
-    return new_array
+# pysurfer colormaps shipped with froi.colormap
+_pysurfer_cmaps = ['rocket', 'mako', 'icefire', 'vlag']
+_pysurfer_cmaps.extend([cmap + '_r' for cmap in _pysurfer_cmaps])
 
+# scale used by the 'rainbow' colormap to separate adjacent values
+_RAINBOW_NORM = 100000
+_RAINBOW_RGB = (41, 61, 83)
 
-def red2yellow(array, alpha):
-    """Return a rgba array which color ranges from red to yellow."""
+# largest label value which is stored in a direct lookup table
+_LABEL_LUT_SIZE = 65536
 
-    new_array_shape = array.shape + (4,)
-    new_array = _np.zeros(new_array_shape, dtype=_np.uint8)
-    new_array[..., 0] = 255 * array.clip(0, 1)
-    new_array[..., 1] = array
-    new_array[..., 2] = 0
-    new_array[..., 3] = alpha * array.clip(0, 1)
-    
+# number of levels of quantized display data, the last one is kept for NaN
+QUANT_LEVELS = 65536
+NAN_LEVEL = QUANT_LEVELS - 1
+# number of quantiles of the data which half of the levels follow
+QUANT_QUANTILES = 1024
+# number of values sampled to estimate the quantiles
+QUANT_SAMPLE_SIZE = 2 ** 20
+
+
+def _gather(lut, index):
+    """Look up rgba values of the index array in a (n, 4) uint8 table.
+
+    Each rgba entry is fetched as one 32-bit word.
+    """
+    words = lut.reshape(-1, 4).view(_np.uint32).reshape(-1)
+    return _np.take(words, index).view(_np.uint8).reshape(index.shape + (4,))
+
+
+def _cached_lut(key, builder):
+    """Return the lookup table stored under key, build it if necessary."""
+    lut = _lut_cache.get(key)
+    if lut is None:
+        if len(_lut_cache) >= _LUT_CACHE_SIZE:
+            _lut_cache.clear()
+        lut = builder()
+        _lut_cache[key] = lut
+    return lut
+
+
+def _build_colormap_lut(colormap, alpha):
+    """Build a 256-entry rgba table for a continuous colormap.
+
+    Entry 0 is transparent, the others take the given alpha.
+    """
+    index = _np.arange(256)
+    on = index.clip(0, 1)
+    lut = _np.zeros((256, 4), dtype=_np.uint8)
+    if colormap == 'gray':
+        lut[:, 0] = index
+        lut[:, 1] = index
+        lut[:, 2] = index
+    elif colormap == 'red2yellow':
+        lut[:, 0] = 255 * on
+        lut[:, 1] = index
+    elif colormap == 'blue2cyanblue':
+        lut[:, 1] = index
+        lut[:, 2] = 255 * on
+    elif colormap == 'red':
+        lut[:, 0] = 255 * on
+    elif colormap == 'green':
+        lut[:, 1] = 255 * on
+    elif colormap == 'blue':
+        lut[:, 2] = 255 * on
+    else:
+        # matplotlib is only loaded for the colormaps it provides
+        if colormap in _pysurfer_cmaps:
+            from froi import colormap as surfer_cm
+            cmap = getattr(surfer_cm, colormap)
+        else:
+            from matplotlib import cm as mpl_cm
+            try:
+                # Try to get a named matplotlib colormap
+                cmap = mpl_cm.get_cmap(colormap)
+            except (TypeError, ValueError):
+                raise ValueError("There is no colormap about '{}'.".format(colormap))
+        # Convert from a matplotlib colormap to a lut array
+        lut[:, :3] = (cmap(_np.linspace(0, 1, 256)) * 255).astype(_np.int)[:, :3]
+    lut[:, 3] = alpha * on
+    return lut
+
+
+def _build_rainbow_lut(alpha):
+    """Build the rgba table of the 'rainbow' colormap.
+
+    The first half of the table is indexed by the data normalized to
+    0.._RAINBOW_NORM, the second half is used for data values no less than 1.
+    """
+    value = _np.arange(_RAINBOW_NORM + 1, dtype=_np.float)
+    rgb = _np.zeros((2, _RAINBOW_NORM + 1, 3), dtype=_np.int)
+    for channel, period in enumerate(_RAINBOW_RGB):
+        rgb[:, :, channel] = _normalize255(value % period, (0, period),
+                                           scale_length=254.0)
+    rgb[1] += 1
+    lut = _np.zeros((2, _RAINBOW_NORM + 1, 4), dtype=_np.uint8)
+    lut[..., :3] = rgb
+    lut[..., 3] = alpha * rgb.sum(axis=-1).clip(0, 1)
+    return lut
+
+
+def _build_label_lut(colors, alpha):
+    """Build a rgba table indexed by label value.
+
+    The last entry is transparent and used for values without a label.
+    """
+    values = _np.array([item[0] for item in colors], dtype=_np.int64)
+    rgb = _np.array([item[1] for item in colors], dtype=_np.int).reshape(-1, 3)
+    keep = (values >= 0) & (values < _LABEL_LUT_SIZE)
+    values, rgb = values[keep], rgb[keep]
+    size = values.max() + 2 if values.size else 1
+    lut = _np.zeros((size, 4), dtype=_np.uint8)
+    lut[values, :3] = rgb
+    # if r+g+b >= 1, assign alpha to the forth channel
+    lut[values, 3] = alpha * rgb.sum(axis=-1).clip(0, 1)
+    return lut
+
+
+def colormap_lut(colormap, alpha):
+    """Return the cached 256-entry rgba table of a continuous colormap."""
+    return _cached_lut((colormap, alpha),
+                       lambda: _build_colormap_lut(colormap, alpha))
+
+
+def label_lut(colormap, alpha):
+    """Return the cached rgba table of a label colormap ({value: rgb})."""
+    colors = tuple(sorted((int(value), tuple(rgb))
+                          for value, rgb in colormap.iteritems()))
+    return _cached_lut(('label', colors, alpha),
+                       lambda: _build_label_lut(colors, alpha))
+
+
+def _apply_label_lut(array, colormap, alpha):
+    """Map label values to rgba, values without a label are transparent."""
+    lut = label_lut(colormap, alpha)
+    n = lut.shape[0] - 1
+    index = array.astype(_np.int64)
+    invalid = (index < 0) | (index >= n)
+    if array.dtype.kind == 'f':
+        invalid |= (index != array)
+    index[invalid] = n
+    new_array = _gather(lut, index)
+
+    # label values out of the range of a direct table
+    big = [(value, rgb) for value, rgb in colormap.iteritems()
+           if int(value) >= _LABEL_LUT_SIZE]
+    for value, rgb in big:
+        mask = array == int(value)
+        new_array[mask, :3] = rgb
+        new_array[mask, 3] = alpha * min(sum(rgb), 1)
     return new_array
 
 
-def blue2cyanblue(array, alpha):
-    """Return a rgba array which color ranges from blue to cyanblue."""
+def data_range(array):
+    """Return the min and max of the array, NaN is ignored."""
+    vmin, vmax = float(_np.nanmin(array)), float(_np.nanmax(array))
+    if _np.isnan(vmin):
+        return 0.0, 0.0
+    return vmin, vmax
+
+
+def sample_values(array, size=QUANT_SAMPLE_SIZE):
+    """Return about size finite values of the array.
+
+    The values are read from evenly spaced slices along the last axis, so
+    only these slices of a memory-mapped array are read.
+    """
+    n = array.shape[-1] if array.ndim else 1
+    per_slice = max(array.size // max(n, 1), 1)
+    count = min(max(size // per_slice, 1), n)
+    index = _np.unique(_np.linspace(0, n - 1, count).round().astype(int))
+    sample = _np.asarray(array[..., index], dtype=_np.float64).ravel()
+    return sample[_np.isfinite(sample)]
+
+
+def quantize_range(array, vrange=None):
+    """Return the knots (values, levels) of the piecewise linear map of the
+    array values onto uint16 levels.
+
+    Integer data whose range fits into the levels is quantized exactly.
+    Other data is quantized over its whole range vrange: half of the levels
+    are spread evenly over the range, and half follow the quantiles of the
+    data, so that a few extreme values do not leave a few levels to the
+    values in a narrow display window.
+    """
+    if vrange is None:
+        vrange = data_range(array)
+    vmin, vmax = vrange
+    if vmax == vmin:
+        return _np.array([vmin, vmin + 1.0]), _np.array([0.0, 1.0])
+    if array.dtype.kind in 'iub' and vmax - vmin < NAN_LEVEL:
+        return _np.array([vmin, vmax]), _np.array([0.0, vmax - vmin])
+    sample = sample_values(array)
+    if sample.size:
+        quantiles = _np.percentile(sample, _np.linspace(0, 100,
+                                                        QUANT_QUANTILES + 1))
+    else:
+        quantiles = _np.array([])
+    values = _np.unique(_np.hstack([vmin, quantiles.clip(vmin, vmax), vmax]))
+    rank = _np.arange(values.size) / (values.size - 1.0)
+    levels = (0.5 * rank + 0.5 * (values - vmin) / (vmax - vmin)) * \
+             (NAN_LEVEL - 1)
+    return values, levels
+
+
+def quantize(array, qrange):
+    """Quantize the array into a uint16 index array of the same shape.
+
+    Values out of the knots are clipped to the end levels, NaN is mapped to
+    NAN_LEVEL.
+    """
+    values, levels = qrange
+    result = _np.empty(_np.shape(array), dtype=_np.uint16)
+    # quantize slice by slice to bound the size of float temporaries
+    for index in _np.ndindex(*result.shape[2:]):
+        key = (Ellipsis, ) + index
+        level = _np.rint(_np.interp(array[key], values, levels))
+        result[key] = _np.where(_np.isnan(level), NAN_LEVEL, level)
+    return result
+
+
+def window_lut(colormap, alpha, normalize, qrange):
+    """Return a rgba table which maps quantized levels to display colors.
+
+    Changing the display window or the alpha value only requires a new
+    table, the quantized data is left untouched. NAN_LEVEL is transparent.
+    """
+    values, levels = qrange
+    values = _np.interp(_np.arange(NAN_LEVEL), levels, values)
+    lut = _gather(colormap_lut(colormap, alpha), _lut_index(values, normalize))
+    return _np.vstack([lut, _np.zeros((1, 4), dtype=_np.uint8)])
+
+
+def apply_lut(lut, index):
+    """Map an index array to rgba values with the given table."""
+    return _gather(lut, index)
 
-    new_array_shape = array.shape + (4,)
-    new_array = _np.zeros(new_array_shape, dtype=_np.uint8)
-    new_array[..., 0] = 0
-    new_array[..., 1] = array
-    new_array[..., 2] = 255 * array.clip(0, 1)
-    new_array[..., 3] = alpha * array.clip(0, 1)
 
+def _lut_index(array, normalize):
+    """Convert the array into uint8 indices of a 256-entry table."""
+    return _normalize255(array, normalize).clip(0, 255).astype(_np.uint8)
+
+
+def _clip_window(array, normalize):
+    """Set values out of the display range (and negative values) to 0."""
+    if _np.isscalar(normalize):
+        new_array = array.clip(0, array.max())
+        new_array[array < 0] = 0
+        new_array[array > normalize] = 0
+    elif isinstance(normalize, tuple):
+        new_array = array.clip(0, array.max())
+        new_array[array < normalize[0]] = 0
+        new_array[array > normalize[1]] = 0
+    else:
+        new_array = array.clip(0, array.max())
+        new_array[array < 0] = 0
     return new_array
 
 
+def gray(array, alpha):
+    """Return a rgba array which color ranges from black to white."""
+    return _gather(colormap_lut('gray', alpha), _lut_index(array, False))
+
+
+def red2yellow(array, alpha):
+    """Return a rgba array which color ranges from red to yellow."""
+    return _gather(colormap_lut('red2yellow', alpha), _lut_index(array, False))
+
+
+def blue2cyanblue(array, alpha):
+    """Return a rgba array which color ranges from blue to cyanblue."""
+    return _gather(colormap_lut('blue2cyanblue', alpha), _lut_index(array, False))
+
+
 def red(array, alpha):
     """Return a whole red rgba array."""
-    new_array_shape = array.shape + (4,)
-    new_array = _np.zeros(new_array_shape, dtype=_np.uint8)
-    new_array[..., 0] = 255 * array.clip(0, 1)
-    new_array[..., 1] = 0
-    new_array[..., 2] = 0
-    new_array[..., 3] = alpha * array.clip(0, 1)
-    
-    return new_array
+    return _gather(colormap_lut('red', alpha), _lut_index(array, False))
 
 
 def green(array, alpha):
     """Return a whole green rgba array."""
-    new_array_shape = array.shape + (4,)
-    new_array = _np.zeros(new_array_shape, dtype=_np.uint8)
-    new_array[..., 0] = 0
-    new_array[..., 1] = 255 * array.clip(0, 1)
-    new_array[..., 2] = 0
-    new_array[..., 3] = alpha * array.clip(0, 1)
-
-    return new_array
+    return _gather(colormap_lut('green', alpha), _lut_index(array, False))
 
 
 def blue(array, alpha):
     """Return a whole blue rgba array."""
-    new_array_shape = array.shape + (4,)
-    new_array = _np.zeros(new_array_shape, dtype=_np.uint8)
-    new_array[..., 0] = 0
-    new_array[..., 1] = 0
-    new_array[..., 2] = 255 * array.clip(0, 1)
-    new_array[..., 3] = alpha * array.clip(0, 1)
-    
-    return new_array
+    return _gather(colormap_lut('blue', alpha), _lut_index(array, False))
 
 
 def single_roi(array, alpha, roi):
     """Return a single roi view array."""
     color = (70, 70, 70)
-    new_array_shape = array.shape + (4,)
-    new_array = _np.zeros(new_array_shape, dtype=_np.uint8)
     if roi is None or roi == 0:
-        return new_array
-    mask = array == roi
-    new_array[mask, 0] = color[0]
-    new_array[mask, 1] = color[1]
-    new_array[mask, 2] = color[2]
-    new_array[mask, 3] = alpha 
-    return new_array
+        return _np.zeros(array.shape + (4,), dtype=_np.uint8)
+    return _apply_label_lut(array, {roi: color}, alpha)
 
 
 def _normalize255(array, normalize, scale_length=255.0):
@@ -199,117 +407,77 @@ def alpha_view(qimage):
 
 
 def array2qrgba(array, alpha, colormap, normalize=False, roi=None):
-    """Convert a 2D-array into a 3D-array containing rgba value."""
+    """Convert a 2D-array into a 3D-array containing rgba value.
+
+    Every colormap is compiled once into a cached rgba lookup table, so the
+    conversion is a single gather whatever the colormap is.
+    """
     if _np.ndim(array) not in [1, 2]:
         raise ValueError("array2qrgb can only guarantee convert 1D or 2D array")
 
     if isinstance(colormap, str):
-        if colormap != 'rainbow':
-            if colormap != 'single ROI':
-                array = _normalize255(array, normalize)
-                pysurfer_cmaps = ['rocket', 'mako', 'icefire', 'vlag']
-                pysurfer_cmaps.extend([cmap+'_r' for cmap in pysurfer_cmaps])
-                if colormap == 'gray':
-                    new_array = gray(array, alpha)
-                elif colormap == 'red2yellow':
-                    new_array = red2yellow(array, alpha)
-                elif colormap == 'blue2cyanblue':
-                    new_array = blue2cyanblue(array, alpha)
-                elif colormap == 'red':
-                    new_array = red(array, alpha)
-                elif colormap == 'green':
-                    new_array = green(array, alpha)
-                elif colormap == 'blue':
-                    new_array = blue(array, alpha)
-                else:
-                    if colormap in pysurfer_cmaps:
-                        cmap = getattr(surfer_cm, colormap)
-                    else:
-                        try:
-                            # Try to get a named matplotlib colormap
-                            cmap = mpl_cm.get_cmap(colormap)
-                        except (TypeError, ValueError):
-                            raise ValueError("There is no colormap about '{}'.".format(colormap))
-                    # Convert from a matplotlib colormap to a lut array
-                    lut_255 = (cmap(_np.linspace(0, 1, 256)) * 255).astype(_np.int)
-
-                    new_array_shape = array.shape + (4,)
-                    new_array = _np.zeros(new_array_shape, dtype=_np.uint8)
-                    if array.ndim == 1:
-                        for i in range(array.shape[0]):
-                            new_array[i, :] = lut_255[array[i]]
-                    else:
-                        for i in range(array.shape[0]):
-                            for j in range(array.shape[1]):
-                                new_array[i, j, :] = lut_255[array[i, j]]
-                    new_array[..., 3] = alpha * array.clip(0, 1)
-
-            else:
-                new_array = single_roi(array, alpha, roi)
+        if colormap == 'single ROI':
+            new_array = single_roi(array, alpha, roi)
+        elif colormap == 'rainbow':
+            new_array = _clip_window(array, normalize)
+            index = _normalize255(new_array, normalize,
+                                  scale_length=_RAINBOW_NORM)
+            index = index.clip(0, _RAINBOW_NORM).astype(_np.int64)
+            # values no less than 1 use the second half of the table
+            index[new_array >= 1] += _RAINBOW_NORM + 1
+            lut = _cached_lut(('rainbow', alpha),
+                              lambda: _build_rainbow_lut(alpha))
+            new_array = _gather(lut, index)
         else:
-            if _np.isscalar(normalize):
-                new_array = array.clip(0, array.max())
-                new_array[array < 0] = 0
-                new_array[array > normalize] = 0
-            elif isinstance(normalize, tuple):
-                new_array = array.clip(0, array.max())
-                new_array[array < normalize[0]] = 0
-                new_array[array > normalize[1]] = 0
-            else:
-                new_array = array.clip(0, array.max())
-                new_array[array < 0] = 0
-            # h, w = new_array.shape
-            new_array2_shape = new_array.shape + (4,)
-            R, G, B = 41, 61, 83
-            fst_norm = 100000.0
-            new_array_raw = _normalize255(new_array,
-                                          normalize,
-                                          scale_length=fst_norm)
-            new_array_R = _normalize255(new_array_raw % R,
-                                        (0, R),
-                                        scale_length=254.0)
-            new_array_G = _normalize255(new_array_raw % G,
-                                        (0, G),
-                                        scale_length=254.0)
-            new_array_B = _normalize255(new_array_raw % B,
-                                        (0, B),
-                                        scale_length=254.0)
-            new_array2 = _np.zeros(new_array2_shape, dtype=_np.uint8)
-            add_ = new_array.clip(0, 1)
-            new_array2[..., 0] = new_array_R + add_
-            new_array2[..., 1] = new_array_G + add_
-            new_array2[..., 2] = new_array_B + add_
-            new_array2[..., 3] = alpha * _np.sum(new_array2, new_array2.ndim-1).clip(0, 1)
-            #_np.set_printoptions(threshold=1000000)
-            new_array = new_array2
+            new_array = _gather(colormap_lut(colormap, alpha),
+                                _lut_index(array, normalize))
     else:
-        if _np.isscalar(normalize):
-            new_array = array.clip(0, array.max())
-            new_array[array < 0] = 0
-            new_array[array > normalize] = 0
-        elif isinstance(normalize, tuple):
-            new_array = array.clip(0, array.max())
-            new_array[array < normalize[0]] = 0
-            new_array[array > normalize[1]] = 0
-        else:
-            new_array = array.clip(0, array.max())
-            new_array[array < 0] = 0
-        values = colormap.keys()
-        values = [int(item) for item in values]
-        new_array2_shape = new_array.shape + (4,)
-        new_array2 = _np.zeros(new_array2_shape, dtype=_np.uint8)
-        for item in values:
-            new_array2[new_array == item] = [colormap[item][0],
-                                             colormap[item][1],
-                                             colormap[item][2],
-                                             0]
-        # if r+g+b+alpha >= 1, assign alpha to the forth channel
-        new_array2[..., 3] = alpha * _np.sum(new_array2, new_array2.ndim-1).clip(0, 1)
-        new_array = new_array2
+        new_array = _apply_label_lut(_clip_window(array, normalize),
+                                     colormap, alpha)
 
     return new_array
 
 
+def blend_layers(dest, layers):
+    """Composite rgba layers over the rgb array dest in place.
+
+    Layers are blended from bottom to top with 16-bit integer arithmetic.
+    Fully transparent layers are skipped and layers covered by a fully
+    opaque one are never touched.
+
+    Parameters
+    ----------
+    dest : uint8 array of shape (..., 3)
+    layers : list of uint8 arrays of shape (..., 4)
+    """
+    start = 0
+    for index in range(len(layers) - 1, -1, -1):
+        if layers[index][..., 3].min() == 255:
+            dest[:] = layers[index][..., :3]
+            start = index + 1
+            break
+
+    acc = _np.empty(dest.shape, dtype=_np.uint16)
+    tmp = _np.empty(dest.shape, dtype=_np.uint16)
+    inv_alpha = _np.empty(dest.shape[:-1] + (1, ), dtype=_np.uint16)
+    for layer in layers[start:]:
+        alpha = layer[..., 3:]
+        if not alpha.any():
+            continue
+        # acc = source * alpha + dest * (255 - alpha), at most 255 * 255
+        _np.multiply(layer[..., :3], alpha, out=acc, dtype=_np.uint16)
+        _np.subtract(255, alpha, out=inv_alpha, dtype=_np.uint16)
+        _np.multiply(dest, inv_alpha, out=tmp, dtype=_np.uint16)
+        acc += tmp
+        # exact acc // 255 for acc <= 65025
+        _np.right_shift(acc, 8, out=tmp)
+        acc += tmp
+        acc += 1
+        acc >>= 8
+        dest[:] = acc
+    return dest
+
+
 def qcomposition(array_list):
     """Composite several qrgba arrays into one."""
     if not len(array_list):
@@ -319,25 +487,8 @@ def qcomposition(array_list):
     if dimension not in (2, 3):
         raise ValueError('RGBA array must be 2D or 3D.')
 
-    result = _np.array(array_list[0][..., :3], dtype=_np.int64)
-    if dimension == 3:
-        h, w, channel = array_list[0].shape
-        for index in range(1, len(array_list)):
-            item = _np.array(array_list[index], dtype=_np.int64)
-            alpha_array = _np.tile(item[..., -1].reshape((-1, 1)), (1, 1, 3))
-            alpha_array = alpha_array.reshape((h, w, 3))
-            result = item[..., :3] * alpha_array + result * (255 - alpha_array)
-            result /= 255
-    elif dimension == 2:
-        for i in range(1, len(array_list)):
-            item = array_list[i].astype(_np.int64)
-            alpha_channel = item[:, -1]
-            alpha_channels = _np.tile(alpha_channel, (3, 1)).T
-            result = item[:, :3] * alpha_channels + result * (255 - alpha_channels)
-            result /= 255
-    result = result.astype(_np.uint8)
-
-    return result
+    result = _np.array(array_list[0][..., :3], dtype=_np.uint8)
+    return blend_layers(result, array_list[1:])
 
 
 def composition(dest, source):
@@ -347,11 +498,7 @@ def composition(dest, source):
     ----
     The dest is a rgb image, while the source is a rgba image
     """
-    alpha = source[...,3].reshape(source.shape[0], source.shape[1], 1).astype(_np.float)
-    alpha /= 255
-    source_rgb = source[...,:3].astype(_np.float)
-    dest[:] = _np.uint8(source_rgb * alpha + dest.astype(_np.float) * (1 - alpha))
-    return dest
+    return blend_layers(dest, [source])
 
 
 def qrgba2qimage(array):
@@ -368,6 +515,22 @@ def qrgba2qimage(array):
     return result
 
 
+def blank_qimage(h, w):
+    """Return an opaque black image which can be used as a buffer."""
+    result = _qt.QImage(w, h, _qt.QImage.Format_ARGB32)
+    rgb_view(result)[:] = 0
+    alpha_view(result)[:] = 255
+    return result
+
+
+def blend2qimage(qimage, layers):
+    """Composite rgba layers over a black background into the image."""
+    rgb = rgb_view(qimage)
+    rgb[:] = 0
+    blend_layers(rgb, layers)
+    return qimage
+
+
 def null_image(h, w):
     """Return a whole black rgba array."""
     new_array = _np.zeros((h, w, 4), dtype=_np.uint8)
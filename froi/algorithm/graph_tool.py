@@ -1,10 +1,7 @@
 import numpy as np
-from networkx import to_scipy_sparse_matrix
-from scipy.sparse import dia_matrix, linalg
 
-# FIXME uncouple the module from skimage's furture module
-from skimage.future.graph import _ncut_cy
-from skimage.future.graph.graph_cut import partition_by_cut, get_min_ncut, cut_normalized
+# networkx, scipy.sparse and skimage are imported in the functions which
+# use them, so importing the module stays cheap.
 
 
 # ---------------------------get information from graph-----------------------------------
@@ -26,6 +23,9 @@ def DW_matrices(graph):
         The weight matrix of the graph. ``W[i, j]`` is the weight of the edge
         joining `i` to `j`.
     """
+    from networkx import to_scipy_sparse_matrix
+    from scipy.sparse import dia_matrix
+
     # sparse.eighsh is most efficient with CSC-formatted input
     W = to_scipy_sparse_matrix(graph, format='csc')
     entries = W.sum(axis=0)
@@ -71,6 +71,11 @@ def two_ncut(graph, num_cuts):
     (nx.Graph, None) : the first element is the graph itself
         This means the graph can't be further sub-divided.
     """
+    from scipy.sparse import linalg
+    # FIXME uncouple the module from skimage's furture module
+    from skimage.future.graph import _ncut_cy
+    from skimage.future.graph.graph_cut import partition_by_cut, get_min_ncut
+
     d, w = DW_matrices(graph)
     m = w.shape[0]
 
@@ -200,6 +205,8 @@ def graph_ncut_thr(graph, thresh=0.001, num_cuts=10, in_place=True, max_edge=1.0
     out: nx.Graph
         The new labeled Graph.
     """
+    from skimage.future.graph.graph_cut import cut_normalized
+
     if not in_place:
         graph = graph.copy()
 
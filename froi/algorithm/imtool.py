@@ -3,8 +3,6 @@
 
 import numpy as np
 from scipy import ndimage as nd
-from skimage import feature as skft
-from scipy.spatial import distance
 from nibabel.affines import apply_affine
 
 def mesh_3d_grid(x, y, z):
@@ -41,6 +39,8 @@ def opening(src, r=2):
 
 def local_maximum(data, dist=1):
     """Generate the local maxinum value in image."""
+    from skimage import feature as skft
+
     lmax = np.zeros(data.shape)
     p = skft.peak_local_max(data, dist).T
     p = (np.array(p[0]), np.array(p[1]), np.array(p[2]))
@@ -137,7 +137,6 @@ def intersect(source, mask):
     # binary mask data
     mask[mask > 0] = 1
     temp = source * mask
-    temp = np.rot90(temp, 3)
     return temp
 
 def merge(a, b):
@@ -151,6 +150,8 @@ def merge(a, b):
 
 def nearest_labeling(src, tar):
     """For each temp voxel assigns the value of it's closest seed voxel."""
+    from scipy.spatial import distance
+
     srcn = src.nonzero()
     tarn = tar.nonzero()
     srcn_coord = np.column_stack((srcn[0], srcn[1], srcn[2]))
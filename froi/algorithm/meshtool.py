@@ -3,10 +3,10 @@
 
 import os
 import subprocess
+import functools
+from unittest import SkipTest
+
 import numpy as np
-from scipy import sparse
-from scipy.spatial.distance import cdist, pdist
-from scipy.stats import pearsonr
 
 
 def _fast_cross_3d(x, y):
@@ -99,6 +99,8 @@ def find_closest_vertices(surface_coords, point_coords):
         Array of mesh vertex ids
 
     """
+    from scipy.spatial.distance import cdist
+
     point_coords = np.atleast_2d(point_coords)
     return np.argmin(cdist(surface_coords, point_coords), axis=0)
 
@@ -140,6 +142,8 @@ def mesh_edges(faces):
     edges : sparse matrix
         The adjacency matrix
     """
+    from scipy import sparse
+
     npoints = np.max(faces) + 1
     nfaces = len(faces)
     a, b, c = faces.T
@@ -360,8 +364,23 @@ def has_fsaverage(subjects_dir=None):
         return False
     return True
 
-requires_fsaverage = np.testing.dec.skipif(not has_fsaverage(),
-                                           'Requires fsaverage subject data')
+
+def _requires(condition, msg):
+    """Return a test decorator which skips the test if condition() is
+    False.
+
+    The condition is checked when the test runs rather than at import.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not condition():
+                raise SkipTest(msg)
+            return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+requires_fsaverage = _requires(has_fsaverage, 'Requires fsaverage subject data')
 
 
 # ---  check ffmpeg
@@ -389,7 +408,7 @@ def assert_ffmpeg_is_available():
                "downlaoded from http://ffmpeg.org/download.html.")
         raise RuntimeError(err)
 
-requires_ffmpeg = np.testing.dec.skipif(not has_ffmpeg(), 'Requires FFmpeg')
+requires_ffmpeg = _requires(has_ffmpeg, 'Requires FFmpeg')
 
 
 def ffmpeg(dst, frame_path, framerate=24, codec='mpeg4', bitrate='1M'):
@@ -641,6 +660,9 @@ def mesh2edge_list(faces, n=1, ordinal=False, vtx_signal=None,
         edge data of the edges-zip(row_ind, col_ind)
     """
 
+    from scipy.spatial.distance import pdist
+    from scipy.stats import pearsonr
+
     n_ring_neighbors = get_n_ring_neighbor(faces, n, ordinal)
 
     row_ind = [i for i, neighbors in enumerate(n_ring_neighbors) for v_id in neighbors]
@@ -704,6 +726,8 @@ def mesh2adjacent_matrix(faces, n=1, ordinal=False, vtx_signal=None,
     adjacent_matrix : coo matrix
     """
 
+    from scipy import sparse
+
     n_vtx = np.max(faces) + 1
     row_ind, col_ind, edge_data = mesh2edge_list(faces, n, ordinal, vtx_signal,
                                                  weight_type, weight_normalization)
@@ -1,7 +1,11 @@
 # emacs: -*- mode: python; py-indent-offset: 4; indent-tabs-mode: nil -*-
 # vi: set ft=python sts=4 ts=4 sw=4 et:
+import array
+import heapq
+import itertools
+
 import numpy as np
-from scipy.spatial.distance import cdist, pdist
+from scipy.spatial.distance import cdist
 
 from ..core.dataobject import GeometryData
 from meshtool import mesh2graph, get_n_ring_neighbor
@@ -9,17 +13,117 @@ from graph_tool import graph2parcel
 from tools import slide_win_smooth
 
 
-def region_growing(image,coordinate,number):
-    """Give coordinate and size,return a region."""
-    # tmp_image store marks and rg_image store new image after region grow
-    nt = number
-    tmp_image = np.zeros_like(image)
-    rg_image = np.zeros_like(image)
-    image_shape = image.shape
+def neighbor_offsets(connectivity=6):
+    """Return the offsets of the 6, 18 or 26 neighbors of a voxel."""
+    rank = {6: 1, 18: 2, 26: 3}.get(connectivity)
+    if rank is None:
+        raise ValueError("The connectivity must be 6, 18 or 26!")
+    return [offset for offset in itertools.product((-1, 0, 1), repeat=3)
+            if 0 < np.abs(offset).sum() <= rank]
 
-    x = coordinate[0]
-    y = coordinate[1]
-    z = coordinate[2]
+
+class _Frontier(object):
+    """Voxels adjacent to a region, ordered by the distance between their
+    values and the mean of the region.
+
+    Values below and above the mean are kept in a max-heap and a min-heap,
+    so the nearest voxel is on top of one of them. When the mean drifts, a
+    voxel is moved to the other heap only once the mean has crossed its
+    value, which keeps the keys up to date lazily. Ties are broken by the
+    voxel index.
+    """
+
+    def __init__(self):
+        # (-value, voxel) and (value, voxel)
+        self._lower = []
+        self._upper = []
+
+    def __len__(self):
+        return len(self._lower) + len(self._upper)
+
+    def extend(self, items, mean):
+        """Add (value, voxel) items."""
+        lower, upper = self._lower, self._upper
+        heappush = heapq.heappush
+        for value, voxel in items:
+            if value < mean:
+                heappush(lower, (-value, voxel))
+            else:
+                heappush(upper, (value, voxel))
+
+    def _nearest(self, mean):
+        """Return the heap whose top is the nearest to the mean."""
+        lower, upper = self._lower, self._upper
+        while upper and upper[0][0] < mean:
+            value, voxel = heapq.heappop(upper)
+            heapq.heappush(lower, (-value, voxel))
+        while lower and -lower[0][0] >= mean:
+            value, voxel = heapq.heappop(lower)
+            heapq.heappush(upper, (-value, voxel))
+        if upper and (not lower or upper[0][0] - mean <= mean + lower[0][0]):
+            return upper
+        if lower:
+            return lower
+        return None
+
+    def peek(self, mean):
+        """Return (value, voxel) of the voxel nearest to the mean."""
+        heap = self._nearest(mean)
+        if heap is None:
+            return None
+        value, voxel = heap[0]
+        if heap is self._lower:
+            value = -value
+        return value, voxel
+
+    def pop(self, mean):
+        """Remove the voxel nearest to the mean, return (value, voxel)."""
+        heap = self._nearest(mean)
+        if heap is None:
+            return None
+        value, voxel = heapq.heappop(heap)
+        if heap is self._lower:
+            value = -value
+        return value, voxel
+
+
+def _pad_image(image, connectivity):
+    """Pad the image by one voxel, so the neighbors of each voxel are
+    visited by flat index without bounds checks. Return the padded image
+    and the flat offsets of the neighbors."""
+    padded = np.pad(np.asarray(image), 1, mode='constant')
+    strides = (padded.shape[1] * padded.shape[2], padded.shape[2], 1)
+    offsets = [int(np.dot(offset, strides))
+               for offset in neighbor_offsets(connectivity)]
+    return padded, offsets
+
+
+def region_growing(image, coordinate, number, connectivity=6):
+    """Give coordinate and size,return a region.
+
+    Starting from the seed, the neighbor whose value is the nearest to the
+    mean of the region is added, until the region has `number` voxels or
+    has no neighbor left.
+
+    Parameters
+    ----------
+    image : numpy array
+        3D image.
+    coordinate : tuple
+        Coordinate of the seed.
+    number : integer
+        The number of voxels in the region.
+    connectivity : integer
+        6, 18 or 26, the neighbors of a voxel.
+
+    Returns
+    -------
+    rg_image : numpy array
+        The image values in the region, zeros elsewhere.
+    """
+    image = np.asarray(image)
+    image_shape = image.shape
+    x, y, z = coordinate
 
     # ensure the coordinate is in the image
     inside = (x >= 0) and (x < image_shape[0]) and (y >= 0) and \
@@ -28,94 +132,153 @@ def region_growing(image,coordinate,number):
         print "The coordinate is out of the image range."
         return False
 
-    # initialize region_mean and region_size
-    region_mean = image[x, y, z]
-    region_size = 0
-
-    # initialize neighbor_list with 10000 rows 4 columns
-    neighbor_free = 10000
-    neighbor_pos = -1
-    neighbor_list = np.zeros((neighbor_free, 4))
-
-    # 26 direct neighbor points
-    neighbors  = [[1,0,0], \
-                  [-1,0,0], \
-                  [0,1,0], \
-                  [0,-1,0], \
-                  [0,0,-1], \
-                  [0,0,1], \
-                  [1,1,0], \
-                  [1,1,1], \
-                  [1,1,-1], \
-                  [0,1,1], \
-                  [-1,1,1], \
-                  [1,0,1], \
-                  [1,-1,1], \
-                  [-1,-1,0], \
-                  [-1,-1,-1], \
-                  [-1,-1,1], \
-                  [0,-1,-1], \
-                  [1,-1,-1], \
-                  [-1,0,-1], \
-                  [-1,1,-1], \
-                  [0,1,-1], \
-                  [0,-1,1], \
-                  [1,0,-1], \
-                  [1,-1,0], \
-                  [-1,0,1], \
-                  [-1,1,0]]
-
-    while region_size < nt:
-        # (xn, yn, zn) store direct neighbor of seed point
-        for i in range(6):
-            xn = x + neighbors[i][0]
-            yn = y + neighbors[i][1]
-            zn = z + neighbors[i][2]
-
-            # ensure the coordinate is in the image
-            inside = (xn >= 0) and (xn < image_shape[0]) and (yn >= 0) and \
-                     (yn < image_shape[1]) and (zn >= 0) and (zn < image_shape[2])
-
-            # ensure the original flag 0 is not changed
-            if inside and tmp_image[xn, yn, zn]==0:
-                # add this point to neighbor_list and mark it with 1
-                neighbor_pos = neighbor_pos + 1
-                neighbor_list[neighbor_pos] = [xn, yn, zn, image[xn, yn, zn]]
-                tmp_image[xn, yn, zn] = 1
-
-        # ensure there is enough space to store neighbor_list
-        if (neighbor_pos+100 > neighbor_free):
-            neighbor_free += 10000
-            new_list = np.zeros((10000, 4))
-            neighbor_list = np.vstack((neighbor_list, new_list))
-
-        # the distance between every neighbor point value to new region mean value
-        distance = np.abs(neighbor_list[:neighbor_pos+1, 3] - np.tile(region_mean, neighbor_pos+1))
-
-        # chose the min distance point
-        #voxel_distance = distance.min()
-        index = distance.argmin()
-
-        # mark the new region point with 2 and update new image
-        tmp_image[x, y, z] = 2
-        rg_image[x, y, z] = image[x, y, z]
-        region_size += 1
-
-        # (x, y, z) the new seed point
-        x = neighbor_list[index][0]
-        y = neighbor_list[index][1]
-        z = neighbor_list[index][2]
-
-        # update region mean value
-        region_mean = (region_mean*region_size+neighbor_list[index, 3])/(region_size+1)
-
-        # remove the seed point from neighbor_list
-        neighbor_list[index] = neighbor_list[neighbor_pos]
-        neighbor_pos -= 1
-
+    padded, offsets = _pad_image(image, connectivity)
+    value_at = padded.item
+    # voxels on the border are never queued
+    queued = np.ones(padded.shape, dtype=np.uint8)
+    queued[1:-1, 1:-1, 1:-1] = 0
+    queued = bytearray(queued.tostring())
+
+    # voxels are flat indexes in the padded image
+    p = int(np.ravel_multi_index((x + 1, y + 1, z + 1), padded.shape))
+    queued[p] = 1
+    region = [p]
+    total = float(value_at(p))
+    frontier = _Frontier()
+    while True:
+        mean = total / len(region)
+        items = []
+        for offset in offsets:
+            q = p + offset
+            if not queued[q]:
+                queued[q] = 1
+                items.append((value_at(q), q))
+        frontier.extend(items, mean)
+        if len(region) >= number or not len(frontier):
+            break
+        value, p = frontier.pop(mean)
+        region.append(p)
+        total += value
+
+    coords = np.unravel_index(region, padded.shape)
+    coords = tuple(c - 1 for c in coords)
+    rg_image = np.zeros_like(image)
+    rg_image[coords] = image[coords]
     return rg_image
 
 
+def seeded_region_growing(image, seeds, stop_size, connectivity=6):
+    """Grow several seed regions at once, return a label volume.
+
+    All regions compete in one priority queue: at each step the region
+    whose nearest neighbor is the closest to its own mean takes that
+    voxel, so no voxel is assigned twice. A region stops growing when it
+    reaches its stop size or has no free neighbor left.
+
+    Parameters
+    ----------
+    image : numpy array
+        3D image.
+    seeds : numpy array
+        3D label volume, voxels of each nonzero label initialize a region.
+    stop_size : integer or list
+        The number of voxels of each region, in the order of the sorted
+        labels, or one value for all regions.
+    connectivity : integer
+        6, 18 or 26, the neighbors of a voxel.
+
+    Returns
+    -------
+    rg_labels : numpy array
+        The label of the region each voxel belongs to, zeros elsewhere.
+    """
+    image = np.asarray(image)
+    seeds = np.asarray(seeds)
+    if seeds.shape != image.shape:
+        raise ValueError("The seeds must have the same shape as the image!")
+    labels = np.unique(seeds[seeds != 0])
+    n_seed = len(labels)
+    stop_size = np.atleast_1d(stop_size)
+    if len(stop_size) == 1:
+        stop_size = np.repeat(stop_size, n_seed)
+    elif len(stop_size) != n_seed:
+        raise ValueError("One stop size per seed label is required!")
+
+    padded, offsets = _pad_image(image, connectivity)
+    value_at = padded.item
+
+    # owner is the region index plus 1 of each voxel, -1 on the border;
+    # queued is the last region index plus 1 which queued the voxel
+    owner = np.pad(np.searchsorted(labels, seeds).astype(np.int32) + 1, 1,
+                   mode='constant', constant_values=-1)
+    owner[1:-1, 1:-1, 1:-1][seeds == 0] = 0
+    owner = array.array('i', owner.tostring())
+    queued = array.array('i', [0]) * len(owner)
+
+    frontiers = [_Frontier() for i in range(n_seed)]
+    totals = np.zeros(n_seed)
+    sizes = np.zeros(n_seed, dtype=np.int)
+    voxels = np.ravel_multi_index(np.nonzero(np.pad(seeds, 1, 'constant')),
+                                  padded.shape)
+    for p in voxels.tolist():
+        k = owner[p] - 1
+        totals[k] += value_at(p)
+        sizes[k] += 1
+    totals, sizes = totals.tolist(), sizes.tolist()
+    stop_size = stop_size.tolist()
+
+    def queue_neighbors(p, k):
+        items = []
+        for offset in offsets:
+            q = p + offset
+            if owner[q] == 0 and queued[q] != k + 1:
+                queued[q] = k + 1
+                items.append((value_at(q), q))
+        frontiers[k].extend(items, totals[k] / sizes[k])
+
+    def schedule(k):
+        """Queue the nearest free neighbor of region k."""
+        if sizes[k] >= stop_size[k]:
+            return
+        mean = totals[k] / sizes[k]
+        frontier = frontiers[k]
+        candidate = frontier.peek(mean)
+        # drop voxels taken by other regions
+        while candidate is not None and owner[candidate[1]]:
+            frontier.pop(mean)
+            candidate = frontier.peek(mean)
+        if candidate is not None:
+            heapq.heappush(queue, (abs(candidate[0] - mean), k))
+
+    for p in voxels.tolist():
+        queue_neighbors(p, owner[p] - 1)
+    queue = []
+    for k in range(n_seed):
+        schedule(k)
+
+    # the distance of a queued region only grows when its candidate is
+    # taken by another region, so such entries are scheduled again lazily
+    while queue:
+        dist, k = heapq.heappop(queue)
+        value, p = frontiers[k].peek(totals[k] / sizes[k])
+        if owner[p]:
+            schedule(k)
+            continue
+        frontiers[k].pop(totals[k] / sizes[k])
+        owner[p] = k + 1
+        totals[k] += value
+        sizes[k] += 1
+        queue_neighbors(p, k)
+        schedule(k)
+
+    owner = np.frombuffer(owner, dtype=np.int32).reshape(padded.shape)
+    owner = owner[1:-1, 1:-1, 1:-1]
+    rg_labels = np.zeros(image.shape, dtype=seeds.dtype)
+    region = owner > 0
+    rg_labels[region] = labels[owner[region] - 1]
+    return rg_labels
+
+
 # --------------new architecture-------------------
 class Region(object):
     """
@@ -314,13 +477,681 @@ class EvolvingRegion(Region):
             self.neighbors.append(region)
 
 
+class RegionGraph(object):
+    """
+    An array-backed adjacency graph of the preliminary regions of a surface.
+
+    Attributes
+    ----------
+    signal : numpy array
+        NxM array, the signals of the vertices.
+    v_id2r_id : numpy array
+        The region of each vertex, -1 for vertices out of the mask.
+    n_regions : integer
+        The number of regions.
+    indptr, indices : numpy array
+        The neighbors of region r are indices[indptr[r]:indptr[r+1]],
+        in the order they were given.
+    vtx_indptr, vtx_indices : numpy array
+        The vertices of region r are vtx_indices[vtx_indptr[r]:vtx_indptr[r+1]].
+    sums : numpy array
+        The sum of the vertex signals of each region.
+    counts : numpy array
+        The number of vertices of each region.
+    """
+
+    def __init__(self, vtx_signal, v_id2r_id, region_neighbors):
+        """
+        Parameters
+        ----------
+        vtx_signal : numpy array
+            NxM array, N is the number of vertices,
+            M is the number of measurements or time points.
+        v_id2r_id : numpy array
+            The region of each vertex, -1 for vertices out of the mask.
+        region_neighbors : list
+            The neighbor regions of each region.
+        """
+        self.signal = np.asarray(vtx_signal, dtype=np.float64)
+        if self.signal.ndim == 1:
+            self.signal = self.signal[:, None]
+        self.v_id2r_id = np.asarray(v_id2r_id)
+        self.n_regions = int(np.max(self.v_id2r_id)) + 1
+
+        # adjacency
+        region_neighbors = [np.fromiter(neighbors, dtype=np.int)
+                            for neighbors in region_neighbors[:self.n_regions]]
+        lengths = [len(neighbors) for neighbors in region_neighbors]
+        self.indptr = np.concatenate(([0], np.cumsum(lengths))).astype(np.int)
+        if region_neighbors:
+            self.indices = np.concatenate(region_neighbors).astype(np.int)
+        else:
+            self.indices = np.zeros(0, dtype=np.int)
+
+        # membership and signal sums
+        v_ids = np.nonzero(self.v_id2r_id != -1)[0]
+        r_ids = self.v_id2r_id[v_ids]
+        order = np.argsort(r_ids, kind='mergesort')
+        self.vtx_indices = v_ids[order]
+        self.counts = np.bincount(r_ids, minlength=self.n_regions)
+        self.vtx_indptr = np.concatenate(([0], np.cumsum(self.counts)))
+        self.sums = np.zeros((self.n_regions, self.signal.shape[1]))
+        for col in range(self.signal.shape[1]):
+            self.sums[:, col] = np.bincount(r_ids, self.signal[v_ids, col],
+                                            minlength=self.n_regions)
+        self._reverse = None
+        self._ranks = None
+
+    def neighbors(self, r_id):
+        """Return the neighbor regions of a region."""
+        return self.indices[self.indptr[r_id]:self.indptr[r_id+1]]
+
+    def reverse_neighbors(self, r_id):
+        """Return the regions which have the region as neighbor."""
+        if self._reverse is None:
+            order = np.argsort(self.indices, kind='mergesort')
+            sources = np.repeat(np.arange(self.n_regions), np.diff(self.indptr))
+            counts = np.bincount(self.indices, minlength=self.n_regions)
+            self._reverse = (np.concatenate(([0], np.cumsum(counts))),
+                             sources[order])
+        indptr, indices = self._reverse
+        return indices[indptr[r_id]:indptr[r_id+1]]
+
+    def value_ranks(self):
+        """
+        Return the ranks used to sum the scalar signals of the vertices.
+
+        Returns
+        -------
+        sorted_values : numpy array
+            The signals of the vertices in the mask, sorted.
+        ranks : numpy array
+            The rank of each vertex, in the order of vtx_indices.
+        """
+        if self._ranks is None:
+            values = self.signal[self.vtx_indices, 0]
+            order = np.argsort(values, kind='mergesort')
+            ranks = np.empty(len(values), dtype=np.int)
+            ranks[order] = np.arange(len(values))
+            self._ranks = (values[order], ranks)
+        return self._ranks
+
+    def neighbors_of(self, r_ids):
+        """
+        Return the neighbor regions of several regions.
+
+        Returns
+        -------
+        sources : numpy array
+            The region of each neighbor.
+        neighbors : numpy array
+            The neighbors, in the order of r_ids.
+        """
+        r_ids = np.asarray(r_ids, dtype=np.int)
+        return self._gather(self.indptr, self.indices, r_ids)
+
+    def vertices_of(self, r_ids):
+        """Return the vertices of several regions."""
+        r_ids = np.asarray(r_ids, dtype=np.int)
+        return self._gather(self.vtx_indptr, self.vtx_indices, r_ids)[1]
+
+    @staticmethod
+    def _gather(indptr, indices, r_ids):
+        """Concatenate CSR rows, return the row of each element and the
+        elements."""
+        starts = indptr[r_ids]
+        lengths = indptr[r_ids+1] - starts
+        sources = np.repeat(r_ids, lengths)
+        offsets = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) -
+                                                       lengths, lengths)
+        return sources, indices[np.repeat(starts, lengths) + offsets]
+
+    def mean_signal(self, r_ids=None):
+        """Return the mean signals of the regions, all regions by default."""
+        if r_ids is None:
+            return self.sums / self.counts[:, None]
+        return self.sums[r_ids] / self.counts[r_ids, None]
+
+
+class GraphRegion(object):
+    """
+    A region made of merged nodes of a RegionGraph. It has the reading
+    interface of EvolvingRegion.
+
+    Attributes
+    ----------
+    graph : RegionGraph
+    component : list
+        The merged nodes, in merge order.
+    seeds : list
+        the seed vertices' numbers
+    """
+
+    def __init__(self, graph, component, seeds=None, neighbors=None):
+        self.graph = graph
+        self.component = list(component)
+        self.seeds = seeds
+        self._neighbors = neighbors
+
+    def size(self):
+        return int(self.graph.counts[self.component].sum())
+
+    def mean_signal(self):
+        return self.graph.sums[self.component].sum(0) / self.size()
+
+    def get_seeds(self):
+        return self.seeds
+
+    def get_component(self):
+        """Return the merged nodes as regions, in merge order."""
+        return [GraphRegion(self.graph, [r_id]) for r_id in self.component]
+
+    def get_vertices(self):
+        return self.graph.vertices_of(self.component).tolist()
+
+    def get_vtx_signal(self):
+        vertices = self.graph.vertices_of(self.component)
+        return dict(zip(vertices.tolist(), self.graph.signal[vertices]))
+
+    @property
+    def vtx_signal(self):
+        return self.get_vtx_signal()
+
+    def neighbor_nodes(self):
+        """Return the neighbor nodes, in the order they were reached."""
+        if self._neighbors is None:
+            neighbors = self.graph.neighbors_of(self.component)[1]
+            neighbors = neighbors[~np.in1d(neighbors, self.component)]
+            self._neighbors = _unique_in_order(neighbors)
+        return self._neighbors
+
+    def get_neighbors(self):
+        return [GraphRegion(self.graph, [r_id])
+                for r_id in self.neighbor_nodes()]
+
+    # statistics used by the assessments
+    # -------------------------------------------
+    def neighbor_mean_signal(self):
+        """Return the mean of the neighbor nodes' mean signals."""
+        return np.mean(self.graph.mean_signal(self.neighbor_nodes()), 0)
+
+    def transition_level(self):
+        """
+        Return the mean distance between the mean signals of the couples of
+        a neighbor node and a merged node which is its neighbor.
+        """
+        graph = self.graph
+        outer, inner = graph.neighbors_of(self.neighbor_nodes())
+        in_region = np.in1d(inner, self.component)
+        outer, inner = outer[in_region], inner[in_region]
+        couples_dist = np.sqrt(np.sum((graph.mean_signal(inner) -
+                                       graph.mean_signal(outer)) ** 2, 1))
+        return np.mean(couples_dist)
+
+    def within_dist(self, complement=False):
+        """
+        Return the sum of the distances between the vertices' signals and
+        their mean signal, and the number of vertices.
+
+        Parameters
+        ----------
+        complement : bool
+            If true, use the vertices in the mask out of the region.
+        """
+        graph = self.graph
+        if complement:
+            r_c = np.ones(graph.n_regions, dtype=np.bool)
+            r_c[self.component] = False
+            vertices = graph.vertices_of(np.nonzero(r_c)[0])
+        else:
+            vertices = graph.vertices_of(self.component)
+        if not len(vertices):
+            return np.float64(0), 0
+        vtx_signal = graph.signal[vertices]
+        mean_signal = np.atleast_2d(np.mean(vtx_signal, 0))
+        return np.sum(cdist(vtx_signal, mean_signal)), len(vertices)
+
+    def region2text(self, file_name):
+        """
+        save region into text
+        """
+        X = np.array(self.get_vertices())
+        header = str("the number of vertex: " + str(self.size()))
+        np.savetxt(file_name, X, fmt='%d', header=header, comments="# ascii, label vertexes\n")
+
+
+def _unique_in_order(values):
+    """Remove duplicated values, keep the first occurrences in order."""
+    values = np.asarray(values, dtype=np.int)
+    index = np.unique(values, return_index=True)[1]
+    return values[np.sort(index)]
+
+
+class _NodeFrontier(object):
+    """The neighbor nodes of an evolving region with their mean signals,
+    in the order they were added.
+
+    Removed nodes stay in the arrays with infinite signals, so the minimal
+    signal is not changed, until they take a quarter of the arrays.
+    """
+
+    def __init__(self, graph):
+        self._means = graph.mean_signal()
+        self._nodes = np.zeros(64, dtype=np.int)
+        self._signals = np.zeros((64, self._means.shape[1]))
+        self._alive = np.zeros(64, dtype=np.bool)
+        self._size = 0
+        self._dead = []
+        self._position = -np.ones(graph.n_regions, dtype=np.int)
+        self._signal_sum = np.zeros(self._means.shape[1])
+
+    def __len__(self):
+        return self._size - len(self._dead)
+
+    def add(self, nodes):
+        """Append the nodes which are not in the frontier yet, return the
+        appended nodes."""
+        nodes = _unique_in_order(nodes)
+        nodes = nodes[self._position[nodes] == -1]
+        if not len(nodes):
+            return nodes
+        start, stop = self._size, self._size + len(nodes)
+        if stop > len(self._nodes):
+            capacity = max(stop, 2 * len(self._nodes))
+            self._nodes = np.resize(self._nodes, capacity)
+            self._signals = np.resize(self._signals,
+                                      (capacity, self._signals.shape[1]))
+            self._alive = np.resize(self._alive, capacity)
+        self._nodes[start:stop] = nodes
+        self._signals[start:stop] = self._means[nodes]
+        self._alive[start:stop] = True
+        self._position[nodes] = np.arange(start, stop)
+        self._size = stop
+        self._signal_sum += self._signals[start:stop].sum(0)
+        return nodes
+
+    def remove(self, node):
+        """Remove a node, return True if it was in the frontier."""
+        position = self._position[node]
+        if position == -1:
+            return False
+        self._alive[position] = False
+        self._signal_sum -= self._signals[position]
+        self._signals[position] = np.inf
+        self._position[node] = -1
+        self._dead.append(position)
+        if 4 * len(self._dead) > self._size:
+            self._compact()
+        return True
+
+    def _compact(self):
+        alive = self._alive[:self._size]
+        n = len(self)
+        self._nodes[:n] = self._nodes[:self._size][alive]
+        self._signals[:n] = self._signals[:self._size][alive]
+        self._alive[:n] = True
+        self._size = n
+        self._dead = []
+        self._position[self._nodes[:n]] = np.arange(n)
+
+    def contains(self, nodes):
+        """Return whether each node is in the frontier."""
+        return self._position[nodes] != -1
+
+    def nodes(self):
+        """Return the nodes in the order they were added."""
+        return self._nodes[:self._size][self._alive[:self._size]]
+
+    def signal_sum(self):
+        """Return the sum of the nodes' mean signals."""
+        return self._signal_sum
+
+    def signals(self):
+        """Return the nodes, their mean signals and the positions of the
+        removed nodes, without copies."""
+        return self._nodes[:self._size], self._signals[:self._size], self._dead
+
+
+class _RankSums(object):
+    """
+    Counts and sums of a subset of the scalar vertex signals, kept in
+    Fenwick trees indexed by the ranks of the signals. The sum of absolute
+    deviations from any value, of the subset or of its complement, is
+    computed in O(log n).
+    """
+
+    def __init__(self, graph):
+        self._sorted, self._ranks = graph.value_ranks()
+        self._cumsum = np.concatenate(([0], np.cumsum(self._sorted)))
+        self._count = array.array('l', [0]) * (len(self._sorted) + 1)
+        self._sum = array.array('d', [0]) * (len(self._sorted) + 1)
+        self.n = 0
+        self.total = 0.0
+
+    def add(self, positions):
+        """Add the vertices at the positions of graph.vtx_indices."""
+        count, sums, n = self._count, self._sum, len(self._count)
+        for rank in self._ranks[positions].tolist():
+            value = self._sorted.item(rank)
+            self.n += 1
+            self.total += value
+            i = rank + 1
+            while i < n:
+                count[i] += 1
+                sums[i] += value
+                i += i & -i
+
+    def _prefix(self, k):
+        """Return the count and sum of the subset's k lowest ranks."""
+        count, sums = self._count, self._sum
+        c, s = 0, 0.0
+        while k > 0:
+            c += count[k]
+            s += sums[k]
+            k -= k & -k
+        return c, s
+
+    def abs_dev(self, value, complement=False):
+        """Return the sum of |x - value| over the subset, or over its
+        complement."""
+        k = int(np.searchsorted(self._sorted, value))
+        c_low, s_low = self._prefix(k)
+        c, s = self.n, self.total
+        if complement:
+            c_low, s_low = k - c_low, self._cumsum[k] - s_low
+            c, s = len(self._sorted) - c, self._cumsum[-1] - s
+        return value * c_low - s_low + (s - s_low) - value * (c - c_low)
+
+    def mean(self, complement=False):
+        if complement:
+            return np.float64(self._cumsum[-1] - self.total) / \
+                   (len(self._sorted) - self.n)
+        return np.float64(self.total) / self.n
+
+
+class _EvolvingGraphRegion(GraphRegion):
+    """
+    An evolving region of RegionGrow. Its neighbor nodes and the statistics
+    used by the assessments are updated in O(delta) as it merges nodes:
+    the sum of the neighbors' mean signals, the distances of the boundary
+    couples, and the rank sums of scalar vertex signals for the region and
+    its complement.
+    """
+
+    def __init__(self, graph, owner, label, component, seeds=None):
+        """
+        Parameters
+        ----------
+        graph : RegionGraph
+        owner : numpy array
+            The label of the evolving region which merged each node, or -1.
+            Nodes of all evolving regions are expected to be labeled.
+        label : integer
+        component : list
+            The initial nodes.
+        seeds : list
+        """
+        super(_EvolvingGraphRegion, self).__init__(graph, component, seeds)
+        self.n_initial = len(self.component)
+        self._owner = owner
+        self._label = label
+        self._frontier = _NodeFrontier(graph)
+        self._size = int(graph.counts[self.component].sum())
+        self._sums = graph.sums[self.component].sum(0)
+
+        # distances of the couples of a neighbor node and a merged node
+        self._couple_sum = np.zeros(graph.n_regions)
+        self._couple_count = np.zeros(graph.n_regions, dtype=np.int)
+        self._couples_sum = 0.0
+        self._couples_count = 0
+
+        if graph.signal.shape[1] == 1:
+            self._ranks = _RankSums(graph)
+            self._ranks.add(self._vertex_positions(self.component))
+        else:
+            self._ranks = None
+
+        neighbors = graph.neighbors_of(self.component)[1]
+        self._add_neighbors(neighbors[owner[neighbors] == -1])
+
+    def _vertex_positions(self, nodes):
+        """Return the positions of the nodes' vertices in vtx_indices."""
+        indptr = self.graph.vtx_indptr
+        return np.concatenate([np.arange(indptr[node], indptr[node+1])
+                               for node in nodes])
+
+    def _couple_dist(self, nodes_a, nodes_b):
+        diff = self.graph.mean_signal(nodes_a) - self.graph.mean_signal(nodes_b)
+        return np.sqrt(np.sum(diff ** 2, 1))
+
+    def _add_neighbors(self, nodes):
+        nodes = self._frontier.add(nodes)
+        if not len(nodes):
+            return
+        outer, inner = self.graph.neighbors_of(nodes)
+        in_region = self._owner[inner] == self._label
+        outer, inner = outer[in_region], inner[in_region]
+        dist = self._couple_dist(inner, outer)
+        np.add.at(self._couple_sum, outer, dist)
+        np.add.at(self._couple_count, outer, 1)
+        self._couples_sum += dist.sum()
+        self._couples_count += len(dist)
+
+    def merge(self, node):
+        """Merge a neighbor node."""
+        graph = self.graph
+        self._owner[node] = self._label
+        self.component.append(node)
+        self._size += graph.counts[node]
+        self._sums = self._sums + graph.sums[node]
+        if self._ranks is not None:
+            self._ranks.add(self._vertex_positions([node]))
+
+        # the neighbor nodes next to the node make new couples
+        outer = graph.reverse_neighbors(node)
+        outer = outer[self._frontier.contains(outer)]
+        dist = self._couple_dist(np.repeat(node, len(outer)), outer)
+        np.add.at(self._couple_sum, outer, dist)
+        np.add.at(self._couple_count, outer, 1)
+        self._couples_sum += dist.sum()
+        self._couples_count += len(dist)
+
+        # add the node's neighbors to self's neighbors
+        neighbors = graph.neighbors(node)
+        self._add_neighbors(neighbors[self._owner[neighbors] != self._label])
+
+    def remove_neighbor(self, node):
+        """Remove a neighbor node, return True if it was a neighbor."""
+        if not self._frontier.remove(node):
+            return False
+        self._couples_sum -= self._couple_sum[node]
+        self._couples_count -= self._couple_count[node]
+        self._couple_sum[node] = 0
+        self._couple_count[node] = 0
+        return True
+
+    def has_neighbors(self):
+        return len(self._frontier) > 0
+
+    def nearest_neighbor(self):
+        """
+        find the nearest neighbor node of self
+
+        Returns
+        -------
+            the nearest neighbor and its distance corresponding to self
+        """
+        nodes, neighbor_signals, removed = self._frontier.signals()
+        mean = self.mean_signal()
+        if neighbor_signals.shape[1] == 1:
+            # the same distances for a single feature, without the reductions
+            neighbor_signals = neighbor_signals[:, 0]
+            mean = mean[0]
+            dist = np.abs(neighbor_signals - mean)
+        else:
+            dist = np.sqrt(np.sum((neighbor_signals - mean) ** 2, 1))[:, None]
+
+        # TODO only suitable for activity value this kind of data
+        R_and_N_signals = neighbor_signals + mean
+        normalize_scale = R_and_N_signals - np.min(R_and_N_signals) + 1
+        with np.errstate(invalid='ignore'):
+            dist = dist / normalize_scale
+        if dist.ndim == 2:
+            dist = np.min(dist, 1)
+        # removed nodes are kept with infinite signals
+        dist[removed] = np.inf
+
+        index = np.argmin(dist)
+
+        return nodes[index], dist[index]
+
+    def size(self):
+        return int(self._size)
+
+    def mean_signal(self):
+        return self._sums / self._size
+
+    def neighbor_nodes(self):
+        return self._frontier.nodes()
+
+    def neighbor_mean_signal(self):
+        return self._frontier.signal_sum() / len(self._frontier)
+
+    def transition_level(self):
+        if not self._couples_count:
+            return np.nan
+        return self._couples_sum / self._couples_count
+
+    def within_dist(self, complement=False):
+        if self._ranks is None:
+            return super(_EvolvingGraphRegion, self).within_dist(complement)
+        if complement:
+            n = len(self.graph.vtx_indices) - self._ranks.n
+        else:
+            n = self._ranks.n
+        if not n:
+            return np.float64(0), 0
+        mean = self._ranks.mean(complement)
+        return np.float64(self._ranks.abs_dev(mean, complement)), n
+
+
+class GrowthHistory(object):
+    """
+    The merge order of a RegionGrow run. The evolved regions and their
+    assessment curves are read at any stop criteria up to the recorded
+    ones, without growing again.
+
+    With one evolving region, the results are those of growing with the
+    smaller stop criteria. Several evolving regions compete for nodes, so
+    each of them is cut from the recorded run, in which the others kept
+    growing: below the recorded stop criteria, the cuts of several
+    evolving regions are NOT the results of growing them again, and are
+    only equal to those at the recorded stop criteria.
+
+    Attributes
+    ----------
+    graph : RegionGraph
+    stop_criteria : list
+        The recorded stop size of each evolving region.
+    assess_step : integer
+        One assessment was done per 'assess_step' components, 0 for none.
+    """
+
+    def __init__(self, graph, evolved_regions, region_assessments,
+                 r_outer_value, stop_criteria, assess_step=0):
+        self.graph = graph
+        self.stop_criteria = stop_criteria
+        self.assess_step = assess_step
+        self._components = [r.component for r in evolved_regions]
+        self._seeds = [r.get_seeds() for r in evolved_regions]
+        self._n_initial = [r.n_initial for r in evolved_regions]
+        # the region size after each merge
+        self._sizes = [np.cumsum(graph.counts[r.component])
+                       for r in evolved_regions]
+        # a region stopped below its stop size has no more neighbors, and
+        # would not grow under a larger one either
+        self._complete = [r.size() < stop
+                          for r, stop in zip(evolved_regions, stop_criteria)]
+        self._region_assessments = region_assessments
+        self._r_outer_value = r_outer_value
+
+    def __len__(self):
+        return len(self._components)
+
+    def _stop_sizes(self, stop_criteria):
+        if stop_criteria is None:
+            return self.stop_criteria
+        return (np.zeros(len(self), dtype=np.int) + stop_criteria).tolist()
+
+    def covers(self, stop_criteria):
+        """Return True if the regions at stop_criteria are recorded."""
+        return all(complete or stop <= recorded for stop, recorded, complete in
+                   zip(self._stop_sizes(stop_criteria), self.stop_criteria,
+                       self._complete))
+
+    def _n_components(self, stop_criteria):
+        """Return the number of merged nodes of each region at stop_criteria."""
+        if not self.covers(stop_criteria):
+            raise ValueError("The stop criteria exceed the recorded growth!")
+        # nodes are merged while the size is below the stop size
+        return [min(max(np.searchsorted(sizes, stop) + 1, n_initial), len(sizes))
+                for sizes, stop, n_initial in zip(self._sizes,
+                                                  self._stop_sizes(stop_criteria),
+                                                  self._n_initial)]
+
+    def regions(self, stop_criteria=None):
+        """
+        Return the evolved regions (GraphRegion) at stop_criteria, the
+        recorded ones if it is None.
+        """
+        return [GraphRegion(self.graph, component[:n], seeds)
+                for component, seeds, n in zip(self._components, self._seeds,
+                                               self._n_components(stop_criteria))]
+
+    def assessments(self, stop_criteria=None, half_width=0):
+        """
+        Return the assessment curves and the outer boundary values of the
+        evolved regions at stop_criteria. The assessment curves are smoothed
+        with half_width.
+        """
+        if not self.assess_step:
+            raise RuntimeError("The growth was recorded without assessments!")
+        region_assessments = []
+        r_outer_value = []
+        for r_idx, n in enumerate(self._n_components(stop_criteria)):
+            # assessments are done after merges, at multiples of assess_step
+            end = n // self.assess_step - self._n_initial[r_idx] // self.assess_step
+            region_assessments.append(slide_win_smooth(
+                self._region_assessments[r_idx][:end], half_width))
+            r_outer_value.append(self._r_outer_value[r_idx][:end])
+        return region_assessments, r_outer_value
+
+    def max_assess_regions(self, stop_criteria=None, half_width=0):
+        """
+        Return the regions of max assessment value among the evolving
+        history of each evolved region at stop_criteria.
+        """
+        region_assessments = self.assessments(stop_criteria, half_width)[0]
+        max_assess_regions = []
+        for r_idx, assessments in enumerate(region_assessments):
+            index = np.argmax(assessments)
+            end_index = (index+1) * self.assess_step
+            max_assess_regions.append(GraphRegion(self.graph,
+                                                  self._components[r_idx][:end_index],
+                                                  self._seeds[r_idx]))
+        return max_assess_regions
+
+
 class RegionGrow(object):
     """
     Region growing performs a segmentation of an object with respect to a set of points.
 
     Attributes
     ----------
-
+    graph : RegionGraph
+        The preliminary regions and their adjacency.
+    v_id2r_id : numpy array
+        The region of each vertex, -1 for vertices out of the mask.
 
     Methods
     -------
@@ -341,7 +1172,7 @@ class RegionGrow(object):
 
         # initialize fields
         # -----------------
-        self.regions = []
+        self.graph = None
         self.v_id2r_id = None
         self._assess_func = None
 
@@ -402,20 +1233,11 @@ class RegionGrow(object):
                     self.v_id2r_id[v_id] = r_id
                     region_neighbors.append(vtx_neighbors[v_id])
 
-                # warning: a region's neighbors is stored as a list rather than a set at here.
-                region_neighbors = [map(lambda v: self.v_id2r_id[v], vertices) for vertices in region_neighbors]
+                region_neighbors = [self.v_id2r_id[np.fromiter(vertices, dtype=np.int)]
+                                    for vertices in region_neighbors]
 
-        # initialize regions
-        n_regions = np.max(self.v_id2r_id) + 1
-        self.regions = [Region() for r_id in range(n_regions)]
-        for v_id, r_id in enumerate(self.v_id2r_id):
-            if r_id != -1:
-                self.regions[r_id].add_vertex(v_id, vtx_signal=vtx_signal)
-
-        # add neighbors
-        for r_id, region in enumerate(self.regions):
-            for neighbor_id in region_neighbors[r_id]:
-                region.add_neighbor(self.regions[neighbor_id])
+        # initialize the region graph
+        self.graph = RegionGraph(vtx_signal, self.v_id2r_id, region_neighbors)
 
     def arg_parcel(self, seeds_id, stop_criteria, whole_results=False, half_width=0, assess_step=1):
         """
@@ -439,31 +1261,22 @@ class RegionGrow(object):
         Returns
         -------
         max_assess_regions : list
-            max-assess region is of max assessment value
+            max-assess region (GraphRegion) is of max assessment value
             among corresponding evolved region's evolving history.
         evolved_regions : list
-            Include all evolved regions after self._compute()
+            Include all evolved regions (GraphRegion) after self._compute()
         region_assessment : list
             All assessment values for corresponding evolved region
         assess_step : integer
         r_outer_value : list
         """
 
-        # call methods of the class
-        evolved_regions, region_assessments, r_outer_value = self._compute(seeds_id, stop_criteria, assess_step)
-        max_assess_regions = [EvolvingRegion(r.get_seeds()) for r in evolved_regions]
-        # find the max assessed value
-        for r_idx, r in enumerate(evolved_regions):
-
-            region_assessments[r_idx] = slide_win_smooth(region_assessments[r_idx], half_width)
-            index = np.argmax(region_assessments[r_idx])
-            end_index = (index+1) * assess_step
-
-            for region in r.get_component()[:end_index]:
-                max_assess_regions[r_idx].merge(region)
+        history = self.parcel_history(seeds_id, stop_criteria, assess_step)
+        max_assess_regions = history.max_assess_regions(half_width=half_width)
 
         if whole_results:
-            return max_assess_regions, evolved_regions, region_assessments, assess_step, r_outer_value
+            region_assessments, r_outer_value = history.assessments(half_width=half_width)
+            return max_assess_regions, history.regions(), region_assessments, assess_step, r_outer_value
         else:
             return max_assess_regions
 
@@ -483,11 +1296,34 @@ class RegionGrow(object):
         Returns
         -------
         evolved_regions : list
-            Include all evolved regions after self._compute()
+            Include all evolved regions (GraphRegion) after self._compute()
         """
-        # call methods of the class
-        evolved_regions, region_assessments = self._compute(seeds_id, stop_criteria)
-        return evolved_regions
+        return self.parcel_history(seeds_id, stop_criteria).regions()
+
+    def parcel_history(self, seeds_id, stop_criteria, assess_step=0):
+        """
+        Grow the regions once, and record the growth for any stop criteria
+        up to stop_criteria.
+
+        Parameters
+        ----------
+        seeds_id : list
+            Its elements are also list, called sub-list,
+            each sub-list contains a group of seed vertices which are used to initialize a evolving region.
+            Different sub-list initializes different evolving region.
+        stop_criteria : integer
+            The largest stop criteria of interest
+        assess_step : integer
+            do one assessment per 'assess_step' components, 0 for none
+
+        Returns
+        -------
+        history : GrowthHistory
+        """
+        evolved_regions, region_assessments, r_outer_value = self._compute(seeds_id, stop_criteria, assess_step)
+        stop_size = (np.zeros(len(evolved_regions), dtype=np.int) + stop_criteria).tolist()
+        return GrowthHistory(self.graph, evolved_regions, region_assessments,
+                             r_outer_value, stop_size, assess_step)
 
     @staticmethod
     def connectivity_grow(seeds_id, edge_list):
@@ -524,101 +1360,100 @@ class RegionGrow(object):
         """
         do region growing
         """
+        graph = self.graph
 
-        # -------initialize evolving_regions and merged_regions------
-        evolving_regions = []
-        merged_regions = []
+        # -------initialize evolving regions------
+        # owner is the evolving region which merged each node, or -1
+        owner = -np.ones(graph.n_regions, dtype=np.int)
+        components = []
+        seeds_list = []
         if seeds_id:
-            for seeds in seeds_id:
-                evolving_region = EvolvingRegion(seeds)
-                merged_regions_tmp = []
+            for r_idx, seeds in enumerate(seeds_id):
+                component = []
                 for seed in seeds:
                     seed_r_id = self.v_id2r_id[seed]
                     if seed_r_id == -1:
                         raise RuntimeError("At least one of your seeds is out of the mask!")
-                    else:
-                        seed_region = self.regions[seed_r_id]
-                        if seed_region in merged_regions:
-                            raise RuntimeError("More than one evolving regions are"
-                                               "assigned with a same unit region initially!")
-                        elif seed_region in merged_regions_tmp:
-                            # do not merge the same unit region repeatedly
-                            continue
-                        else:
-                            evolving_region.merge(seed_region)
-                            merged_regions_tmp.append(seed_region)
-                evolving_regions.append(evolving_region)
-                merged_regions.extend(merged_regions_tmp)
+                    elif owner[seed_r_id] == r_idx:
+                        # do not merge the same unit region repeatedly
+                        continue
+                    elif owner[seed_r_id] != -1:
+                        raise RuntimeError("More than one evolving regions are"
+                                           "assigned with a same unit region initially!")
+                    owner[seed_r_id] = r_idx
+                    component.append(seed_r_id)
+                components.append(component)
+                seeds_list.append(seeds)
         else:
-            evolving_regions.append(self.get_seed_region())
-            for evo_r in evolving_regions:
-                merged_regions.extend(evo_r.get_component())
+            seed_region = self.get_seed_region()
+            owner[seed_region.component] = 0
+            components.append(seed_region.component)
+            seeds_list.append(seed_region.get_seeds())
 
-        for evo_r in evolving_regions:
-            evo_r.remove_neighbors(merged_regions)
+        n_seed = len(components)
+        evolving_regions = [_EvolvingGraphRegion(graph, owner, i, components[i],
+                                                 seeds_list[i])
+                            for i in range(n_seed)]
 
         # ------initialize other variables-------
-        n_seed = len(evolving_regions)
-        region_size = np.array([region.size() for region in evolving_regions])
+        stop_size = (np.zeros(n_seed, dtype=np.int) + stop_criteria).tolist()
         region_assessments = [[] for i in range(n_seed)]
         r_outer_boundary_value = [[] for i in range(n_seed)]
 
-        # Positive infinity and negative infinity evaluate to True, because they are not equal to zero.
-        dist = np.empty(n_seed)
-        dist.fill(np.inf)
-
-        neighbor = [None] * n_seed
+        def growing(i):
+            region = evolving_regions[i]
+            return region.size() < stop_size[i] and region.has_neighbors()
 
-        # ------main cycle------
-        while np.any(np.less(region_size, stop_criteria)):
-            r_to_grow = np.less(region_size, stop_criteria)
-            dist[np.logical_not(r_to_grow)] = np.inf
+        # the nearest neighbor of each growing region is queued with the
+        # version of its neighbors; removing neighbors only increases the
+        # distances, so outdated entries are requeued lazily
+        queue = []
+        version = [0] * n_seed
 
-            r_index = np.nonzero(r_to_grow)[0]
+        def schedule(i):
+            if growing(i):
+                node, dist = evolving_regions[i].nearest_neighbor()
+                heapq.heappush(queue, (dist, i, version[i], node))
 
-            for i in r_index:
-                # find the nearest neighbor for the each seed region
-                r_neighbor, r_dist, = evolving_regions[i].nearest_neighbor()
-                dist[i] = r_dist
-                neighbor[i] = r_neighbor
+        for i in range(n_seed):
+            schedule(i)
 
-            # find the seed which has the nearest neighbor in this iteration
-            r = np.argmin(dist)
-            target_neighbor = neighbor[r]
+        # ------main cycle------
+        while queue:
+            dist, r, r_version, target_neighbor = heapq.heappop(queue)
+            if r_version != version[r]:
+                schedule(r)
+                continue
 
             # Prevent a seed from intersecting with another seed
-            if target_neighbor not in merged_regions:
-                merged_regions.append(target_neighbor)
+            if owner[target_neighbor] == -1:
                 # merge the neighbor to the seed
-                evolving_regions[r].merge(target_neighbor)
-                region_size[r] = region_size[r] + target_neighbor.size()
+                region = evolving_regions[r]
+                region.merge(target_neighbor)
 
                 if assess_step:
                     # compute assessments
-                    if len(evolving_regions[r].get_component()) % assess_step == 0:
-                        assessed_value = self._assess_func(evolving_regions[r])
+                    if len(region.component) % assess_step == 0:
+                        assessed_value = self._assess_func(region)
                         region_assessments[r].append(assessed_value)
-                        outer_signals = [i.mean_signal() for i in evolving_regions[r].get_neighbors()]
-                        r_outer_boundary_value[r].append(np.mean(outer_signals))
-                        print 'Evolving region{} size: {}'.format(r, evolving_regions[r].size())
-
-            for i in r_index:
-                # remove the neighbor from the neighbor list of growing seeds
-                evolving_regions[i].remove_neighbor(target_neighbor)
-
-                # update region_size
-                if not evolving_regions[i].neighbors:
-                    # If the seed has no neighbor, stop its growing.
-                    try:
-                        region_size[i] = stop_criteria[i]
-                    except IndexError:
-                        # It means that the user uses one stop criteria for all evolving regions.
-                        region_size[i] = stop_criteria[0]
+                        r_outer_boundary_value[r].append(np.mean(region.neighbor_mean_signal()))
+                        print 'Evolving region{} size: {}'.format(r, region.size())
+
+            # remove the neighbor from the neighbor list of growing seeds,
+            # a seed without neighbors stops growing
+            version[r] += 1
+            for i in range(n_seed):
+                if i != r and growing(i) and evolving_regions[i].remove_neighbor(target_neighbor):
+                    version[i] += 1
+            evolving_regions[r].remove_neighbor(target_neighbor)
+            schedule(r)
 
         return evolving_regions, region_assessments, r_outer_boundary_value
 
     def get_regions(self):
-        return self.regions, self.v_id2r_id
+        regions = [GraphRegion(self.graph, [r_id])
+                   for r_id in range(self.graph.n_regions)]
+        return regions, self.v_id2r_id
 
     def get_seed_region(self):
         """
@@ -627,14 +1462,13 @@ class RegionGrow(object):
 
         Return
         ------
-            evolving_region : EvolvingRegion
+            evolving_region : GraphRegion
         """
 
-        mean_signal = [np.mean(region.mean_signal()) for region in self.regions]
+        mean_signal = np.mean(self.graph.mean_signal(), 1)
         seed_r_id = np.argmax(mean_signal)
         seed_v_id = np.where(self.v_id2r_id == seed_r_id)[0][0]
-        evolving_region = EvolvingRegion(seed_v_id)
-        evolving_region.merge(self.regions[seed_r_id])
+        evolving_region = GraphRegion(self.graph, [seed_r_id], seed_v_id)
 
         return evolving_region
 
@@ -652,7 +1486,7 @@ class RegionGrow(object):
 
         Parameter
         ---------
-        region : Region
+        region : GraphRegion
 
         Return
         ------
@@ -660,7 +1494,7 @@ class RegionGrow(object):
             Larger assessed_value means better grown region.
         """
 
-        neighbor_mean_signal = np.mean([i.mean_signal() for i in region.get_neighbors()], 0)
+        neighbor_mean_signal = region.neighbor_mean_signal()
         assessed_value = np.sqrt(np.sum((region.mean_signal() - neighbor_mean_signal)**2))
 
         return assessed_value
@@ -674,7 +1508,7 @@ class RegionGrow(object):
 
         Parameter
         ---------
-        region : Region
+        region : GraphRegion
 
         Return
         ------
@@ -682,19 +1516,7 @@ class RegionGrow(object):
             Larger assessed_value means better grown region.
         """
 
-        outer_boundary = region.get_neighbors()
-
-        # find all couples
-        couples = []
-        for i in outer_boundary:
-            tmp_couples = [(n, i) for n in i.get_neighbors() if n in region.get_component()]
-            couples.extend(tmp_couples)
-        # calculate assessed value
-        couples_signal = map(lambda x: [x[0].mean_signal(), x[1].mean_signal()], couples)
-        couples_dist = map(pdist, couples_signal)
-        assessed_value = np.mean(couples_dist)
-
-        return assessed_value
+        return region.transition_level()
 
     @staticmethod
     def _assess_gray_level_dist1(region):
@@ -704,15 +1526,15 @@ class RegionGrow(object):
         Adapted from (Chantal et al. 2002).
         Parameter
         ---------
-        region : Region
+        region : GraphRegion
         Return
         ------
         inv_gray_level_dist : float
             Larger assessed_value means better grown region.
         """
 
-        mean_signal = np.atleast_2d(region.mean_signal())
-        r_variance = np.mean(cdist(region.vtx_signal.values(), mean_signal))
+        r_dist, r_size = region.within_dist()
+        r_variance = r_dist / r_size
 
         gray_level_dist = np.sqrt(r_variance)
         if gray_level_dist != 0:
@@ -730,22 +1552,18 @@ class RegionGrow(object):
 
         Parameter
         ---------
-        region : Region
+        region : GraphRegion
 
         Return
         ------
         inv_gray_level_dist : float
             Larger assessed_value means better grown region.
         """
-        r_c = EvolvingRegion('region_complement')
-        for r in self.regions:
-            if r not in region.get_component():
-                r_c.merge(r)
+        r_dist, r_size = region.within_dist()
+        r_c_dist, r_c_size = region.within_dist(complement=True)
 
-        r_mean_signal = np.atleast_2d(region.mean_signal())
-        r_c_mean_signal = np.atleast_2d(r_c.mean_signal())
-        r_variance = np.mean(cdist(region.get_vtx_signal().values(), r_mean_signal))
-        r_c_variance = np.mean(cdist(r_c.get_vtx_signal().values(), r_c_mean_signal))
+        r_variance = r_dist / r_size
+        r_c_variance = r_c_dist / r_c_size
 
         gray_level_dist = np.sqrt(r_variance + r_c_variance)
         if gray_level_dist != 0:
@@ -763,22 +1581,15 @@ class RegionGrow(object):
 
         Parameter
         ---------
-        region : Region
+        region : GraphRegion
 
         Return
         ------
         inv_gray_level_dist : float
             Larger assessed_value means better grown region.
         """
-        r_c = EvolvingRegion('region_complement')
-        for r in self.regions:
-            if r not in region.get_component():
-                r_c.merge(r)
-
-        r_mean_signal = np.atleast_2d(region.mean_signal())
-        r_c_mean_signal = np.atleast_2d(r_c.mean_signal())
-        r_variance = np.sum(cdist(region.get_vtx_signal().values(), r_mean_signal))
-        r_c_variance = np.sum(cdist(r_c.get_vtx_signal().values(), r_c_mean_signal))
+        r_variance = region.within_dist()[0]
+        r_c_variance = region.within_dist(complement=True)[0]
 
         gray_level_dist = np.sqrt(r_variance + r_c_variance)
         if gray_level_dist != 0:
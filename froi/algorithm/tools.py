@@ -1,6 +1,5 @@
 import time
 import numpy as np
-from mayavi import mlab
 
 
 # ------------------common tools-------------------
@@ -158,6 +157,8 @@ def surface_plot(edge_list, start, end, coords):
     coords : numpy array
         all vertices' coordinates in the current surface view
     """
+    from mayavi import mlab
+
     path = bfs(edge_list, start, end)
     path_coords = coords[path]
     x, y, z = path_coords[:, 0], path_coords[:, 1], path_coords[:, 2]
@@ -8,6 +8,11 @@ Dataset definition class for FreeROI GUI system.
 import re
 import os
 import sys
+import itertools
+import tempfile
+import threading
+import weakref
+from collections import OrderedDict, deque
 
 import nibabel as nib
 import numpy as np
@@ -18,36 +23,315 @@ from PyQt4.QtGui import *
 from froi.algorithm import meshtool as mshtool
 from froi.algorithm import array2qimage as aq
 from ..io.surf_io import read_scalar_data
+from ..io.nifti_io import save_nifti
 from labelconfig import LabelConfig
 
-
-class DoStack(QObject):
-    """
-    For Undo and Redo
+# max number of rendered slices kept by each volume
+RGBA_CACHE_SIZE = 128
+# max number of quantized slices kept by each volume
+QUANT_CACHE_SIZE = 128
+# render versions are unique among all volumes
+_render_version = itertools.count(1)
+# default memory budget (in bytes) of the frame cache of 4D volumes
+FRAME_CACHE_BUDGET = 512 * 1024 ** 2
+# default memory budget (in bytes) of the undo history of each volume
+UNDO_BUDGET = 256 * 1024 ** 2
+
+
+def _nifti_datatype(dtype):
+    """Return the nifti1 datatype code of a numpy dtype, or None."""
+    #Define nifti1 datatype codes
+    NIFTI_TYPE_UINT8 = 2  # unsigned char
+    NIFTI_TYPE_INT16 = 4  # signed short
+    NIFTI_TYPE_INT32 = 8  # signed int.
+    NIFTI_TYPE_FLOAT32 = 16  # 32 bit float.
+    NIFTI_TYPE_COMPLEX64 = 32  # 64 bit complex = 2 32 bit floats
+    NIFTI_TYPE_FLOAT64 = 64  # 64 bit float = double.
+    NIFTI_TYPE_RGB24 = 128  # 3 8 bit bytes.
+    NIFTI_TYPE_INT8 = 256  # signed char.
+    NIFTI_TYPE_UINT16 = 512  # unsigned short.
+    NIFTI_TYPE_UINT32 = 768  # unsigned int.
+    NIFTI_TYPE_INT64 = 1024  #signed long long.
+    NIFTI_TYPE_UINT64 = 1280  # unsigned long long.
+    NIFTI_TYPE_FLOAT128 = 1536  # 128 bit float = long double.
+    NIFTI_TYPE_COMPLEX128 = 1792  #128 bit complex = 2 64 bit floats.
+    NIFTI_TYPE_COMPLEX256 = 2048  # 256 bit complex = 2 128 bit floats
+    NIFTI_TYPE_RGBA32 = 2304  # 4 8 bit bytes.
+
+    #Detect the data type of the input data.
+    data_type = {
+        np.uint8: NIFTI_TYPE_UINT8,
+        np.uint16: NIFTI_TYPE_UINT16,
+        np.uint32: NIFTI_TYPE_UINT32,
+        np.float32: NIFTI_TYPE_FLOAT32,
+        np.int16: NIFTI_TYPE_INT16,
+        np.int32: NIFTI_TYPE_INT32,
+        np.int8: NIFTI_TYPE_INT8
+        }
+    if sys.maxint > 2 ** 32: # The platform is 64 bit
+        data_type[np.float128] = NIFTI_TYPE_FLOAT128
+        data_type[np.float64] = NIFTI_TYPE_FLOAT64
+        data_type[np.int64] = NIFTI_TYPE_INT64
+        data_type[np.uint64] = NIFTI_TYPE_UINT64
+        data_type[np.complex64] = NIFTI_TYPE_COMPLEX64
+        data_type[np.complex128] = NIFTI_TYPE_COMPLEX128
+        data_type[np.complex256] = NIFTI_TYPE_COMPLEX256
+    return data_type.get(dtype.type)
+
+
+def _compact_index(index):
+    """Return flat voxel indexes as int32 if they fit in."""
+    if index.size and index.max() >= 2 ** 31:
+        return index
+    return index.astype(np.int32)
+
+
+class _VoxelEdit(object):
+    """Old and new values of voxels modified by one operation, the voxels
+    are given by flat indexes in the volume of a time point."""
+    def __init__(self, index, old, new):
+        self.index = index
+        self.old = old
+        self.new = new
+        self.nbytes = index.nbytes + old.nbytes + new.nbytes
+
+
+class _VolumeEdit(object):
+    """Data replaced as a whole by one operation.
+
+    One side of the edit is always the current data of the volume, so
+    only one copy of the data is counted.
     """
-    stack_changed = pyqtSignal()
+    def __init__(self, old, new):
+        # (data, frame cache, shared) of each side
+        self.old = old
+        self.new = new
+        data, frames = old[:2]
+        if data is not None:
+            self.nbytes = data.nbytes
+        else:
+            self.nbytes = sum(f.nbytes for f in frames._edited.itervalues())
 
-    def __init__(self):
-        super(QObject, self).__init__()
-        self._stack = []
 
-    def push(self, v):
-        self._stack.append(v)
-        self.stack_changed.emit()
+class EditJournal(QObject):
+    """Undo and redo history of a volume.
 
-    def pop(self):
-        t = self._stack.pop()
-        self.stack_changed.emit()
-        return t
+    Each entry is a whole operation, such as a brush stroke. The oldest
+    entries are dropped once the entries exceed the memory budget.
+    """
+    undo_changed = pyqtSignal()
+    redo_changed = pyqtSignal()
+
+    def __init__(self, budget=UNDO_BUDGET):
+        super(EditJournal, self).__init__()
+        self._budget = budget
+        self._undo = deque()
+        self._redo = []
+        self._nbytes = 0
+
+    def record(self, entry):
+        """Add a new operation, which discards the redo history."""
+        if self._redo:
+            self._nbytes -= sum(e.nbytes for e in self._redo)
+            self._redo = []
+            self.redo_changed.emit()
+        self._undo.append(entry)
+        self._nbytes += entry.nbytes
+        self._evict()
+        self.undo_changed.emit()
+
+    def pop_undo(self):
+        """Return the last operation and move it to the redo history."""
+        if not self._undo:
+            return None
+        entry = self._undo.pop()
+        self._redo.append(entry)
+        self.undo_changed.emit()
+        self.redo_changed.emit()
+        return entry
+
+    def pop_redo(self):
+        """Return the last undone operation and move it back."""
+        if not self._redo:
+            return None
+        entry = self._redo.pop()
+        self._undo.append(entry)
+        self.undo_changed.emit()
+        self.redo_changed.emit()
+        return entry
+
+    def can_undo(self):
+        return bool(self._undo)
+
+    def can_redo(self):
+        return bool(self._redo)
+
+    def get_nbytes(self):
+        """Return the memory used by the entries."""
+        return self._nbytes
+
+    def set_budget(self, budget):
+        """Set the memory budget in bytes."""
+        self._budget = budget
+        if self._evict():
+            self.undo_changed.emit()
+
+    def _evict(self):
+        """Drop the oldest entries exceeding the budget, the last entry is
+        always kept."""
+        evicted = False
+        while self._nbytes > self._budget and len(self._undo) > 1:
+            self._nbytes -= self._undo.popleft().nbytes
+            evicted = True
+        return evicted
 
     def clear(self):
-        self._stack = []
+        self._undo.clear()
+        self._redo = []
+        self._nbytes = 0
+        self.undo_changed.emit()
+        self.redo_changed.emit()
+
+
+class _ViewBase(object):
+    """The base object of read-only views of dataset data.
 
-    def stack_not_empty(self):
-        if self._stack:
-            return True
+    numpy keeps a view in the base chain of every array derived from it, so
+    a weak reference to the view tells whether any of them is alive.
+    """
+
+    def __init__(self, data):
+        self.data = data
+        self.__array_interface__ = data.__array_interface__
+
+
+class FrameCache(object):
+    """Frames of a 4D image, read from the image proxy on demand.
+
+    Frames are evicted in least recently used order once their total size
+    exceeds the memory budget. Edited frames are never evicted, they take
+    the place of the frames on disk when the whole data is requested.
+    """
+    def __init__(self, dataobj, budget=FRAME_CACHE_BUDGET):
+        self._dataobj = dataobj
+        self._budget = budget
+        self._frames = OrderedDict()
+        self._edited = {}
+        self._nbytes = 0
+        self._voxel_major = None
+        # frames may be requested by rendering threads
+        self._lock = threading.Lock()
+
+    def get(self, t):
+        """Return the frame of time point t."""
+        with self._lock:
+            frame = self._edited.get(t)
+            if frame is not None:
+                return frame
+            frame = self._frames.pop(t, None)
+            if frame is None:
+                frame = np.asarray(self._dataobj[..., t])
+                if not frame.flags.writeable:
+                    frame = frame.copy()
+                self._nbytes += frame.nbytes
+            self._frames[t] = frame
+            self._evict()
+            return frame
+
+    def mark_edited(self, t, frame):
+        """Keep the frame of time point t, which has been modified."""
+        with self._lock:
+            if self._frames.pop(t, None) is not None:
+                self._nbytes -= frame.nbytes
+            self._edited[t] = frame
+
+    def set_budget(self, budget):
+        """Set the memory budget in bytes."""
+        with self._lock:
+            self._budget = budget
+            self._evict()
+
+    def _evict(self):
+        while self._nbytes > self._budget and len(self._frames) > 1:
+            t, frame = self._frames.popitem(last=False)
+            self._nbytes -= frame.nbytes
+
+    def _is_compressed(self):
+        """Return True if the image is read from a gzipped file."""
+        file_like = getattr(self._dataobj, 'file_like', None)
+        return isinstance(file_like, basestring) and file_like.endswith('.gz')
+
+    def _read_chunks(self):
+        """Read the data in chunks of successive frames, yield the start
+        time point and the data of each chunk.
+
+        Chunks fit into the memory budget, and a compressed image is
+        decompressed once in order.
+        """
+        proxy = self._dataobj
+        if self._is_compressed():
+            proxy = nib.load(proxy.file_like, keep_file_open=True).dataobj
+        shape = proxy.shape
+        frame_size = np.prod(shape[:3]) * proxy.dtype.itemsize
+        step = max(int(self._budget // max(frame_size, 1)), 1)
+        for start in xrange(0, shape[3], step):
+            yield start, np.asarray(proxy[..., start:start+step])
+
+    def _get_voxel_major(self):
+        """Return a copy of the data in which each time course is
+        contiguous.
+
+        The copy is written to a temporary file in one pass over the
+        compressed image.
+        """
+        if self._voxel_major is None:
+            voxel_major = None
+            for start, chunk in self._read_chunks():
+                if voxel_major is None:
+                    voxel_major = np.memmap(tempfile.TemporaryFile(),
+                                            dtype=chunk.dtype, mode='w+',
+                                            shape=self._dataobj.shape)
+                voxel_major[..., start:start+chunk.shape[3]] = chunk
+            self._voxel_major = voxel_major
+        return self._voxel_major
+
+    def time_course(self, index):
+        """Return time courses of the voxels selected by index, a tuple of
+        x, y and z indexes."""
+        if self._is_compressed():
+            data = np.array(self._get_voxel_major()[index])
         else:
-            return False
+            # strided read through the proxy
+            data = np.array(self._dataobj[index + (slice(None), )])
+        with self._lock:
+            for t, frame in self._edited.iteritems():
+                data[..., t] = frame[index]
+        return data
+
+    def snapshot(self):
+        """Return a frame cache holding copies of current edited frames,
+        which is not affected by later edits."""
+        snapshot = FrameCache(self._dataobj, 0)
+        with self._lock:
+            for t, frame in self._edited.iteritems():
+                snapshot._edited[t] = frame.copy()
+        return snapshot
+
+    def get_data(self):
+        """Read the whole data, with edited frames in place.
+
+        The data is read chunk by chunk into the returned array, it is
+        never held twice in memory.
+        """
+        data = None
+        for start, chunk in self._read_chunks():
+            if data is None:
+                data = np.empty(self._dataobj.shape, dtype=chunk.dtype)
+            data[..., start:start+chunk.shape[3]] = chunk
+        with self._lock:
+            for t, frame in self._edited.iteritems():
+                data[..., t] = frame
+        return data
 
 
 class VolumeDataset(object):
@@ -61,10 +345,10 @@ class VolumeDataset(object):
         
         Parameters
         ----------
-        source : Nifti file path or 3D/4D numpy array
+        source : Nifti file path, nibabel image or 3D/4D numpy array
             Nifti dataset, specified either as a filename (single file 3D/4D 
-            image) or a 3D/4D numpy array. When source is a numpy array,
-            parameter header is required.
+            image), an image loaded by nibabel, or a 3D/4D numpy array. When
+            source is a numpy array, parameter header is required.
         label_config : label configuration
         name : name of the volume
             volume name.
@@ -87,8 +371,13 @@ class VolumeDataset(object):
         VolumeDataset
 
         """
+        self._frames = None
+        # data is shared copy-on-write with a snapshot being saved
+        self._data_shared = False
+        # weak references to read-only views of the data
+        self._data_views = []
         if isinstance(source, np.ndarray):
-            self._data = np.rot90(source)
+            self._data = source
             if name == None:
                 self._name = 'new_image'
             else:
@@ -101,36 +390,54 @@ class VolumeDataset(object):
             else:
                 raise ValueError("Data dimension does not match.")
         else:
-            self._img = nib.load(source)
+            if isinstance(source, nib.spatialimages.SpatialImage):
+                self._img = source
+                source = source.get_filename()
+            else:
+                # uncompressed images are memory-mapped copy-on-write
+                self._img = nib.load(source, mmap='c')
             self._header = self._img.get_header()
             basename = os.path.basename(source.strip('/'))
             self._name = re.sub(r'(.*)\.nii(\.gz)?', r'\1', basename)
             self.save_mem_load()
 
-        # For convenience, define a shift variable
-        self._y_shift = self.get_data_shape()[1] - 1
+        if len(self.get_data_shape()) == 3:
+            self._4d = False
+        else:
+            self._4d = True
+        self._time_point = 0
 
+        if view_min == None or view_max == None:
+            vrange = self._data_range()
         if view_min == None:
-            self._view_min = self._data.min()
+            self._view_min = vrange[0]
         else:
             self._view_min = view_min
 
         if view_max == None:
-            self._view_max = self._data.max()
+            self._view_max = vrange[1]
         else:
             self._view_max = view_max
 
         self._alpha = alpha
         self._colormap = colormap
-        self._rgba_list = range(self.get_data_shape()[2])
+        # rendered slices, created on request
+        self._rgba_cache = OrderedDict()
+        self._rgba_version = next(_render_version)
+        self._slice_version = {}
+        self._plane_version = {}
+
+        # quantized slices of current data, created on request, the knots
+        # and the value range of quantization, and the window lookup table
+        self._qslices = OrderedDict()
+        self._qrange = None
+        self._qbounds = None
+        self._window_lut = None
+        # guard lazy display data against rendering threads
+        self._render_lock = threading.RLock()
  
         # bool status for the item
         self._visible = True
-        if len(self.get_data_shape()) == 3:
-            self._4d = False
-        else:
-            self._4d = True
-        self._time_point = 0
 
         # temporal variant for OrthView
         self._cross_pos = cross_pos
@@ -139,32 +446,166 @@ class VolumeDataset(object):
         self.label_config_center = label_config_center
         self.label_config_center.single_roi_view_update.connect(self.update_single_roi)
         
-        # undo redo stacks
-        self.undo_stack = DoStack()
-        self.redo_stack = DoStack()
+        # undo redo history
+        self.journal = EditJournal()
 
         self.update_rgba()
         if self._cross_pos:
             self.update_orth_rgba()
 
     def save_mem_load(self):
-        """Load data around current time-point."""
-        if len(self.get_data_shape())==4 and self._img:
-            data = np.zeros(self.get_data_shape())
-            self._data = np.rot90(data)
-            self._loaded_time_list = [0]
-            self._data[..., 0] = np.rot90(self._img.dataobj[..., 0])
+        """Load data around current time-point.
+
+        Unscaled data of an uncompressed image is memory-mapped with the
+        on-disk dtype, pages are read when they are accessed. Frames of
+        other 4D images are read on demand into a bounded cache.
+        """
+        if self._is_mappable():
+            self._data = np.asanyarray(self._img.dataobj)
+        elif len(self.get_data_shape())==4 and self._img:
+            self._data = None
+            self._frames = FrameCache(self._img.dataobj)
         else:
-            self._loaded_time_list = [0]
-            data = self._img.get_data(caching='unchanged')
-            self._data = np.rot90(data)
+            self._data = self._img.get_data(caching='unchanged')
+
+    def set_frame_cache_budget(self, budget):
+        """Set the memory budget (in bytes) for frames of a 4D image."""
+        if self._frames is not None:
+            self._frames.set_budget(budget)
+
+    def _get_frame(self, t):
+        """Return the data of time point t."""
+        if self._frames is not None:
+            return self._frames.get(t)
+        return self._data[..., t]
+
+    def _is_mappable(self):
+        """Return True if the image data can be memory-mapped."""
+        proxy = self._img.dataobj
+        return (self._img.get_filename().endswith('.nii') and
+                getattr(proxy, 'slope', 1) == 1 and
+                getattr(proxy, 'inter', 0) == 0)
+
+    def _is_mapped(self):
+        """Return True if the data is memory-mapped from the image file."""
+        return isinstance(self._data, np.memmap)
 
     def get_data_shape(self):
         """Get shape of data."""
         return self._header.get_data_shape()
 
+    def _is_windowed(self):
+        """Return True if the display goes through a window lookup table."""
+        if isinstance(self._colormap, LabelConfig):
+            return False
+        return str(self._colormap) not in ('rainbow', 'single ROI')
+
+    def _current_data(self):
+        """Return the data of current time point."""
+        if self.is_4d():
+            return self._get_frame(self._time_point)
+        return self._data
+
+    def _data_range(self):
+        """Return the value range of current data.
+
+        The range of memory-mapped data is read from the header (cal_min,
+        cal_max) if it is set, or estimated from a few slices otherwise, so
+        the whole data is not read.
+        """
+        data = self._current_data()
+        if not self._is_mapped():
+            return aq.data_range(data)
+        cal_min = float(self._header['cal_min'])
+        cal_max = float(self._header['cal_max'])
+        if cal_max > cal_min:
+            return cal_min, cal_max
+        return aq.data_range(aq.sample_values(data))
+
+    def _get_qrange(self, vrange=None):
+        """Return the knots of quantization of current data.
+
+        The quantization range is widened to vrange if it does not contain
+        it, the slices quantized before are dropped then.
+        """
+        with self._render_lock:
+            if self._qbounds is None:
+                self._qbounds = self._data_range()
+            if vrange is not None:
+                vrange = (min(vrange[0], self._qbounds[0]),
+                          max(vrange[1], self._qbounds[1]))
+                if vrange != self._qbounds:
+                    self._qbounds = vrange
+                    self._qrange = None
+            if self._qrange is None:
+                self._qrange = aq.quantize_range(self._current_data(),
+                                                 self._qbounds)
+                self._qslices.clear()
+                self._window_lut = None
+            return self._qrange
+
+    def _get_quantized_slice(self, axis, index):
+        """Return the quantized `index`th slice along axis of current data.
+
+        Slices are quantized on request and kept in a bounded cache.
+        """
+        with self._render_lock:
+            key = (axis, index)
+            qslice = self._qslices.pop(key, None)
+            if qslice is None:
+                data = self._current_data()[(slice(None), ) * axis + (index, )]
+                qrange = self._get_qrange(aq.data_range(data))
+                qslice = aq.quantize(data, qrange)
+                if len(self._qslices) >= QUANT_CACHE_SIZE:
+                    self._qslices.popitem(last=False)
+            self._qslices[key] = qslice
+            return qslice
+
+    def _get_window_lut(self):
+        """Return the lookup table of current display window."""
+        with self._render_lock:
+            if self._window_lut is None:
+                self._window_lut = aq.window_lut(str(self._colormap),
+                                                 self._alpha,
+                                                 (self._view_min,
+                                                  self._view_max),
+                                                 self._get_qrange())
+            return self._window_lut
+
+    def _update_quantized_data(self, coords):
+        """Drop the quantized slices which have modified voxels."""
+        with self._render_lock:
+            for axis, index in self._qslices.keys():
+                if np.any(coords[axis] == index):
+                    del self._qslices[(axis, index)]
+
+    def _reset_display(self, data=False):
+        """Drop the window lookup table, and the quantized data if data is
+        True."""
+        with self._render_lock:
+            self._window_lut = None
+            if data:
+                self._qslices.clear()
+                self._qrange = None
+                self._qbounds = None
+
+    def _display_slice(self, axis, index):
+        """Return the `index`th slice along axis of the data which is
+        passed to the rendering factory.
+
+        The slice is in native orientation, it is flipped for display with
+        np.rot90, which returns a view.
+        """
+        if self._is_windowed():
+            return self._get_quantized_slice(axis, index)
+        return self._current_data()[(slice(None), ) * axis + (index, )]
+
     def _rendering_factory(self):
         """Return a rendering factory according to the display setting."""
+        if self._is_windowed():
+            lut = self._get_window_lut()
+            return lambda array: aq.apply_lut(lut, array)
+
         def shadow(array):
             if not isinstance(self._colormap, LabelConfig):
                 colormap = str(self._colormap)
@@ -188,24 +629,22 @@ class VolumeDataset(object):
             self.label_config_center.single_roi_view_update_for_model.emit() 
 
     def update_rgba(self, index=None):
-        """Create a range of qrgba array for display."""
-        # return a rendering factory
-        f = self._rendering_factory()
+        """Mark rendered slices as dirty, they are rendered again on request.
 
+        All slices are marked if index is None.
+        """
         if index == None:
-            if self.is_4d():
-                layer_list = [self._data[..., i, self._time_point] for i in 
-                                    range(self.get_data_shape()[2])]
-            else:
-                layer_list = [self._data[..., i] for i in 
-                                    range(self.get_data_shape()[2])]
-            self._rgba_list = map(f, layer_list)
+            self._rgba_cache.clear()
+            self._slice_version.clear()
+            self._rgba_version = next(_render_version)
         else:
-            if self.is_4d():
-                self._rgba_list[index] = f(self._data[..., index,
-                                                      self._time_point])
-            else:
-                self._rgba_list[index] = f(self._data[..., index])
+            self._rgba_cache.pop(index, None)
+            self._slice_version[index] = next(_render_version)
+
+    def get_rgba_version(self, index):
+        """Return the version of rendered slice, it changes once the slice
+        becomes dirty."""
+        return self._rgba_version, self._slice_version.get(index, 0)
 
     def set_cross_pos(self, cross_pos):
         """ Update RGBA data in sagital, axial and coronal directions."""
@@ -226,39 +665,29 @@ class VolumeDataset(object):
             self.update_axial_rgba()
     
     def update_orth_rgba(self):
-        """Update the disply in orth view."""
+        """Update the disply in orth view.
+
+        The planes are only marked as stale here, each one is rendered
+        when the view asks for it.
+        """
         self.update_sagital_rgba()
         self.update_coronal_rgba()
         self.update_axial_rgba()
 
     def update_sagital_rgba(self):
-        """Update the sagital disply in orth view."""
-        f = self._rendering_factory()
-        idx = self._cross_pos[0]
-        if self.is_4d():
-            self._sagital_rgba = f(np.rot90(self._data[:, idx, :,
-                                                       self._time_point]))
-        else:
-            self._sagital_rgba = f(np.rot90(self._data[:, idx, :]))
+        """Mark the sagital disply in orth view as stale."""
+        self._sagital_rgba = None
+        self._plane_version['sagital'] = next(_render_version)
 
     def update_axial_rgba(self):
-        """Update the axial disply in orth view."""
-        f = self._rendering_factory()
-        idx = self._cross_pos[2]
-        if self.is_4d():
-            self._axial_rgba = f(self._data[:, :, idx, self._time_point])
-        else:
-            self._axial_rgba = f(self._data[:, :, idx])
+        """Mark the axial disply in orth view as stale."""
+        self._axial_rgba = None
+        self._plane_version['axial'] = next(_render_version)
 
     def update_coronal_rgba(self):
-        """Update the coronal disply in orth view."""
-        f = self._rendering_factory()
-        idx = self._y_shift - self._cross_pos[1]
-        if self.is_4d():
-            self._coronal_rgba = f(np.rot90(self._data[idx, :, :,
-                                                       self._time_point]))
-        else:
-            self._coronal_rgba = f(np.rot90(self._data[idx, :, :]))
+        """Mark the coronal disply in orth view as stale."""
+        self._coronal_rgba = None
+        self._plane_version['coronal'] = next(_render_version)
 
     def set_alpha(self, alpha):
         """Set alpha value."""
@@ -266,6 +695,7 @@ class VolumeDataset(object):
             if alpha <= 255 and alpha >= 0:
                 if self._alpha != alpha:
                     self._alpha = alpha
+                    self._reset_display()
                     self.update_rgba()
                     if self._cross_pos:
                         self.update_orth_rgba()
@@ -281,14 +711,9 @@ class VolumeDataset(object):
         if self.is_4d():
             if isinstance(tpoint, int):
                 if tpoint >= 0 and tpoint < self.get_data_shape()[3]:
-                    if self._img:
-                        if not tpoint in self._loaded_time_list:
-                            self._data[..., tpoint] = \
-                                    np.rot90(self._img.dataobj[..., tpoint])
-                            self._loaded_time_list.append(tpoint)
                     self._time_point = tpoint
-                    self.undo_stack.clear()
-                    self.redo_stack.clear()
+                    self._reset_display(data=True)
+                    self.journal.clear()
                     self.update_rgba()
                     if self._cross_pos:
                         self.update_orth_rgba()
@@ -304,6 +729,7 @@ class VolumeDataset(object):
         try:
             view_min = float(view_min)
             self._view_min = view_min
+            self._reset_display()
             self.update_rgba()
             if self._cross_pos:
                 self.update_orth_rgba()
@@ -319,6 +745,7 @@ class VolumeDataset(object):
         try:
             view_max = float(view_max)
             self._view_max = view_max
+            self._reset_display()
             self.update_rgba()
             if self._cross_pos:
                 self.update_orth_rgba()
@@ -340,6 +767,7 @@ class VolumeDataset(object):
     def set_colormap(self, map_name):
         """Set item's colormap."""
         self._colormap = map_name
+        self._reset_display()
         self.update_rgba()
         if self._cross_pos:
             self.update_orth_rgba()
@@ -355,6 +783,10 @@ class VolumeDataset(object):
                 self._visible = True
             else:
                 self._visible = False
+                # release rendered data, it is rendered again once shown
+                self.update_rgba()
+                if self._cross_pos:
+                    self.update_orth_rgba()
         else:
             raise ValueError("Input must a bool.")
 
@@ -368,120 +800,200 @@ class VolumeDataset(object):
 
     def get_rgba(self, index):
         """Get rgba array based on the index of the layer."""
-        return self._rgba_list[index]
+        rgba = self._rgba_cache.pop(index, None)
+        if rgba is None:
+            data = self._display_slice(2, index)
+            rgba = self._rendering_factory()(np.rot90(data))
+            if len(self._rgba_cache) >= RGBA_CACHE_SIZE:
+                self._rgba_cache.popitem(last=False)
+        self._rgba_cache[index] = rgba
+        return rgba
+
+    def peek_rgba(self, index):
+        """Return the rendered slice if it is available, otherwise None."""
+        rgba = self._rgba_cache.pop(index, None)
+        if rgba is not None:
+            self._rgba_cache[index] = rgba
+        return rgba
+
+    def slice_renderer(self, index):
+        """Return the version of the slice and a callable rendering it.
+
+        The callable can be run in a worker thread, the result should be
+        passed to store_rgba in the GUI thread.
+        """
+        version = self.get_rgba_version(index)
+
+        def render():
+            with self._render_lock:
+                data = self._display_slice(2, index)
+                f = self._rendering_factory()
+            return f(np.rot90(data))
+        return version, render
+
+    def store_rgba(self, index, version, rgba):
+        """Store a slice rendered in background if it is still up to date."""
+        if self.get_rgba_version(index) != version:
+            return False
+        self._rgba_cache.pop(index, None)
+        if len(self._rgba_cache) >= RGBA_CACHE_SIZE:
+            self._rgba_cache.popitem(last=False)
+        self._rgba_cache[index] = rgba
+        return True
+
+    def get_plane_version(self, plane):
+        """Return the version of rendered plane in orth view."""
+        return self._plane_version.get(plane)
 
     def get_sagital_rgba(self):
         """Return the sagital rgba value.."""
-        if self._sagital_rgba.tolist():
+        if self._sagital_rgba is None:
+            data = self._display_slice(0, self._cross_pos[0])
+            self._sagital_rgba = self._rendering_factory()(np.rot90(data[::-1]))
+        if self._sagital_rgba.size:
             return self._sagital_rgba
         else:
             return False
 
     def get_axial_rgba(self):
         """Return the axial rgba value."""
-        if self._axial_rgba.tolist():
+        if self._axial_rgba is None:
+            data = self._display_slice(2, self._cross_pos[2])
+            self._axial_rgba = self._rendering_factory()(np.rot90(data))
+        if self._axial_rgba.size:
             return self._axial_rgba
         else:
             return False
 
     def get_coronal_rgba(self):
         """Return the coronal rgba value.."""
-        if self._coronal_rgba.tolist():
+        if self._coronal_rgba is None:
+            data = self._display_slice(1, self._cross_pos[1])
+            self._coronal_rgba = self._rendering_factory()(np.rot90(data))
+        if self._coronal_rgba.size:
             return self._coronal_rgba
         else:
             return False
 
     def set_voxel(self, x, y, z, value, ignore=True):
         """Set value of the voxel whose coordinate is (x, y, z)."""
-        try:
-            if isinstance(y, list):
-                y_trans = [self._y_shift - item for item in y]
-            # check coordinate validation
-            coord_list = [(x[i], y_trans[i], z[i]) for i in range(len(x))]
-            coord_list = [c for c in coord_list if c[0]>=0 and 
-                                        c[0]<self.get_data_shape()[0] and
-                                        c[1]>=0 and
-                                        c[1]<self.get_data_shape()[1] and
-                                        c[2]>=0 and
-                                        c[2]<self.get_data_shape()[2]]
-            x = [c[0] for c in coord_list]
-            y_trans = [c[1] for c in coord_list]
-            z = [c[2] for c in coord_list]
-            if self.is_4d():
-                orig_data = self._data[y_trans, x, z, self._time_point]
-            else:
-                orig_data = self._data[y_trans, x, z]
-            if np.any(orig_data != 0) and not ignore:
-                force = QMessageBox.question(None, "Replace?",
-                        "Would you like to replace the original values?",
-                        QMessageBox.Yes,
-                        QMessageBox.No)
-                if force == QMessageBox.No:
-                    return
-            if self.is_4d():
-                self.undo_stack.push((x, y, z, self._data[y_trans, x, z,
-                                                          self._time_point]))
-                self._data[y_trans, x, z, self._time_point] = value
-            else:
-                self.undo_stack.push((x, y, z, self._data[y_trans, x, z]))
-                self._data[y_trans, x, z] = value
-            try:
-                for z_ in range(min(z), max(z)+1):
-                    self.update_rgba(z_)
-            except TypeError:
-                self.update_rgba(z)
-            if self._cross_pos:
-                self.update_orth_rgba()
-        except:
-            raise
-            print "Input coordinates are invalid."
+        # check coordinate validation
+        shape = self.get_data_shape()
+        x, y, z = [np.atleast_1d(np.asarray(c, dtype=np.intp))
+                   for c in (x, y, z)]
+        inside = ((x >= 0) & (x < shape[0]) & (y >= 0) & (y < shape[1]) &
+                  (z >= 0) & (z < shape[2]))
+        x, y, z = x[inside], y[inside], z[inside]
+        if not x.size:
+            return
+        data = self._current_data()
+        orig_data = data[x, y, z]
+        if np.any(orig_data != 0) and not ignore:
+            force = QMessageBox.question(None, "Replace?",
+                    "Would you like to replace the original values?",
+                    QMessageBox.Yes,
+                    QMessageBox.No)
+            if force == QMessageBox.No:
+                return
+        self._write_voxels(x, y, z, value)
+
+        # record each voxel once, with its value before the operation
+        index = np.ravel_multi_index((x, y, z), shape[:3])
+        index, first = np.unique(index, return_index=True)
+        data = self._current_data()
+        self.journal.record(_VoxelEdit(_compact_index(index),
+                                       orig_data[first],
+                                       data[x[first], y[first], z[first]]))
+
+    def _write_voxels(self, x, y, z, value):
+        """Write values into the data and mark the touched slices."""
+        self._unshare_data()
+        data = self._current_data()
+        data[x, y, z] = value
+        if self._frames is not None:
+            self._frames.mark_edited(self._time_point, data)
+        self._update_quantized_data((x, y, z))
+        for z_ in np.unique(z):
+            self.update_rgba(z_)
+        if self._cross_pos:
+            self.update_orth_rgba()
+
+    def _apply_edit(self, entry, undo):
+        """Apply an edit entry backward or forward, return the z indexes
+        of the modified slices."""
+        if isinstance(entry, _VoxelEdit):
+            x, y, z = np.unravel_index(entry.index,
+                                       self.get_data_shape()[:3])
+            self._write_voxels(x, y, z, entry.old if undo else entry.new)
+            return z
+        if undo:
+            entry.new = (self._data, self._frames, self._data_shared)
+            self._data, self._frames, self._data_shared = entry.old
+        else:
+            entry.old = (self._data, self._frames, self._data_shared)
+            self._data, self._frames, self._data_shared = entry.new
+        self._reset_display(data=True)
+        self.update_rgba()
+        if self._cross_pos:
+            self.update_orth_rgba()
+        return range(self.get_data_shape()[2])
 
-    def save2nifti(self, file_path):
+    def snapshot_nifti(self):
+        """Return a function which builds a Nifti1Image of current data.
+
+        The data is shared with the dataset copy-on-write, so the function
+        may be called in another thread while editing continues.
+        """
+        if self._frames is not None:
+            get_data = self._frames.snapshot().get_data
+        else:
+            data = self._data
+            get_data = lambda: data
+            self._data_shared = True
+        header = self._header.copy()
+        data_type = _nifti_datatype(self._data_dtype())
+        if data_type is not None:
+            self._header['datatype'] = data_type
+            header['datatype'] = data_type
+
+        def build():
+            data = get_data()
+            header['cal_max'] = data.max()
+            header['cal_min'] = 0
+            return nib.nifti1.Nifti1Image(data, None, header)
+        return build
+
+    def _data_dtype(self):
+        """Return the dtype of the data."""
+        if self._frames is not None:
+            return self._frames.get(self._time_point).dtype
+        return self._data.dtype
+
+    def _is_viewed(self):
+        """Return True if a read-only view of current data is alive."""
+        views = [ref for ref in self._data_views if ref() is not None]
+        self._data_views = views
+        return any(ref().base.data is self._data for ref in views)
+
+    def _unshare_data(self):
+        """Copy the data before it is modified if a snapshot, a duplicate or
+        a live read-only view shares it."""
+        if self._data_shared or self._is_viewed():
+            self._data = np.array(self._data)
+            self._data_shared = False
+
+    def _detach_source(self, file_path):
+        """Detach mapped data before the source file is overwritten."""
+        if self._img and self._is_mapped() and \
+           os.path.realpath(file_path) == \
+                os.path.realpath(self._img.get_filename()):
+            self._data = np.array(self._data)
+            self._data_shared = False
+
+    def save2nifti(self, file_path, progress=None):
         """Save to a nifti file."""
-        #Define nifti1 datatype codes
-        NIFTI_TYPE_UINT8 = 2  # unsigned char
-        NIFTI_TYPE_INT16 = 4  # signed short
-        NIFTI_TYPE_INT32 = 8  # signed int.
-        NIFTI_TYPE_FLOAT32 = 16  # 32 bit float.
-        NIFTI_TYPE_COMPLEX64 = 32  # 64 bit complex = 2 32 bit floats
-        NIFTI_TYPE_FLOAT64 = 64  # 64 bit float = double.
-        NIFTI_TYPE_RGB24 = 128  # 3 8 bit bytes.
-        NIFTI_TYPE_INT8 = 256  # signed char.
-        NIFTI_TYPE_UINT16 = 512  # unsigned short.
-        NIFTI_TYPE_UINT32 = 768  # unsigned int.
-        NIFTI_TYPE_INT64 = 1024  #signed long long.
-        NIFTI_TYPE_UINT64 = 1280  # unsigned long long.
-        NIFTI_TYPE_FLOAT128 = 1536  # 128 bit float = long double.
-        NIFTI_TYPE_COMPLEX128 = 1792  #128 bit complex = 2 64 bit floats.
-        NIFTI_TYPE_COMPLEX256 = 2048  # 256 bit complex = 2 128 bit floats
-        NIFTI_TYPE_RGBA32 = 2304  # 4 8 bit bytes.
-
-         #Detect the data type of the input data.
-        data_type = {
-            np.uint8: NIFTI_TYPE_UINT8,
-            np.uint16: NIFTI_TYPE_UINT16,
-            np.uint32: NIFTI_TYPE_UINT32,
-            np.float32: NIFTI_TYPE_FLOAT32,
-            np.int16: NIFTI_TYPE_INT16,
-            np.int32: NIFTI_TYPE_INT32,
-            np.int8: NIFTI_TYPE_INT8
-            }
-        if sys.maxint > 2 ** 32: # The platform is 64 bit
-            data_type[np.float128] = NIFTI_TYPE_FLOAT128
-            data_type[np.float64] = NIFTI_TYPE_FLOAT64
-            data_type[np.int64] = NIFTI_TYPE_INT64
-            data_type[np.uint64] = NIFTI_TYPE_UINT64
-            data_type[np.complex64] = NIFTI_TYPE_COMPLEX64
-            data_type[np.complex128] = NIFTI_TYPE_COMPLEX128
-            data_type[np.complex256] = NIFTI_TYPE_COMPLEX256
-
-        data = np.rot90(self._data, 3)
-        if data_type.has_key(data.dtype.type):
-            self._header['datatype'] = data_type[data.dtype.type]
-        self._header['cal_max'] = data.max()
-        self._header['cal_min'] = 0
-        image = nib.nifti1.Nifti1Image(data, None, self._header)
-        nib.nifti1.save(image, file_path)
+        self._detach_source(file_path)
+        save_nifti(self.snapshot_nifti()(), file_path, progress)
 
     def get_label_config(self):
         """Return the label config object."""
@@ -489,36 +1001,37 @@ class VolumeDataset(object):
 
     def undo_stack_not_empty(self):
         """Return status of the undo stack."""
-        return self.undo_stack.stack_not_empty()
+        return self.journal.can_undo()
 
     def redo_stack_not_empty(self):
-        return self.redo_stack.stack_not_empty()
+        return self.journal.can_redo()
 
     def undo(self):
         """Resume to the last step."""
-        if self.undo_stack:
-            voxel_set = self.undo_stack.pop()
-            self.set_voxel(*voxel_set, ignore=True)
-            self.redo_stack.push(self.undo_stack.pop())
-            return voxel_set[2]
-        return None
+        entry = self.journal.pop_undo()
+        if entry is None:
+            return None
+        return self._apply_edit(entry, undo=True)
 
     def redo(self):
         """Forward to the next step."""
-        if self.redo_stack:
-            voxel_set = self.redo_stack.pop()
-            self.set_voxel(*voxel_set, ignore=True)
-            return voxel_set[2]
-        return None
+        entry = self.journal.pop_redo()
+        if entry is None:
+            return None
+        return self._apply_edit(entry, undo=False)
+
+    def set_undo_budget(self, budget):
+        """Set the memory budget (in bytes) of the undo history."""
+        self.journal.set_budget(budget)
 
     def connect_undo(self, slot):
         """Connect the event to the undo slot.
         """
-        self.undo_stack.stack_changed.connect(slot)
+        self.journal.undo_changed.connect(slot)
 
     def connect_redo(self, slot):
         """Connect the event to the undo slot."""
-        self.redo_stack.stack_changed.connect(slot)
+        self.journal.redo_changed.connect(slot)
 
     def get_header(self):
         """Get the header of the data.."""
@@ -527,25 +1040,31 @@ class VolumeDataset(object):
     def get_value(self, xyz, time_course=False):
         """Get the valoue based on the given x,y,z cordinate."""
         if not time_course:
-           if self.is_4d():
-               return self._data[self._y_shift - xyz[1],
-                                 xyz[0], xyz[2], self._time_point]
-           else:
-               return self._data[self._y_shift - xyz[1], xyz[0], xyz[2]]
+           return self._current_data()[xyz[0], xyz[1], xyz[2]]
         else:
-            if self.is_4d() and self._img:
-               data = self.get_raw_data()
-               data = np.rot90(data)
-               return data[self._y_shift - xyz[1], xyz[0], xyz[2], :]
-            elif self.is_4d():
-               return self._data[self._y_shift - xyz[1], xyz[0], xyz[2], :]
-            else:
-               return self._data[self._y_shift - xyz[1], xyz[0], xyz[2]]
+           return self.get_time_course(xyz)
+
+    def get_time_course(self, xyz, radius=0):
+        """Return the time course of voxel xyz, or time courses of voxels
+        in a cube of the given radius around it.
+
+        Only the requested voxels are read, the whole data is never loaded.
+        """
+        if radius:
+            index = tuple(slice(max(c - radius, 0), c + radius + 1)
+                          for c in xyz[:3])
+        else:
+            index = tuple(xyz[:3])
+        if not self.is_4d():
+            return self._data[index]
+        if self._frames is not None:
+            return self._frames.time_course(index)
+        return np.array(self._data[index + (slice(None), )])
 
     def get_lthr_data(self):
         """Return whole data which low-thresholded."""
         # FIXME one time point or whole data
-        temp = self._data.copy()
+        temp = self.get_raw_data()
         temp[temp < self._view_min] = 0
         return temp
 
@@ -553,21 +1072,68 @@ class VolumeDataset(object):
         """
         Return the low threshold of the raw data.
         """
-        temp = self._data.copy()
+        temp = self.get_raw_data()
         temp[temp < self._view_min] = 0
-        return np.rot90(temp, 3)
+        return temp
 
     def get_raw_data(self):
         """Return the raw data."""
-        if self._img and self.is_4d():
-            temp = self._img.get_data(caching='unchanged')
-            temp = np.rot90(temp)
-            for tp in self._loaded_time_list:
-                temp[..., tp] = self._data[..., tp]
+        if self._frames is not None:
+            temp = self._frames.get_data()
         else:
             temp = self._data.copy()
 
-        return np.rot90(temp, 3)
+        return temp
+
+    def get_data_view(self):
+        """Return a read-only view of the whole data.
+
+        The view shares memory with the dataset copy-on-write, use
+        `get_raw_data` for a writable copy. The data is only copied if it
+        is edited while the view, or an array derived from it, is alive.
+        """
+        if self._frames is not None:
+            view = self._frames.get_data()
+        else:
+            view = np.asarray(_ViewBase(self._data))
+            self._data_views.append(weakref.ref(view))
+        view.flags.writeable = False
+        return view
+
+    def get_lthr_view(self):
+        """Return a read-only masked view of the low-thresholded data.
+
+        Voxels below the threshold are masked instead of set to 0, the data
+        itself is not copied. Use `filled(0)` to get the thresholded values.
+        """
+        return np.ma.masked_less(self.get_data_view(), self._view_min,
+                                 copy=False)
+
+    def set_raw_data(self, data):
+        """Replace the raw data and refresh the display.
+
+        The change is recorded as modified voxels if the new data has the
+        same shape, and few voxels are changed.
+        """
+        old = self._data
+        entry = _VolumeEdit((old, self._frames, self._data_shared),
+                            (data, None, False))
+        if self._frames is None and old.ndim == 3 and \
+           old.shape == data.shape and old.dtype == data.dtype:
+            index = np.flatnonzero(old != data)
+            if index.size * (4 + 2 * old.itemsize) < old.nbytes:
+                coords = np.unravel_index(index, old.shape)
+                entry = _VoxelEdit(_compact_index(index), old[coords],
+                                   data[coords])
+        self._data = data
+        self._data_shared = False
+        self._frames = None
+        if not isinstance(entry, _VoxelEdit) or entry.index.size:
+            self.journal.record(entry)
+        self._reset_display(data=True)
+        self.update_rgba()
+        if self._cross_pos:
+            self.update_orth_rgba()
 
     def get_value_label(self, value):
         """Return the label of the given value."""
@@ -583,26 +1149,24 @@ class VolumeDataset(object):
 
     def get_roi_coords(self, roi):
         """Return cordinates of the given roi."""
-        if self.is_4d():
-            data = self._data[..., self._time_point]
-        else:
-            data = self._data
-        coord = (data==roi).nonzero()
-        #return (data==roi).nonzero()
-        return (coord[1], self._y_shift - coord[0], coord[2])
+        return (self._current_data()==roi).nonzero()
 
     def get_coord_val(self, x, y, z):
         """Return value based on the given x,y,z cordinate."""
-        if self.is_4d():
-            #return self._data[y, x, z, self._time_point]
-            return self._data[self._y_shift - y, x, z, self._time_point]
-        else:
-            #return self._data[y, x, z]
-            return self._data[self._y_shift - y, x, z]
+        return self._current_data()[x, y, z]
 
     def duplicate(self):
-        """Return a duplicated image."""
-        dup_img = VolumeDataset(source=self.get_raw_data(),
+        """Return a duplicated image.
+
+        Both images share the data copy-on-write until one of them is
+        edited.
+        """
+        if self._frames is not None:
+            data = self._frames.get_data()
+        else:
+            data = self._data
+            self._data_shared = True
+        dup_img = VolumeDataset(source=data,
                                 label_config_center=self.get_label_config(),
                                 name=self.get_name()+'_duplicate',
                                 header=self.get_header(),
@@ -610,6 +1174,7 @@ class VolumeDataset(object):
                                 view_max=self.get_view_max(),
                                 alpha=self.get_alpha(),
                                 colormap=self.get_colormap())
+        dup_img._data_shared = data is self._data
         return dup_img
 
 
@@ -775,6 +1340,9 @@ class ScalarData(object):
         self._alpha = alpha
         self._visible = visible
         self._islabel = islabel
+        # the key and the GrowthHistory of the last surface region growing
+        # on the data
+        self._growth = None
 
     def get_data(self):
         return self._data
@@ -827,58 +1395,36 @@ class ScalarData(object):
     def is_label(self):
         return self._islabel
 
-    def save2nifti(self, file_path):
-        """Save to a nifti file."""
-        # Define nifti1 datatype codes
-        NIFTI_TYPE_UINT8 = 2  # unsigned char
-        NIFTI_TYPE_INT16 = 4  # signed short
-        NIFTI_TYPE_INT32 = 8  # signed int.
-        NIFTI_TYPE_FLOAT32 = 16  # 32 bit float.
-        NIFTI_TYPE_COMPLEX64 = 32  # 64 bit complex = 2 32 bit floats
-        NIFTI_TYPE_FLOAT64 = 64  # 64 bit float = double.
-        NIFTI_TYPE_RGB24 = 128  # 3 8 bit bytes.
-        NIFTI_TYPE_INT8 = 256  # signed char.
-        NIFTI_TYPE_UINT16 = 512  # unsigned short.
-        NIFTI_TYPE_UINT32 = 768  # unsigned int.
-        NIFTI_TYPE_INT64 = 1024  # signed long long.
-        NIFTI_TYPE_UINT64 = 1280  # unsigned long long.
-        NIFTI_TYPE_FLOAT128 = 1536  # 128 bit float = long double.
-        NIFTI_TYPE_COMPLEX128 = 1792  # 128 bit complex = 2 64 bit floats.
-        NIFTI_TYPE_COMPLEX256 = 2048  # 256 bit complex = 2 128 bit floats
-        NIFTI_TYPE_RGBA32 = 2304  # 4 8 bit bytes.
-
-        # Detect the data type of the input data.
-        data_type = {
-            np.uint8: NIFTI_TYPE_UINT8,
-            np.uint16: NIFTI_TYPE_UINT16,
-            np.uint32: NIFTI_TYPE_UINT32,
-            np.float32: NIFTI_TYPE_FLOAT32,
-            np.int16: NIFTI_TYPE_INT16,
-            np.int32: NIFTI_TYPE_INT32,
-            np.int8: NIFTI_TYPE_INT8
-            }
-        if sys.maxint > 2 ** 32:  # The platform is 64 bit
-            data_type[np.float128] = NIFTI_TYPE_FLOAT128
-            data_type[np.float64] = NIFTI_TYPE_FLOAT64
-            data_type[np.int64] = NIFTI_TYPE_INT64
-            data_type[np.uint64] = NIFTI_TYPE_UINT64
-            data_type[np.complex64] = NIFTI_TYPE_COMPLEX64
-            data_type[np.complex128] = NIFTI_TYPE_COMPLEX128
-            data_type[np.complex256] = NIFTI_TYPE_COMPLEX256
-
-        header = nib.Nifti1Header()
-        if self.data.shape[1] == 1:
-            new_shape = (self.data.shape[0], 1, 1)
-        else:
-            new_shape = (self.data.shape[0], 1, 1, self.data.shape[1])
-        data = self.data.reshape(new_shape)
+    def get_growth_history(self, key):
+        """Return the GrowthHistory stored with key, or None."""
+        if self._growth is not None and self._growth[0] == key:
+            return self._growth[1]
+        return None
 
-        if data.dtype.type in data_type:
-            header['datatype'] = data_type[data.dtype.type]
-        header['cal_max'] = data.max()
-        header['cal_min'] = data.min()
-        image = nib.Nifti1Image(data, None, header)
-        nib.nifti1.save(image, file_path)
+    def set_growth_history(self, key, history):
+        self._growth = (key, history)
+
+    def snapshot_nifti(self):
+        """Return a function which builds a Nifti1Image of current data."""
+        if self._data.shape[1] == 1:
+            new_shape = (self._data.shape[0], 1, 1)
+        else:
+            new_shape = (self._data.shape[0], 1, 1, self._data.shape[1])
+        data = self._data.reshape(new_shape).copy()
+
+        def build():
+            header = nib.Nifti1Header()
+            data_type = _nifti_datatype(data.dtype)
+            if data_type is not None:
+                header['datatype'] = data_type
+            header['cal_max'] = data.max()
+            header['cal_min'] = data.min()
+            return nib.Nifti1Image(data, None, header)
+        return build
+
+    def save2nifti(self, file_path, progress=None):
+        """Save to a nifti file."""
+        save_nifti(self.snapshot_nifti()(), file_path, progress)
 
     def save2label(self, file_path, hemi_coords):
         """
@@ -1028,11 +1574,13 @@ class Hemisphere(object):
         # automatically add the background array
         if self.bin_curv is not None:
             background = aq.array2qrgba(self.bin_curv, 255.0, 'gray', (-1, 1.5))
+            background = background[:, :3].copy()
         else:
-            background = np.ones((self.surfaces['inflated'].get_vertices_num(), 4)) * 127.5
-        rgba_list.insert(0, background)
+            background = np.empty((self.surfaces['inflated'].get_vertices_num(), 3),
+                                  dtype=np.uint8)
+            background.fill(127)
 
-        return aq.qcomposition(rgba_list)
+        return aq.blend_layers(background, rgba_list)
 
     def get_name(self):
         return self._name
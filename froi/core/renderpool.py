@@ -0,0 +1,107 @@
+# emacs: -*- mode: python; py-indent-offset: 4; indent-tabs-mode: nil -*-
+# vi: set ft=python sts=4 ts=4 sw=4 et:
+
+"""
+Background rendering of volume slices.
+"""
+
+from PyQt4.QtCore import *
+
+
+class _SliceRenderTask(QRunnable):
+    """Render one slice of a volume in a worker thread."""
+
+    def __init__(self, pool, volume, index, version, render):
+        super(_SliceRenderTask, self).__init__()
+        self._pool = pool
+        self._volume = volume
+        self._index = index
+        self._version = version
+        self._render = render
+
+    def run(self):
+        rgba, error = None, None
+        try:
+            rgba = self._render()
+        except Exception, e:
+            error = str(e)
+        self._pool.task_finished.emit(self._volume, self._index,
+                                      self._version, rgba, error)
+
+
+class RenderPool(QObject):
+    """Render slices of volumes concurrently in a thread pool.
+
+    Finished slices are stored back into the volume in the GUI thread and
+    announced with the `slice_rendered` signal. A failed slice is rendered
+    again up to MAX_RETRIES times, then announced with the `slice_failed`
+    signal; it is not requested again until its version changes.
+    """
+    # priority of slices in the viewport, and the others
+    HIGH_PRIORITY = 1
+    LOW_PRIORITY = 0
+    MAX_RETRIES = 2
+
+    slice_rendered = pyqtSignal(int)
+    # slice index, error message
+    slice_failed = pyqtSignal(int, object)
+    # emitted from worker threads, so delivered through the event loop
+    task_finished = pyqtSignal(object, int, object, object, object)
+
+    def __init__(self, parent=None):
+        super(RenderPool, self).__init__(parent)
+        self._pool = QThreadPool(self)
+        self._pending = set()
+        # (version, number of failures) of each (volume, index)
+        self._failures = {}
+        self.task_finished.connect(self._store)
+
+    def request(self, volume, index, priority=HIGH_PRIORITY):
+        """Schedule rendering the `index`th slice of the volume."""
+        version, render = volume.slice_renderer(index)
+        key = (id(volume), index, version)
+        if key in self._pending:
+            return
+        self._prune(volume)
+        failure = self._failures.get((id(volume), index))
+        if failure is not None and failure[1] > self.MAX_RETRIES:
+            return
+        self._pending.add(key)
+        task = _SliceRenderTask(self, volume, index, version, render)
+        self._pool.start(task, priority)
+
+    def _store(self, volume, index, version, rgba, error):
+        """Store a finished slice in the GUI thread."""
+        self._pending.discard((id(volume), index, version))
+        if error is not None:
+            failure = self._failures.get((id(volume), index))
+            if failure is not None and failure[0] == version:
+                failures = failure[1] + 1
+            else:
+                failures = 1
+            self._failures[(id(volume), index)] = (version, failures)
+            if failures <= self.MAX_RETRIES:
+                self.request(volume, index)
+            else:
+                self.slice_failed.emit(index, error)
+            return
+        self._failures.pop((id(volume), index), None)
+        if volume.store_rgba(index, version, rgba):
+            self.slice_rendered.emit(index)
+
+    def _prune(self, volume):
+        """Drop failures of slices of the volume which changed since."""
+        for key, (version, _) in self._failures.items():
+            if key[0] == id(volume) and \
+               version != volume.get_rgba_version(key[1]):
+                del self._failures[key]
+
+    def forget(self, volume):
+        """Drop the failures of a volume which is removed."""
+        for key in self._failures.keys():
+            if key[0] == id(volume):
+                del self._failures[key]
+
+    def wait(self):
+        """Wait until all scheduled slices are rendered."""
+        self._pool.waitForDone()
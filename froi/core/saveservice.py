@@ -0,0 +1,76 @@
+# emacs: -*- mode: python; py-indent-offset: 4; indent-tabs-mode: nil -*-
+# vi: set ft=python sts=4 ts=4 sw=4 et:
+
+"""
+Background saving of images.
+"""
+
+from PyQt4.QtCore import *
+
+from ..io.nifti_io import save_nifti
+
+
+class _SaveTask(QRunnable):
+    """Build and save one image in a worker thread."""
+
+    def __init__(self, service, build, file_path):
+        super(_SaveTask, self).__init__()
+        self._service = service
+        self._build = build
+        self._file_path = file_path
+        self._percent = -1
+
+    def _report(self, percent):
+        if percent != self._percent:
+            self._percent = percent
+            self._service.progress.emit(self._file_path, percent)
+
+    def run(self):
+        error = None
+        try:
+            save_nifti(self._build(), self._file_path, self._report)
+        except Exception, e:
+            error = str(e)
+        self._service.task_finished.emit(self._file_path, error)
+
+
+class SaveService(QObject):
+    """Save snapshots of datasets as NIfTI files in a background thread.
+
+    The data is taken copy-on-write when saving is requested, so editing
+    continues while the file is compressed and written. Progress and
+    completion are reported with the `progress` and `finished` signals.
+    """
+    # file path, percentage of data written
+    progress = pyqtSignal(object, int)
+    # file path, error message or None
+    finished = pyqtSignal(object, object)
+    # emitted from worker threads, so delivered through the event loop
+    task_finished = pyqtSignal(object, object)
+
+    def __init__(self, parent=None):
+        super(SaveService, self).__init__(parent)
+        self._pool = QThreadPool(self)
+        # files are saved one by one, each of them is compressed in parallel
+        self._pool.setMaxThreadCount(1)
+        self._pending = []
+        self.task_finished.connect(self._finish)
+
+    def save(self, dataset, file_path):
+        """Schedule saving the dataset to file_path."""
+        build = dataset.snapshot_nifti()
+        self._pending.append(file_path)
+        self._pool.start(_SaveTask(self, build, file_path))
+
+    def _finish(self, file_path, error):
+        """Announce a finished file in the GUI thread."""
+        self._pending.remove(file_path)
+        self.finished.emit(file_path, error)
+
+    def is_saving(self):
+        """Return True if some files are not saved yet."""
+        return bool(self._pending)
+
+    def wait(self):
+        """Wait until all scheduled files are saved."""
+        self._pool.waitForDone()
@@ -0,0 +1,178 @@
+# emacs: -*- mode: python; py-indent-offset: 4; indent-tabs-mode: nil -*-
+# vi: set ft=python sts=4 ts=4 sw=4 et:
+
+"""
+Writing NIfTI images with parallel gzip compression.
+
+A gzip stream may consist of several members, each of them an independent
+gzip file. The data is split into blocks which are compressed concurrently
+and written as consecutive members, the result is read as a single stream
+by gzip and nibabel.
+"""
+
+import os
+import zlib
+import struct
+from collections import deque
+from multiprocessing import cpu_count
+from multiprocessing.pool import ThreadPool
+
+import nibabel as nib
+
+# size of the uncompressed blocks compressed by each thread
+GZIP_BLOCK_SIZE = 4 * 1024 ** 2
+# nibabel compresses with the fastest level as well
+GZIP_LEVEL = 1
+
+# member header: magic, deflate, no flags, no mtime, no extra flags, unknown OS
+_GZIP_HEADER = '\x1f\x8b\x08\x00\x00\x00\x00\x00\x00\xff'
+
+
+def _gzip_member(block, level):
+    """Compress a block into a complete gzip member."""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS)
+    body = compressor.compress(block) + compressor.flush()
+    trailer = struct.pack('<II', zlib.crc32(block) & 0xffffffff,
+                          len(block) & 0xffffffff)
+    return len(block), _GZIP_HEADER + body + trailer
+
+
+class ParallelGzipFile(object):
+    """A write-only file object compressing blocks in a thread pool.
+
+    Parameters
+    ----------
+    fileobj : file
+        The file the gzip members are written to.
+    level : int
+        Compression level, 1 to 9.
+    n_threads : int or None
+        Number of compressing threads, default is the number of CPUs.
+    progress : callable or None
+        Called with the number of uncompressed bytes written so far, each
+        time a member is written.
+    """
+    def __init__(self, fileobj, level=GZIP_LEVEL, n_threads=None,
+                 progress=None, block_size=GZIP_BLOCK_SIZE):
+        self._fileobj = fileobj
+        self._level = level
+        self._n_threads = n_threads or cpu_count()
+        self._progress = progress
+        self._block_size = block_size
+        self._pool = ThreadPool(self._n_threads)
+        self._buffer = []
+        self._buffered = 0
+        self._pending = deque()
+        self._offset = 0
+        self._written = 0
+        self.closed = False
+
+    def write(self, data):
+        if isinstance(data, memoryview):
+            data = data.tobytes()
+        self._buffer.append(data)
+        self._buffered += len(data)
+        self._offset += len(data)
+        if self._buffered >= self._block_size:
+            self._submit()
+
+    def read(self, size=-1):
+        raise IOError('The gzip stream is opened for writing only.')
+
+    def tell(self):
+        return self._offset
+
+    def seek(self, offset, whence=0):
+        """Seek forward by writing zeros, the stream can not rewind."""
+        if whence == 1:
+            offset += self._offset
+        elif whence != 0:
+            raise IOError('Can not seek from the end of a gzip stream.')
+        if offset < self._offset:
+            raise IOError('Can not seek backward in a gzip stream.')
+        if offset > self._offset:
+            self.write('\x00' * (offset - self._offset))
+
+    def flush(self):
+        pass
+
+    def _submit(self):
+        """Send the buffered data to the pool as a new block."""
+        block = ''.join(self._buffer)
+        self._buffer = []
+        self._buffered = 0
+        self._pending.append(self._pool.apply_async(_gzip_member,
+                                                    (block, self._level)))
+        # write finished members in order, and keep a bounded number of
+        # blocks in memory
+        while self._pending and (self._pending[0].ready() or
+                                 len(self._pending) > 2 * self._n_threads):
+            self._write_member(self._pending.popleft().get())
+
+    def _write_member(self, result):
+        size, member = result
+        self._fileobj.write(member)
+        self._written += size
+        if self._progress is not None:
+            self._progress(self._written)
+
+    def close(self):
+        """Compress the remaining data and wait for all members."""
+        if self.closed:
+            return
+        if self._buffered or not self._written and not self._pending:
+            self._submit()
+        try:
+            while self._pending:
+                self._write_member(self._pending.popleft().get())
+        finally:
+            self._pool.close()
+            self._pool.join()
+            self.closed = True
+
+
+def save_nifti(image, file_path, progress=None, n_threads=None):
+    """Save a NIfTI image, compressed in parallel if the file ends with
+    `.gz`.
+
+    The image is written to a temporary file which replaces `file_path`
+    once complete, so an image read from `file_path` stays intact while
+    saving.
+
+    Parameters
+    ----------
+    image : Nifti1Image
+    file_path : string
+    progress : callable or None
+        Called with the percentage of data written.
+    n_threads : int or None
+        Number of compressing threads.
+    """
+    total = image.header.get_data_offset() + \
+            image.header.get_data_dtype().itemsize * \
+            int(reduce(lambda x, y: x * y, image.shape, 1))
+    if progress is None:
+        report = None
+    else:
+        report = lambda n: progress(min(100, 100 * n // max(total, 1)))
+
+    tmp_path = file_path + '.part'
+    try:
+        with open(tmp_path, 'wb') as f:
+            if file_path.endswith('.gz'):
+                fileobj = ParallelGzipFile(f, n_threads=n_threads,
+                                           progress=report)
+            else:
+                fileobj = f
+            image.to_file_map({'image': nib.FileHolder(fileobj=fileobj)})
+            if fileobj is not f:
+                fileobj.close()
+        if os.name == 'nt' and os.path.exists(file_path):
+            os.remove(file_path)
+        os.rename(tmp_path, file_path)
+    except:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    if progress is not None:
+        progress(100)
@@ -0,0 +1,197 @@
+# emacs: -*- mode: python; py-indent-offset: 4; indent-tabs-mode: nil -*-
+# vi: set ft=python sts=4 ts=4 sw=4 et:
+
+"""
+Decompressed shadow copies of gzipped NIfTI files.
+
+A `.nii.gz` file has to be inflated as a whole each time it is opened, and
+gzip streams have no random access. The shadow cache keeps an uncompressed
+`.nii` copy of each opened file, which can be memory-mapped, so reopening
+the same image is nearly free. Copies are keyed by the path, modification
+time and size of the source file, and the least recently used ones are
+removed once the cache grows beyond its size budget.
+
+The cache is disabled by default, enable it with `enable()`. A file which
+fails to be copied is reported once and loaded directly, it is not copied
+again until it changes.
+"""
+
+import os
+import re
+import gzip
+import shutil
+import hashlib
+import tempfile
+
+# default size budget (in bytes) of the shadow cache
+SHADOW_CACHE_BUDGET = 4 * 1024 ** 3
+# size of the blocks copied while inflating a file
+_BLOCK_SIZE = 16 * 1024 ** 2
+
+_cache = None
+
+
+class ShadowCache(object):
+    """A size-bounded directory of decompressed NIfTI files.
+
+    Parameters
+    ----------
+    cache_dir : string or None
+    budget : int
+        Size budget in bytes.
+    on_failure : callable or None
+        Called with the file path and the error message when a shadow copy
+        fails, the failure is printed if it is None.
+    """
+
+    def __init__(self, cache_dir=None, budget=SHADOW_CACHE_BUDGET,
+                 on_failure=None):
+        if cache_dir is None:
+            cache_dir = os.path.expanduser('~/.froi_cache')
+        self._cache_dir = cache_dir
+        self._budget = budget
+        self._on_failure = on_failure
+        # shadow paths of the file states which failed to be copied
+        self._failed = set()
+        if not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+
+    def get_cache_dir(self):
+        """Return the cache directory."""
+        return self._cache_dir
+
+    def get_budget(self):
+        """Return the size budget in bytes."""
+        return self._budget
+
+    def set_budget(self, budget):
+        """Set the size budget in bytes and shrink the cache to fit in."""
+        self._budget = budget
+        self._evict()
+
+    def _entry_path(self, file_path):
+        """Return the shadow path of a file in its current state."""
+        stat = os.stat(file_path)
+        key = '%s:%r:%d' % (os.path.realpath(file_path), stat.st_mtime,
+                            stat.st_size)
+        basename = re.sub(r'\.gz$', '', os.path.basename(file_path))
+        return os.path.join(self._cache_dir,
+                            hashlib.sha1(key).hexdigest(), basename)
+
+    def shadow(self, file_path):
+        """Return the path of the uncompressed copy of `file_path`.
+
+        The copy is made on the first call. Files other than `.nii.gz`, and
+        files which can not be copied, are returned as is.
+        """
+        if not file_path.endswith('.nii.gz'):
+            return file_path
+        try:
+            entry = self._entry_path(file_path)
+        except OSError:
+            # a missing file is reported once it is loaded
+            return file_path
+        if entry in self._failed:
+            return file_path
+        if os.path.exists(entry):
+            # mark the entry as recently used
+            os.utime(entry, None)
+            return entry
+
+        try:
+            self._copy(file_path, entry)
+        except (IOError, OSError), e:
+            self._failed.add(entry)
+            if self._on_failure is None:
+                print 'Shadow copy of %s failed: %s' % (file_path, e)
+            else:
+                self._on_failure(file_path, str(e))
+            return file_path
+        self._evict(keep=entry)
+        return entry
+
+    def _copy(self, file_path, entry):
+        """Inflate file_path into the shadow path entry."""
+        entry_dir = os.path.dirname(entry)
+        if not os.path.isdir(entry_dir):
+            os.makedirs(entry_dir)
+        # inflate to a temporary file first, so an interrupted copy is
+        # never taken for a complete one
+        fd, tmp_path = tempfile.mkstemp(suffix='.tmp', dir=entry_dir)
+        try:
+            with os.fdopen(fd, 'wb') as dst:
+                src = gzip.open(file_path, 'rb')
+                try:
+                    shutil.copyfileobj(src, dst, _BLOCK_SIZE)
+                finally:
+                    src.close()
+            os.rename(tmp_path, entry)
+        except:
+            os.remove(tmp_path)
+            raise
+
+    def _entries(self):
+        """Return (mtime, size, path) of all entries in the cache."""
+        entries = []
+        for name in os.listdir(self._cache_dir):
+            entry_dir = os.path.join(self._cache_dir, name)
+            if not os.path.isdir(entry_dir):
+                continue
+            for f in os.listdir(entry_dir):
+                if f.endswith('.nii'):
+                    path = os.path.join(entry_dir, f)
+                    stat = os.stat(path)
+                    entries.append((stat.st_mtime, stat.st_size, path))
+        return entries
+
+    def _evict(self, keep=None):
+        """Remove least recently used entries until the budget is met."""
+        entries = sorted(self._entries())
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= self._budget:
+                break
+            if path == keep:
+                continue
+            try:
+                # images which are still memory-mapped stay readable on
+                # posix systems
+                shutil.rmtree(os.path.dirname(path))
+            except OSError:
+                continue
+            total -= size
+
+    def clear(self):
+        """Remove all entries, and forget failed copies."""
+        self._failed.clear()
+        for _, _, path in self._entries():
+            shutil.rmtree(os.path.dirname(path), ignore_errors=True)
+
+
+def enable(cache_dir=None, budget=SHADOW_CACHE_BUDGET, on_failure=None):
+    """Enable the shadow cache used by `shadow_path()`."""
+    global _cache
+    _cache = ShadowCache(cache_dir, budget, on_failure)
+    return _cache
+
+
+def disable():
+    """Disable the shadow cache."""
+    global _cache
+    _cache = None
+
+
+def get_cache():
+    """Return the enabled shadow cache, or None."""
+    return _cache
+
+
+def shadow_path(file_path):
+    """Return the path to load `file_path` from.
+
+    This is the uncompressed shadow copy of the file if the cache is
+    enabled, or the file itself.
+    """
+    if _cache is None:
+        return file_path
+    return _cache.shadow(file_path)
@@ -13,8 +13,10 @@ from PyQt4.QtGui import *
 
 from version import __version__
 from core.labelconfig import LabelConfig
+from core.saveservice import SaveService
 from algorithm.tools import get_curr_hemi
 from utils import get_icon_dir
+from io import shadow_cache
 from widgets.listwidget import LayerView
 from widgets.gridwidget import GridView
 from widgets.orthwidget import OrthView
@@ -25,13 +27,9 @@ from widgets.intersectdialog import IntersectDialog
 from widgets.localmaxdialog import LocalMaxDialog
 from widgets.no_gui_tools import inverse_image, gen_label_color
 from widgets.smoothingdialog import SmoothingDialog
-from widgets.growdialog import GrowDialog
-from widgets.watersheddialog import WatershedDialog
-from widgets.slicdialog import SLICDialog
 from widgets.clusterdialog import ClusterDialog
 from widgets.regularroidialog import RegularROIDialog
 from widgets.regularroifromcsvfiledialog import RegularROIFromCSVFileDialog
-from widgets.roi2gwmidialog import Roi2gwmiDialog
 from widgets.no_gui_tools import edge_detection
 from widgets.roimergedialog import ROIMergeDialog
 from widgets.opendialog import OpenDialog
@@ -48,9 +46,7 @@ from widgets.voxelstatsdialog import VoxelStatsDialog
 from widgets.registervolume import RegisterVolumeDialog
 from widgets.treemodel import TreeModel
 from widgets.surfacetreewidget import SurfaceTreeView
-from widgets.surfaceview import SurfaceView
 from widgets.scribingdialog import ScribingDialog
-from widgets.surfaceRGdialog import SurfaceRGDialog
 
 
 class BpMainWindow(QMainWindow):
@@ -96,6 +92,11 @@ class BpMainWindow(QMainWindow):
         self.list_view = None
         self.surface_tree_view = None
 
+        # images are compressed and written in background
+        self._save_service = SaveService(self)
+        self._save_service.progress.connect(self._save_progress)
+        self._save_service.finished.connect(self._save_finished)
+
     def config_extra_settings(self, data_dir):
         """Set data directory and update some configurations."""
         # load data directory configuration
@@ -145,6 +146,11 @@ class BpMainWindow(QMainWindow):
             self.move(self.window_xpos, self.window_ypos)
             self.default_orth_scale_factor = float(self.orth_scale_factor) / 100
             self.default_grid_scale_factor = float(self.grid_scale_factor) / 100
+            if config.has_section('shadow_cache'):
+                # sizes of the shadow cache are given in MB
+                shadow_cache.enable(config.get('shadow_cache', 'path'),
+                                    config.getint('shadow_cache', 'size') *
+                                    1024 ** 2, self._shadow_copy_failed)
         else:
             # self.setWindowState(Qt.WindowMaximized)
             self.setMinimumSize(1000, 800)
@@ -197,6 +203,9 @@ class BpMainWindow(QMainWindow):
     def closeEvent(self, e):
         if self.is_save_configure:
            self._save_configuration()
+        if self._save_service.is_saving():
+            self.statusBar().showMessage('Waiting for images to be saved...')
+            self._save_service.wait()
         e.accept()
 
     def _create_actions(self):
@@ -555,6 +564,7 @@ class BpMainWindow(QMainWindow):
         self._actions['surf_region_grow'].setEnabled(False)
 
     def _surf_rg(self):
+        from widgets.surfaceRGdialog import SurfaceRGDialog
         new_dialog = SurfaceRGDialog(self.surface_model,
                                      self.surface_tree_view_control,
                                      self.surface_view, self)
@@ -725,6 +735,7 @@ class BpMainWindow(QMainWindow):
                 self.model.rowsInserted.connect(self._update_remove_image)
                 self.model.undo_stack_changed.connect(self._update_undo)
                 self.model.redo_stack_changed.connect(self._update_redo)
+                self.model.render_failed.connect(self._render_failed)
                 # set current volume index
                 self.list_view.setCurrentIndex(self.model.index(0))
                 # set crosshair as the center of the data
@@ -816,6 +827,8 @@ class BpMainWindow(QMainWindow):
 
             # Initial surface_view
             if not self.surface_view:
+                # mayavi is loaded with the first surface
+                from widgets.surfaceview import SurfaceView
                 self.surface_view = SurfaceView()
                 self.surface_view.set_model(self.surface_model)
 
@@ -989,7 +1002,32 @@ class BpMainWindow(QMainWindow):
                 coords = hemi.surf['inflated'].get_coords()
                 overlay.save2label(path, coords)
             else:
-                overlay.save2nifti(path)
+                self._save_service.save(overlay, path)
+
+    def _save_progress(self, path, percent):
+        """Show progress of saving an image."""
+        self.statusBar().showMessage('Saving %s ... %d%%' %
+                                     (os.path.basename(path), percent))
+
+    def _save_finished(self, path, error):
+        """Report the end of saving an image."""
+        if error is None:
+            self.statusBar().showMessage('Saved %s' % path, 5000)
+        else:
+            self.statusBar().clearMessage()
+            QMessageBox.warning(self, 'Error',
+                                'Failed to save %s: %s' % (path, error),
+                                QMessageBox.Yes)
+
+    def _shadow_copy_failed(self, path, error):
+        """Report an image which is loaded without its shadow copy."""
+        self.statusBar().showMessage('Shadow copy of %s failed: %s' %
+                                     (os.path.basename(path), error), 5000)
+
+    def _render_failed(self, index, error):
+        """Report a slice which failed to render."""
+        self.statusBar().showMessage('Failed to render slice %d: %s' %
+                                     (index, error), 5000)
 
     def _close_display(self):
         """Close current display."""
@@ -1284,6 +1322,7 @@ class BpMainWindow(QMainWindow):
 
     def _r2i(self):
         """ROI to gwmi dialog."""
+        from widgets.roi2gwmidialog import Roi2gwmiDialog
         new_dialog = Roi2gwmiDialog(self.model)
         new_dialog.exec_()
 
@@ -1440,16 +1479,19 @@ class BpMainWindow(QMainWindow):
 
     def _region_grow(self):
         """Image region grow dialog."""
+        from widgets.growdialog import GrowDialog
         new_dialog = GrowDialog(self.model, self)
         new_dialog.exec_()
 
     def _watershed(self):
         """Image watershed dialog."""
+        from widgets.watersheddialog import WatershedDialog
         new_dialog = WatershedDialog(self.model, self)
         new_dialog.exec_()
 
     def _slic(self):
         """Image supervoxel segmentation dialog."""
+        from widgets.slicdialog import SLICDialog
         new_dialog = SLICDialog(self.model, self)
         new_dialog.exec_()
 
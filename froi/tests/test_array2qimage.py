@@ -0,0 +1,262 @@
+# emacs: -*- mode: python; py-indent-offset: 4; indent-tabs-mode: nil -*-
+# vi: set ft=python sts=4 ts=4 sw=4 et:
+
+import numpy as np
+from numpy.testing import assert_array_equal
+
+from froi.algorithm import array2qimage as aq
+from froi.algorithm.tools import normalize_arr
+
+
+def _baseline_normalize255(array, normalize, scale_length=255.0):
+    if not normalize:
+        return array
+    new_arr = normalize_arr(array, normalize, scale_length)
+    new_arr[np.logical_and(new_arr > 0, new_arr < 1)] = 1
+    return np.round(new_arr)
+
+
+def _baseline_clip_window(array, normalize):
+    new_array = array.clip(0, array.max())
+    new_array[array < normalize[0]] = 0
+    new_array[array > normalize[1]] = 0
+    return new_array
+
+
+def _baseline_colormap(array, alpha, colormap, normalize):
+    """The former per-pixel conversion of continuous colormaps."""
+    array = _baseline_normalize255(array, normalize)
+    on = array.clip(0, 1)
+    new_array = np.zeros(array.shape + (4, ), dtype=np.uint8)
+    if colormap == 'gray':
+        new_array[..., 0] = array
+        new_array[..., 1] = array
+        new_array[..., 2] = array
+    elif colormap == 'red2yellow':
+        new_array[..., 0] = 255 * on
+        new_array[..., 1] = array
+    elif colormap == 'blue2cyanblue':
+        new_array[..., 1] = array
+        new_array[..., 2] = 255 * on
+    elif colormap == 'red':
+        new_array[..., 0] = 255 * on
+    else:
+        if colormap == 'rocket':
+            from froi import colormap as surfer_cm
+            cmap = surfer_cm.rocket
+        else:
+            from matplotlib import cm as mpl_cm
+            cmap = mpl_cm.get_cmap(colormap)
+        lut_255 = (cmap(np.linspace(0, 1, 256)) * 255).astype(np.int)
+        for i in range(array.shape[0]):
+            for j in range(array.shape[1]):
+                new_array[i, j, :] = lut_255[int(array[i, j])]
+    new_array[..., 3] = alpha * on
+    return new_array
+
+
+def _baseline_rainbow(array, alpha, normalize):
+    new_array = _baseline_clip_window(array, normalize)
+    raw = _baseline_normalize255(new_array, normalize, scale_length=100000.0)
+    add_ = new_array.clip(0, 1)
+    rgba = np.zeros(new_array.shape + (4, ), dtype=np.uint8)
+    for channel, period in enumerate((41, 61, 83)):
+        rgba[..., channel] = _baseline_normalize255(raw % period, (0, period),
+                                                    scale_length=254.0) + add_
+    rgba[..., 3] = alpha * np.sum(rgba, rgba.ndim - 1).clip(0, 1)
+    return rgba
+
+
+def _baseline_label(array, alpha, colormap, normalize):
+    new_array = _baseline_clip_window(array, normalize)
+    rgba = np.zeros(new_array.shape + (4, ), dtype=np.uint8)
+    for value in colormap:
+        rgba[new_array == int(value)] = list(colormap[value]) + [0]
+    rgba[..., 3] = alpha * np.sum(rgba, rgba.ndim - 1).clip(0, 1)
+    return rgba
+
+
+def test_colormap_lut_matches_baseline():
+    rng = np.random.RandomState(0)
+    array = rng.randn(24, 20) * 40 + 10
+    for colormap in ('gray', 'red2yellow', 'blue2cyanblue', 'red', 'jet',
+                     'rocket'):
+        for alpha in (255, 100):
+            for normalize in ((-20.0, 60.0), (0.0, 1000.0)):
+                assert_array_equal(aq.array2qrgba(array, alpha, colormap,
+                                                  normalize),
+                                   _baseline_colormap(array, alpha, colormap,
+                                                      normalize))
+
+
+def test_rainbow_lut_matches_baseline():
+    rng = np.random.RandomState(1)
+    array = rng.rand(30, 30) * 3 - 0.5
+    for alpha in (255, 100):
+        for normalize in ((0.0, 2.0), (0.3, 0.9)):
+            assert_array_equal(aq.array2qrgba(array, alpha, 'rainbow',
+                                              normalize),
+                               _baseline_rainbow(array, alpha, normalize))
+
+
+def test_label_lut_matches_baseline():
+    rng = np.random.RandomState(2)
+    colormap = {1: (255, 0, 0), 2: (0, 255, 0), 7: (10, 20, 30),
+                70000: (1, 2, 3)}
+    array = rng.randint(0, 9, (20, 20)).astype(np.float)
+    array[0, :4] = [70000, 2.5, -1, 100000]
+    for alpha in (255, 60):
+        for normalize in ((0.0, 200000.0), (2.0, 8.0)):
+            assert_array_equal(aq.array2qrgba(array, alpha, colormap,
+                                              normalize),
+                               _baseline_label(array, alpha, colormap,
+                                               normalize))
+
+
+def test_nan_is_transparent_in_colormaps():
+    array = np.linspace(0, 1, 16).reshape(4, 4)
+    array[1, 2] = np.nan
+    for colormap in ('gray', 'jet'):
+        rgba = aq.array2qrgba(array, 255, colormap, (0.0, 1.0))
+        assert rgba[1, 2, 3] == 0
+
+
+def _window_colors(data, window, colormap='gray'):
+    """Return the colors of data through quantization and directly."""
+    qrange = aq.quantize_range(data)
+    lut = aq.window_lut(colormap, 255, window, qrange)
+    quantized = aq.apply_lut(lut, aq.quantize(data, qrange))
+    direct = np.array([aq.array2qrgba(data[..., k], 255, colormap, window)
+                       for k in range(data.shape[-1])]).transpose(1, 2, 0, 3)
+    return quantized, direct
+
+
+def _assert_close_colors(data, window):
+    """Check the colors through quantization against the direct ones.
+
+    Levels may only fall on the other side of a color boundary, or of a
+    window end if the value is within a level step of it.
+    """
+    quantized, direct = _window_colors(data, window)
+    diff = np.abs(quantized.astype(int) - direct.astype(int)).max(axis=-1)
+    values, levels = aq.quantize_range(data)
+    edge = np.zeros(data.shape, dtype=np.bool)
+    for end in window:
+        level = np.interp(end, values, levels)
+        step = np.interp(level + 1, levels, values) - end
+        edge |= np.abs(data - end) < step
+    assert edge.mean() < 0.01
+    assert diff[~edge].max() <= 1
+    return quantized
+
+
+def test_integer_data_is_exact():
+    data = np.arange(-100, 140, dtype=np.int16).reshape(4, 6, 10)
+    qrange = aq.quantize_range(data)
+    assert_array_equal(qrange[0], [-100, 139])
+    assert_array_equal(aq.quantize(data, qrange), data + 100)
+
+
+def test_full_range_window():
+    rng = np.random.RandomState(0)
+    data = rng.randn(16, 16, 4) * 10
+    _assert_close_colors(data, (-5.0, 20.0))
+
+
+def test_narrow_window_on_wide_range():
+    rng = np.random.RandomState(0)
+    data = rng.rand(16, 16, 4)
+    # a few extreme voxels widen the range of a stat map
+    data[0, 0, 0] = 1e5
+    data[1, 1, 1] = -1e5
+    quantized = _assert_close_colors(data, (0.2, 0.8))
+    # the window shows all colors of the table, not a few bands
+    assert len(np.unique(quantized[..., 0])) > 200
+
+
+def test_nan_is_transparent():
+    data = np.linspace(0, 1, 64).reshape(4, 4, 4)
+    data[2, 2, 2] = np.nan
+    qrange = aq.quantize_range(data)
+    qdata = aq.quantize(data, qrange)
+    assert qdata[2, 2, 2] == aq.NAN_LEVEL
+    assert qdata[~np.isnan(data)].max() < aq.NAN_LEVEL
+    lut = aq.window_lut('gray', 255, (0.0, 1.0), qrange)
+    assert_array_equal(aq.apply_lut(lut, qdata)[2, 2, 2], [0, 0, 0, 0])
+
+
+def test_quantize_is_monotonic():
+    rng = np.random.RandomState(1)
+    data = np.exp(rng.randn(32, 32, 64) * 3)
+    qrange = aq.quantize_range(data)
+    values = np.sort(data.ravel())
+    levels = aq.quantize(values, qrange).astype(int)
+    assert np.all(np.diff(levels) >= 0)
+    assert levels[0] == 0 and levels[-1] == aq.NAN_LEVEL - 1
+    # values out of the range are clipped to the end levels
+    assert_array_equal(aq.quantize(np.array([-1.0, 1e10]), qrange),
+                       [0, aq.NAN_LEVEL - 1])
+
+
+def _baseline_qcomposition(array_list):
+    """The former composition in int64 with floor division."""
+    result = np.array(array_list[0][..., :3], dtype=np.int64)
+    for item in array_list[1:]:
+        item = item.astype(np.int64)
+        alpha = item[..., 3:]
+        result = (item[..., :3] * alpha + result * (255 - alpha)) // 255
+    return result.astype(np.uint8)
+
+
+def _random_layers(shape, n, seed=0):
+    rng = np.random.RandomState(seed)
+    layers = []
+    for i in range(n):
+        layer = rng.randint(0, 256, shape + (4, )).astype(np.uint8)
+        # transparent and opaque pixels are common in rendered slices
+        layer[..., 3][layer[..., 3] < 60] = 0
+        layer[..., 3][layer[..., 3] > 200] = 255
+        layers.append(layer)
+    return layers
+
+
+def test_blend_layers_matches_baseline():
+    for shape in ((17, 23), (50, )):
+        layers = _random_layers(shape, 4)
+        assert_array_equal(aq.qcomposition(layers),
+                           _baseline_qcomposition(layers))
+        # the former float blending truncated, and may lose one unit
+        dest = layers[0][..., :3].copy()
+        expected = dest.astype(np.float)
+        for layer in layers[1:]:
+            alpha = layer[..., 3:] / 255.0
+            expected = np.uint8(layer[..., :3] * alpha +
+                                expected * (1 - alpha)).astype(np.float)
+            aq.composition(dest, layer)
+        assert np.abs(dest - expected).max() <= 1
+
+
+def test_blend_layers_skips_transparent_layers():
+    layers = _random_layers((16, 16), 2, seed=1)
+    dest = np.zeros((16, 16, 3), dtype=np.uint8)
+    aq.blend_layers(dest, layers)
+    transparent = layers[1].copy()
+    transparent[..., 3] = 0
+    # a transparent layer is not blended, whatever its shape
+    bad_layer = np.zeros((3, 3, 4), dtype=np.uint8)
+    result = np.zeros((16, 16, 3), dtype=np.uint8)
+    returned = aq.blend_layers(result, [layers[0], transparent, bad_layer,
+                                        layers[1]])
+    assert returned is result
+    assert_array_equal(result, dest)
+
+
+def test_blend_layers_under_opaque_layer():
+    layers = _random_layers((16, 16), 2, seed=2)
+    layers[0][..., 3] = 255
+    dest = np.zeros((16, 16, 3), dtype=np.uint8)
+    expected = _baseline_qcomposition([np.zeros((16, 16, 4), np.uint8)] +
+                                      layers)
+    # the layer below the opaque one is never read, whatever its shape
+    bad_layer = np.zeros((3, 3, 4), dtype=np.uint8)
+    assert_array_equal(aq.blend_layers(dest, [bad_layer] + layers), expected)
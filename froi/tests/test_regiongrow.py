@@ -0,0 +1,343 @@
+# emacs: -*- mode: python; py-indent-offset: 4; indent-tabs-mode: nil -*-
+# vi: set ft=python sts=4 ts=4 sw=4 et:
+
+import os
+import shutil
+import tempfile
+
+import numpy as np
+import nibabel as nib
+from numpy.testing import assert_array_equal, assert_allclose
+from scipy import ndimage
+
+from froi.core.dataobject import GeometryData
+from froi.algorithm.meshtool import get_n_ring_neighbor
+from froi.algorithm.regiongrow import neighbor_offsets, region_growing, \
+     seeded_region_growing, Region, EvolvingRegion, GraphRegion, RegionGrow
+
+
+def _smooth_volume(shape=(16, 16, 16), seed=0):
+    rng = np.random.RandomState(seed)
+    return ndimage.gaussian_filter(rng.rand(*shape), 1.5)
+
+
+def _reference_growing(image, coordinate, number, connectivity=6):
+    """Add the neighbor nearest to the region mean, one voxel at a time."""
+    offsets = neighbor_offsets(connectivity)
+    region = [tuple(coordinate)]
+    queued = set(region)
+    frontier = []
+    while True:
+        for offset in offsets:
+            voxel = tuple(np.add(region[-1], offset))
+            if voxel not in queued and \
+               all(0 <= c < s for c, s in zip(voxel, image.shape)):
+                queued.add(voxel)
+                frontier.append(voxel)
+        if len(region) >= number or not frontier:
+            break
+        mean = np.mean([image[v] for v in region])
+        nearest = min(frontier, key=lambda v: abs(image[v] - mean))
+        frontier.remove(nearest)
+        region.append(nearest)
+    mask = np.zeros(image.shape, dtype=np.bool)
+    mask[tuple(np.transpose(region))] = True
+    return mask
+
+
+def _reference_seeded_growing(image, seeds, stop_size):
+    """At each step, the region whose nearest free neighbor is the closest
+    to its mean takes that voxel."""
+    offsets = neighbor_offsets(6)
+    labels = np.unique(seeds[seeds != 0])
+    owner = seeds.copy()
+    regions = [map(tuple, np.transpose(np.nonzero(seeds == label)))
+               for label in labels]
+
+    def free_neighbors(region):
+        neighbors = set()
+        for voxel in region:
+            for offset in offsets:
+                q = tuple(np.add(voxel, offset))
+                if all(0 <= c < s for c, s in zip(q, image.shape)) and \
+                   owner[q] == 0:
+                    neighbors.add(q)
+        return neighbors
+
+    while True:
+        best = None
+        for k, region in enumerate(regions):
+            neighbors = free_neighbors(region)
+            if len(region) >= stop_size[k] or not neighbors:
+                continue
+            mean = np.mean([image[v] for v in region])
+            voxel = min(neighbors, key=lambda v: abs(image[v] - mean))
+            dist = abs(image[voxel] - mean)
+            if best is None or dist < best[0]:
+                best = (dist, k, voxel)
+        if best is None:
+            break
+        dist, k, voxel = best
+        owner[voxel] = labels[k]
+        regions[k].append(voxel)
+    return owner
+
+
+def test_neighbor_offsets():
+    for connectivity in (6, 18, 26):
+        offsets = neighbor_offsets(connectivity)
+        assert len(offsets) == connectivity
+        assert len(set(offsets)) == connectivity
+
+
+def test_region_growing_matches_reference():
+    image = _smooth_volume()
+    for connectivity in (6, 26):
+        for number in (1, 20, 300):
+            result = region_growing(image, (8, 8, 8), number, connectivity)
+            expected = _reference_growing(image, (8, 8, 8), number,
+                                          connectivity)
+            assert_array_equal(result != 0, expected)
+            assert_array_equal(result[expected], image[expected])
+
+
+def test_region_growing_stops_without_neighbors():
+    image = _smooth_volume((4, 4, 4))
+    result = region_growing(image, (0, 0, 0), 1000)
+    assert (result != 0).sum() == image.size
+
+
+def test_seeded_region_growing_single_seed():
+    image = _smooth_volume()
+    seeds = np.zeros(image.shape, dtype=np.int)
+    seeds[8, 8, 8] = 3
+    result = seeded_region_growing(image, seeds, 150)
+    expected = region_growing(image, (8, 8, 8), 150) != 0
+    assert_array_equal(result, np.where(expected, 3, 0))
+
+
+def test_seeded_region_growing_matches_reference():
+    image = _smooth_volume((10, 10, 10))
+    seeds = np.zeros(image.shape, dtype=np.int)
+    seeds[2, 2, 2] = 1
+    seeds[7, 7, 7] = 2
+    seeds[2, 7, 5] = seeds[2, 7, 6] = 5
+    stop_size = [40, 120, 60]
+    result = seeded_region_growing(image, seeds, stop_size)
+    assert_array_equal(result, _reference_seeded_growing(image, seeds,
+                                                         stop_size))
+
+
+def test_seeded_region_growing_stop_sizes():
+    image = _smooth_volume()
+    seeds = np.zeros(image.shape, dtype=np.int)
+    seeds[3, 3, 3] = 1
+    seeds[12, 12, 12] = 2
+    result = seeded_region_growing(image, seeds, [10, 40])
+    # each seed keeps its label and grows a connected region of its size
+    assert result[3, 3, 3] == 1 and result[12, 12, 12] == 2
+    for label, size in ((1, 10), (2, 40)):
+        assert (result == label).sum() == size
+        assert ndimage.label(result == label)[1] == 1
+    # regions fill the whole volume without stop sizes in the way
+    result = seeded_region_growing(image, seeds, image.size)
+    assert np.all(result > 0)
+
+
+def _grid_surface(n):
+    """Return a GeometryData of a triangulated n x n grid."""
+    idx = np.arange(n * n).reshape(n, n)
+    a, b = idx[:-1, :-1].ravel(), idx[:-1, 1:].ravel()
+    c, d = idx[1:, :-1].ravel(), idx[1:, 1:].ravel()
+    faces = np.vstack([np.c_[a, b, c], np.c_[b, d, c]]).astype(np.int32)
+    coords = np.c_[idx.ravel() // n, idx.ravel() % n,
+                   np.zeros(n * n)].astype(np.float)
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        surf_path = os.path.join(tmp_dir, 'lh.inflated')
+        nib.freesurfer.write_geometry(surf_path, coords, faces)
+        return GeometryData(surf_path)
+    finally:
+        shutil.rmtree(tmp_dir)
+
+
+def _surface_signal(n, seed=0):
+    rng = np.random.RandomState(seed)
+    return ndimage.gaussian_filter(rng.rand(n, n), 1.5).reshape(-1, 1) * 10
+
+
+def _reference_compute(surf, vtx_signal, seeds_id, stop_size):
+    """The original growing loop on Region objects of single vertices."""
+    vtx_neighbors = get_n_ring_neighbor(surf.get_faces(), 1)
+    regions = []
+    for v_id in range(len(vtx_signal)):
+        region = Region()
+        region.add_vertex(v_id, vtx_signal)
+        regions.append(region)
+    for region, neighbors in zip(regions, vtx_neighbors):
+        for v_id in neighbors:
+            region.add_neighbor(regions[v_id])
+
+    evolving_regions = []
+    merged_regions = []
+    for seeds in seeds_id:
+        evolving_region = EvolvingRegion(seeds)
+        for seed in seeds:
+            evolving_region.merge(regions[seed])
+            merged_regions.append(regions[seed])
+        evolving_regions.append(evolving_region)
+    for region in evolving_regions:
+        region.remove_neighbors(merged_regions)
+
+    while True:
+        growing = [i for i, region in enumerate(evolving_regions)
+                   if region.size() < stop_size[i] and region.neighbors]
+        if not growing:
+            break
+        nearest = [evolving_regions[i].nearest_neighbor() for i in growing]
+        k = int(np.argmin([float(dist) for _, dist in nearest]))
+        r, target = growing[k], nearest[k][0]
+        if target not in merged_regions:
+            merged_regions.append(target)
+            evolving_regions[r].merge(target)
+        for i in growing:
+            evolving_regions[i].remove_neighbor(target)
+    return [sorted(region.get_vertices()) for region in evolving_regions]
+
+
+def _region_grow(surf, vtx_signal, mask=None):
+    rg = RegionGrow()
+    rg.surf2regions(surf, vtx_signal, mask)
+    return rg
+
+
+def test_surface_growing_matches_reference():
+    n = 12
+    surf = _grid_surface(n)
+    vtx_signal = _surface_signal(n)
+    rg = _region_grow(surf, vtx_signal)
+    cases = [([[n * n // 2 + n // 2]], [60]),
+             ([[5], [n * n - 7, n * n - 8], [n * (n // 2) + 3]], [20, 50, 35])]
+    for seeds_id, stop_size in cases:
+        regions = rg.srg_parcel(seeds_id, stop_size)
+        assert [sorted(r.get_vertices()) for r in regions] == \
+            _reference_compute(surf, vtx_signal, seeds_id, stop_size)
+
+
+def test_surface_growing_in_mask():
+    n = 12
+    surf = _grid_surface(n)
+    vtx_signal = _surface_signal(n)
+    mask = np.zeros(n * n)
+    mask[:n * n // 2] = 1
+    regions = _region_grow(surf, vtx_signal, mask).srg_parcel([[n + 1]],
+                                                             n * n)
+    # the region fills the mask, and stops at its border
+    assert_array_equal(sorted(regions[0].get_vertices()),
+                       np.nonzero(mask)[0])
+
+
+def test_running_assessments_match_direct():
+    n = 10
+    surf = _grid_surface(n)
+    rng = np.random.RandomState(1)
+    mask = (rng.rand(n * n) > 0.1).astype(np.int)
+    mask[n * n // 2 + n // 2] = 1
+    signals = [_surface_signal(n),
+               np.hstack([_surface_signal(n, 1), _surface_signal(n, 2)])]
+    for vtx_signal in signals:
+        for use_mask in (None, mask):
+            rg = _region_grow(surf, vtx_signal, use_mask)
+            for assess_type in rg.get_assess_types():
+                rg.set_assessment(assess_type)
+                _, regions, assessments, _, outer_value = \
+                    rg.arg_parcel([[n * n // 2 + n // 2]], 30, True)
+                component = regions[0].component
+                # one assessment after each merge, on the region snapshot;
+                # the merged node is still a neighbor at that time
+                snapshots = []
+                for end in range(2, len(component) + 1):
+                    region = GraphRegion(rg.graph, component[:end])
+                    neighbors = np.append(region.neighbor_nodes(),
+                                          component[end - 1])
+                    snapshots.append(GraphRegion(rg.graph, component[:end],
+                                                 neighbors=neighbors))
+                assert_allclose(assessments[0],
+                                [rg._assess_func(r) for r in snapshots])
+                assert_allclose(outer_value[0],
+                                [np.mean(r.neighbor_mean_signal())
+                                 for r in snapshots])
+
+
+def _vertices(regions):
+    return [sorted(r.get_vertices()) for r in regions]
+
+
+def test_growth_history_cuts_match_reruns():
+    n = 12
+    surf = _grid_surface(n)
+    vtx_signal = _surface_signal(n)
+    seeds_id = [[n * n // 2 + n // 2]]
+    history = _region_grow(surf, vtx_signal).parcel_history(seeds_id, 60)
+    for stop in (1, 5, 17, 60):
+        assert _vertices(history.regions(stop)) == \
+            _vertices(_region_grow(surf, vtx_signal).srg_parcel(seeds_id,
+                                                                stop))
+
+    rg = _region_grow(surf, vtx_signal)
+    rg.set_assessment('transition level')
+    history = rg.parcel_history(seeds_id, 60, 1)
+    for stop in (17, 40, 60):
+        for half_width in (0, 2):
+            rg = _region_grow(surf, vtx_signal)
+            rg.set_assessment('transition level')
+            max_regions, regions, assessments, _, outer_value = \
+                rg.arg_parcel(seeds_id, stop, True, half_width)
+            assert _vertices(history.regions(stop)) == _vertices(regions)
+            assert _vertices(history.max_assess_regions(stop, half_width)) == \
+                _vertices(max_regions)
+            cut_assessments, cut_outer_value = history.assessments(stop,
+                                                                   half_width)
+            assert_allclose(cut_assessments[0], assessments[0])
+            assert_allclose(cut_outer_value[0], outer_value[0])
+
+
+def test_growth_history_covers():
+    n = 12
+    surf = _grid_surface(n)
+    vtx_signal = _surface_signal(n)
+    history = _region_grow(surf, vtx_signal).parcel_history(
+        [[n * n // 2 + n // 2]], 30)
+    assert history.covers(10) and history.covers(30)
+    assert not history.covers(31)
+    try:
+        history.regions(31)
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("regions beyond the recorded growth")
+
+    # a region which ran out of neighbors would not grow any further
+    mask = np.zeros(n * n)
+    mask[:n] = 1
+    history = _region_grow(surf, vtx_signal, mask).parcel_history([[1]], 30)
+    assert history.covers(1000)
+    assert _vertices(history.regions(1000)) == [range(n)]
+
+
+def test_growth_history_of_several_regions():
+    n = 12
+    surf = _grid_surface(n)
+    vtx_signal = _surface_signal(n)
+    seeds_id = [[5], [n * n - 7, n * n - 8], [n * (n // 2) + 3]]
+    stop_size = [20, 50, 35]
+    history = _region_grow(surf, vtx_signal).parcel_history(seeds_id,
+                                                            stop_size)
+    # only the cuts at the recorded stop sizes are those of a rerun
+    assert _vertices(history.regions()) == \
+        _vertices(history.regions(stop_size)) == \
+        _reference_compute(surf, vtx_signal, seeds_id, stop_size)
+    assert history.covers([10, 50, 20])
+    assert not history.covers([10, 51, 20])
+    for region, stop in zip(history.regions([10, 30, 20]), [10, 30, 20]):
+        assert region.size() == stop
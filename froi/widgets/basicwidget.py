@@ -5,9 +5,6 @@ from PyQt4.QtCore import *
 from PyQt4.QtGui import *
 
 from ..utils import *
-from growdialog import GrowDialog
-from watersheddialog import WatershedDialog
-from slicdialog import SLICDialog
 from clusterdialog import ClusterDialog
 from intersectdialog import IntersectDialog
 from localmaxdialog import LocalMaxDialog
@@ -119,18 +116,21 @@ class BasicWidget(QDialog):
     def _grow_clicked(self):
         """Region growing clicked."""
         if self.grow_button.isEnabled():
+            from growdialog import GrowDialog
             new_dialog = GrowDialog(self._model, self._main_win)
             new_dialog.exec_()
 
     def _watershed_clicked(self):
         """Watershed clicked"""
         if self.watershed_button.isEnabled():
+            from watersheddialog import WatershedDialog
             new_dialog = WatershedDialog(self._model, self)
             new_dialog.exec_()
 
     def _slic_clicked(self):
         """Supervoxel clicked."""
         if self.slic_button.isEnabled():
+            from slicdialog import SLICDialog
             new_dialog = SLICDialog(self._model, self)
             new_dialog.exec_()
 
@@ -88,7 +88,7 @@ class BinarizationDialog(QDialog):
 
         source_row = self.source_combo.currentIndex()
         source_data = self._model.data(self._model.index(source_row),
-                                       Qt.UserRole + 6)
+                                       Qt.UserRole + 12)
         new_vol = imtool.binaryzation(source_data, threshold)
         self._model.addItem(new_vol,
                             None,
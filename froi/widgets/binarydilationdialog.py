@@ -94,7 +94,7 @@ class BinarydilationDialog(QDialog):
 
         source_row = self.source_combo.currentIndex()
         source_data = self._model.data(self._model.index(source_row),
-                                       Qt.UserRole + 6)
+                                       Qt.UserRole + 12)
 
         binary_vol = imtool.binaryzation(source_data,
                                     (source_data.max() + source_data.min()) / 2)
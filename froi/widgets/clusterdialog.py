@@ -83,7 +83,7 @@ class ClusterDialog(QDialog):
 
         current_row = self._model.currentIndex().row()
         source_data = self._model.data(self._model.index(current_row),
-                                       Qt.UserRole + 6)
+                                       Qt.UserRole + 12)
         new_vol = imtool.cluster_labeling(source_data, threshold)
         self._model.addItem(new_vol,
                             None,
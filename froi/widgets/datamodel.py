@@ -4,12 +4,23 @@
 
 """
 import numpy.linalg as npl
+import nibabel as nib
 from nibabel.affines import apply_affine
 from nibabel import aff2axcodes
+from collections import OrderedDict
+
 import numpy as np
 from PyQt4.QtCore import *
 
 from ..core.dataobject import VolumeDataset
+from ..core.renderpool import RenderPool
+from ..io.shadow_cache import shadow_path
+from ..algorithm.array2qimage import blank_qimage, blend2qimage
+
+# max number of composited slices kept for GridView
+COMPOSITE_CACHE_SIZE = 128
+# interval of scheduled repaints in ms, about one frame at 60 fps
+REPAINT_INTERVAL = 16
 
 
 class VolumeListModel(QAbstractListModel):
@@ -21,6 +32,8 @@ class VolumeListModel(QAbstractListModel):
     cross_pos_changed = pyqtSignal()
     undo_stack_changed = pyqtSignal()
     redo_stack_changed = pyqtSignal()
+    # slice index, error message of a slice which failed to render
+    render_failed = pyqtSignal(int, object)
 
     # new image order
     new_no = 1
@@ -40,6 +53,17 @@ class VolumeListModel(QAbstractListModel):
         # The current position is an index of 3D space.
         self._cross_pos = [0, 0, 0]
         self._display_cross = True
+        self._composite_cache = OrderedDict()
+        self._render_pool = RenderPool(self)
+        self._render_pool.slice_rendered.connect(self.schedule_repaint)
+        self._render_pool.slice_failed.connect(self.render_failed)
+        # dirty slices (-1 for all) and cursor status, flushed once a frame
+        self._dirty_slices = set()
+        self._cross_pos_dirty = False
+        self._repaint_timer = QTimer(self)
+        self._repaint_timer.setSingleShot(True)
+        self._repaint_timer.setInterval(REPAINT_INTERVAL)
+        self._repaint_timer.timeout.connect(self.flush_repaint)
         self._connect_undo_redo()
         self._label_config_center = label_config_center
         self._label_config_center.single_roi_view_update_for_model.connect(
@@ -54,10 +78,39 @@ class VolumeListModel(QAbstractListModel):
         return apply_affine(self._affine, self._cross_pos)
 
     def set_cross_pos(self, new_coord):
-        """Set current cursor position."""
+        """Set current cursor position.
+
+        Views are notified on next frame, so a burst of cursor moves
+        results in only one update.
+        """
         self._cross_pos = new_coord
         self.update_orth_rgba()
-        self.cross_pos_changed.emit()
+        self._cross_pos_dirty = True
+        self.schedule_repaint([])
+
+    def schedule_repaint(self, slices=-1):
+        """Mark slices as dirty, they are repainted on next frame.
+
+        `slices` may be an index or a list of indexes, -1 for all.
+        """
+        if np.isscalar(slices):
+            slices = [slices]
+        self._dirty_slices.update(slices)
+        if not self._repaint_timer.isActive():
+            self._repaint_timer.start()
+
+    def flush_repaint(self):
+        """Emit pending repaint signals at once."""
+        self._repaint_timer.stop()
+        cross_pos_dirty, self._cross_pos_dirty = self._cross_pos_dirty, False
+        dirty_slices, self._dirty_slices = self._dirty_slices, set()
+        if cross_pos_dirty:
+            self.cross_pos_changed.emit()
+        if -1 in dirty_slices:
+            self.repaint_slices.emit(-1)
+        else:
+            for s in sorted(dirty_slices):
+                self.repaint_slices.emit(s)
 
     def set_space_pos(self, new_space_coord):
         """Set current cursor position based on RAS coordinates."""
@@ -99,7 +152,8 @@ class VolumeListModel(QAbstractListModel):
         """Set the status of current position indicator."""
         if isinstance(status, bool) and not status == self.display_cross():
             self._display_cross = status
-            self.cross_pos_changed.emit()
+            self._cross_pos_dirty = True
+            self.schedule_repaint([])
 
     def rowCount(self, parent=QModelIndex()):
         """ Return the item numbers in the list."""
@@ -143,6 +197,12 @@ class VolumeListModel(QAbstractListModel):
             return self._data[row].get_data_shape()[3]
         elif role == Qt.UserRole + 11:
             return self._data[0].get_header()
+        elif role == Qt.UserRole + 12:
+            # read-only, shared with the item copy-on-write
+            return self._data[row].get_data_view()
+        elif role == Qt.UserRole + 13:
+            # read-only, voxels below view_min are masked
+            return self._data[row].get_lthr_view()
 
         # return QVariant()
         return None
@@ -194,7 +254,7 @@ class VolumeListModel(QAbstractListModel):
             else:
                 self._data[row].set_roi_name([value])
         elif role == Qt.UserRole + 5:
-            self._data[row]._data  = np.rot90(value)
+            self._data[row].set_raw_data(value)
         elif role == Qt.UserRole + 9:
             if not self._data[row].get_time_point() == value:
                 self._data[row].set_time_point(value)
@@ -204,7 +264,7 @@ class VolumeListModel(QAbstractListModel):
         # Update RGBA list after setting
         #self._data[row].update_rgba()     
         self.dataChanged.emit(index, index)
-        self.repaint_slices.emit(-1)
+        self.schedule_repaint()
         return True
 
     def flags(self, index):
@@ -241,7 +301,7 @@ class VolumeListModel(QAbstractListModel):
         #print type(row),'----------------------',type(count)
         self.beginRemoveRows(parent, row, (row + count - 1))
         for index in range(count):
-            self._data.pop(row)
+            self._render_pool.forget(self._data.pop(row))
         self.endRemoveRows()
         return True
 
@@ -255,39 +315,42 @@ class VolumeListModel(QAbstractListModel):
         >>> model.addItem(filepath)
 
         """
+        if isinstance(source, basestring):
+            # only the header is read here, voxel data are loaded by the
+            # dataset itself
+            source = nib.load(shadow_path(source), mmap='c')
+        elif isinstance(source, np.ndarray) and not source.flags.writeable:
+            # a read-only view of another item can not be edited
+            source = source.copy()
         if self.rowCount():
-            vol = VolumeDataset(source, self._label_config_center, name, header,
-                                view_min, view_max, alpha, colormap,
-                                [0, 0, 0])
-            if self._data[0].get_data_shape()[0:3] == vol.get_data_shape()[0:3]:
-                vol = VolumeDataset(source, self._label_config_center, name,
-                                    header, view_min, view_max, alpha,
-                                    colormap, [self._cross_pos[0],
-                                               self._cross_pos[1],
-                                               self._cross_pos[2]])
-                ok = self.insertRow(0, vol)
-                if ok:
-                    self.repaint_slices.emit(-1)
-                    return True
-                else:
-                    return False
+            if isinstance(source, np.ndarray):
+                shape, affine = source.shape, self._header_affine(header)
             else:
+                shape = source.shape
+                affine = self._header_affine(source.get_header())
+            if self._data[0].get_data_shape()[0:3] != shape[0:3]:
                 print 'Mismatch data size!'
                 return False
-        else:
-            vol = VolumeDataset(source, self._label_config_center, name, header,
-                                view_min, view_max, alpha, colormap,
-                                [self._cross_pos[0],
-                                 self._cross_pos[1],
-                                 self._cross_pos[2]])
-            ok = self.insertRow(0, vol)
-            if ok:
-                self._get_sapce_info(vol)
-                self.repaint_slices.emit(-1)
-                return True
-            else:
+            if affine is not None and self._affine is not None and \
+               not np.allclose(affine, self._affine, atol=1e-4):
+                print 'Mismatch affine!'
                 return False
 
+        vol = VolumeDataset(source, self._label_config_center, name, header,
+                            view_min, view_max, alpha, colormap,
+                            [self._cross_pos[0],
+                             self._cross_pos[1],
+                             self._cross_pos[2]])
+        first = not self.rowCount()
+        ok = self.insertRow(0, vol)
+        if ok:
+            if first:
+                self._get_sapce_info(vol)
+            self.schedule_repaint()
+            return True
+        else:
+            return False
+
     def delItem(self, row):
         """Delete a item.
 
@@ -297,7 +360,7 @@ class VolumeListModel(QAbstractListModel):
         """
         ok = self.removeRow(row)
         if ok:
-            self.repaint_slices.emit(-1)
+            self.schedule_repaint()
             return True
         else:
             return False
@@ -330,7 +393,7 @@ class VolumeListModel(QAbstractListModel):
             self._data[row], self._data[row - 1] = \
                     self._data[row - 1], self._data[row]
             self.endMoveRows()
-            self.repaint_slices.emit(-1)
+            self.schedule_repaint()
         else:
             raise ValueError("Input must be non-zero integer.")
 
@@ -344,7 +407,7 @@ class VolumeListModel(QAbstractListModel):
             self._data[row], self._data[row + 1] = \
                     self._data[row + 1], self._data[row]
             self.endMoveRows()
-            self.repaint_slices.emit(-1)
+            self.schedule_repaint()
         else:
             raise ValueError("Index out of range!")
 
@@ -408,7 +471,7 @@ class VolumeListModel(QAbstractListModel):
             y = [item[1] for item in coord_list]
             z = [item[2] for item in coord_list]
             self._data[row].set_voxel(x, y, z, value, ignore)
-            self.repaint_slices.emit(coord_list[0][2])
+            self.schedule_repaint(set(z))
         elif roi is not None:
             row = self.currentIndex().row()
             if target_row is None:
@@ -416,8 +479,7 @@ class VolumeListModel(QAbstractListModel):
             coords = self._data[row].get_roi_coords(roi)
             x, y, z = list(coords[0]), list(coords[1]), list(coords[2])
             self._data[target_row].set_voxel(x, y, z, value, ignore)
-            for s in range(min(z), max(z)+1):
-                self.repaint_slices.emit(s)
+            self.schedule_repaint(range(min(z), max(z)+1))
         else:
             return
     
@@ -437,6 +499,48 @@ class VolumeListModel(QAbstractListModel):
         return [self._data[idx.row()].get_rgba(index) for 
                 idx in self.selectedIndexes()]
 
+    def composite_image(self, index):
+        """Get the composited QImage of the `index`th slice and its version.
+
+        The image is composited again only if the layer order, the
+        visibility or the rendering of any layer has changed. Slices not
+        rendered yet are requested from the render pool, and the former
+        image (or a black one) is returned as a placeholder meanwhile.
+        """
+        volumes = [self._data[idx.row()] for idx in self.selectedIndexes()]
+        key = tuple((id(vol), vol.get_rgba_version(index)) for vol in volumes)
+        cached = self._composite_cache.pop(index, None)
+        if cached is not None and cached[0] == key:
+            image = cached[1]
+        else:
+            # reuse the buffer of the stale image
+            if cached is not None:
+                image = cached[1]
+            else:
+                image = blank_qimage(self.getX(), self.getY())
+            layers = [vol.peek_rgba(index) for vol in volumes]
+            missing = [vol for vol, layer in zip(volumes, layers)
+                       if layer is None]
+            if missing:
+                for vol in missing:
+                    self._render_pool.request(vol, index)
+                key = cached[0] if cached is not None else None
+            else:
+                blend2qimage(image, layers)
+            if len(self._composite_cache) >= COMPOSITE_CACHE_SIZE:
+                self._composite_cache.popitem(last=False)
+        self._composite_cache[index] = (key, image)
+        return image, key
+
+    def prefetch_slices(self, indexes):
+        """Render slices in background before they are displayed."""
+        volumes = [self._data[idx.row()] for idx in self.selectedIndexes()]
+        for index in indexes:
+            for vol in volumes:
+                if vol.peek_rgba(index) is None:
+                    self._render_pool.request(vol, index,
+                                              RenderPool.LOW_PRIORITY)
+
     def getX(self):
         """Get the height of the picture."""
         return self._data[0].get_data_shape()[1]
@@ -455,7 +559,7 @@ class VolumeListModel(QAbstractListModel):
             for data in self._data:
                 data.set_time_point(tpoint)
         self.time_changed.emit()
-        self.repaint_slices.emit(-1)
+        self.schedule_repaint()
 
     def get_current_label_config(self):
         row = self.currentIndex().row()
@@ -470,15 +574,13 @@ class VolumeListModel(QAbstractListModel):
         row = self.currentIndex().row()
         s = self._data[row].undo()
         if s is not None:
-            for s_ in range(min(s), max(s)+1):
-                self.repaint_slices.emit(s_)
+            self.schedule_repaint(range(min(s), max(s)+1))
 
     def redo_current_image(self):
         row = self.currentIndex().row()
         s = self._data[row].redo()
         if s is not None:
-            for s_ in range(min(s), max(s)+1):
-                self.repaint_slices.emit(s_)
+            self.schedule_repaint(range(min(s), max(s)+1))
 
     def current_undo_available(self):
         row = self.currentIndex().row()
@@ -492,6 +594,10 @@ class VolumeListModel(QAbstractListModel):
         row = self.currentIndex().row()
         return self._data[row].get_value(xyz, time_course)
 
+    def get_current_time_course(self, xyz, radius=0):
+        row = self.currentIndex().row()
+        return self._data[row].get_time_course(xyz, radius)
+
     def get_row_value(self, xyz, row):
         return self._data[row].get_value(xyz)
 
@@ -501,10 +607,20 @@ class VolumeListModel(QAbstractListModel):
     def update_current_rgba(self):
         row = self.currentIndex().row()
         self._data[row].update_rgba()
-        self.repaint_slices.emit(-1)
+        self.schedule_repaint()
 
     def update_all_rgba(self):
-        self.repaint_slices.emit(-1)
+        self.schedule_repaint()
+
+    def get_plane_version(self, plane):
+        """Get version of the composited plane in OrthView."""
+        return tuple((id(self._data[idx.row()]),
+                      self._data[idx.row()].get_plane_version(plane))
+                     for idx in self.selectedIndexes())
+
+    def get_plane_rgba_list(self, plane):
+        """Get RGBA arrays of the plane in OrthView."""
+        return getattr(self, 'get_%s_rgba_list' % plane)()
 
     def get_sagital_rgba_list(self):
         """Get RGBA array for sagital direction in OrthView."""
@@ -540,10 +656,21 @@ class VolumeListModel(QAbstractListModel):
         space_list = ['unknown', 'Scanner', 'Aligned', 'Talairach', 'MNI']
         if header['sform_code']:
             self._ras_space = space_list[header['sform_code'].item()]
-            self._affine = header.get_sform()
         elif header['qform_code']:
             self._ras_space = space_list[header['qform_code'].item()]
-            self._affine = header.get_qform()
+        affine = self._header_affine(header)
+        if affine is not None:
+            self._affine = affine
+
+    def _header_affine(self, header):
+        """Return the sform (or qform) affine of a header, or None."""
+        if header is None:
+            return None
+        if header['sform_code']:
+            return header.get_sform()
+        elif header['qform_code']:
+            return header.get_qform()
+        return None
 
     def get_affine(self):
         """ Get affine matrix."""
@@ -114,7 +114,7 @@ class GreydilationDialog(QDialog):
 
         source_row = self.source_combo.currentIndex()
         source_data = self._model.data(self._model.index(source_row),
-                                       Qt.UserRole + 5)
+                                       Qt.UserRole + 13).filled(0)
 
         new_vol = morphology.grey_dilation(source_data,size=size,mode=mode,cval=cval)
         self._model.addItem(new_vol,
@@ -5,15 +5,24 @@ in a grid style.
 
 """
 
+from PyQt4.QtCore import *
 from PyQt4.QtGui import *
 
 from imagelabel import ImageLabel
 
 
 class GridView(QScrollArea):
-    """Implementation a widget for image display in a grid style."""
+    """Implementation a widget for image display in a grid style.
+
+    Only slices in the viewport (plus a few overscan rows) own an
+    ImageLabel, labels are recycled while scrolling.
+    """
     # number of slice each row
     _row_count = 7
+    # space between two images
+    _spacing = 5
+    # number of rows rendered out of the viewport
+    _overscan = 1
 
     def __init__(self, model=None, draw_settings=None, 
                  vertical_srollbar_position=0, parent=None):
@@ -32,31 +41,97 @@ class GridView(QScrollArea):
         # store corsshair position
         self._cross_pos = self._model.get_cross_pos()
 
-        # imagelabel instances
-        self.image_labels = [ImageLabel(model, draw_settings, n_slice) for
-                             n_slice in xrange(model.getZ())]
+        # imagelabel instances of visible slices, and the recycled ones
+        self.image_labels = {}
+        self._label_pool = []
+        self._mouse_tracking = True
+        self._cursor_shape = None
+
+        view_widget = QWidget()
+        self.setWidget(view_widget)
+        self.setBackgroundRole(QPalette.Dark)
+        self.verticalScrollBar().valueChanged.connect(
+                self.update_visible_labels)
+
         self.update_row_count()
         self.update_layout()
-        self.set_label_mouse_tracking(True)
 
         self._type = 'grid'
-        
+
+    def _cell_size(self):
+        """Return the size of an image."""
+        scale_factor = self._model.get_scale_factor('grid')
+        return QSize(self._model.getY(), self._model.getX()) * scale_factor
+
+    def _slice_pos(self, n_slice):
+        """Return the position of the `n_slice`th image in the view."""
+        cell = self._cell_size()
+        row, col = n_slice / self._row_count, n_slice % self._row_count
+        return (self._spacing + col * (cell.width() + self._spacing),
+                self._spacing + row * (cell.height() + self._spacing))
+
     def update_layout(self):
-        layout = QGridLayout()
-        layout.setSpacing(5)
-        for slice, image in enumerate(self.image_labels):
-            row, col = slice / self._row_count, slice % self._row_count
-            layout.addWidget(image, row, col)
-        view_widget = QWidget()
-        view_widget.setLayout(layout)
-        self.setWidget(view_widget)
-        self.setBackgroundRole(QPalette.Dark)
-        self.layout = layout
+        """Resize the view widget and place images on it."""
+        cell = self._cell_size()
+        row_num = (self._model.getZ() + self._row_count - 1) / self._row_count
+        self.widget().resize(
+                self._spacing + self._row_count * (cell.width() +
+                                                   self._spacing),
+                self._spacing + row_num * (cell.height() + self._spacing))
+        for n_slice, label in self.image_labels.iteritems():
+            label.resize(cell)
+            label.move(*self._slice_pos(n_slice))
         if self._vertical_scrollbar_position and \
            self._vertical_scrollbar_position <= \
                 self.verticalScrollBar().maximum():
             self.verticalScrollBar().setValue(
                     self._vertical_scrollbar_position)
+            self._vertical_scrollbar_position = None
+        self.update_visible_labels()
+
+    def update_visible_labels(self, value=None):
+        """Show the slices in the viewport and recycle the others."""
+        row_height = self._cell_size().height() + self._spacing
+        top = self.verticalScrollBar().value()
+        first_row = top / row_height
+        last_row = (top + self.viewport().height()) / row_height
+        on_screen = set(self._row_slices(first_row, last_row))
+        visible = set(self._row_slices(first_row - self._overscan,
+                                       last_row + self._overscan))
+        # slices in the overscan rows are rendered in background
+        self._model.prefetch_slices(sorted(visible - on_screen))
+
+        for n_slice in self.image_labels.keys():
+            if n_slice not in visible:
+                label = self.image_labels.pop(n_slice)
+                label.hide()
+                self._label_pool.append(label)
+
+        cell = self._cell_size()
+        for n_slice in sorted(visible.difference(self.image_labels)):
+            if self._label_pool:
+                label = self._label_pool.pop()
+                label.set_slice(n_slice)
+            else:
+                label = ImageLabel(self._model, self._draw_settings, n_slice,
+                                   self.widget())
+                label.setMouseTracking(self._mouse_tracking)
+                if self._cursor_shape is not None:
+                    label.setCursor(self._cursor_shape)
+            label.resize(cell)
+            label.move(*self._slice_pos(n_slice))
+            label.show()
+            self.image_labels[n_slice] = label
+
+    def _row_slices(self, first_row, last_row):
+        """Return indexes of slices from first_row to last_row."""
+        return xrange(max(first_row, 0) * self._row_count,
+                      min((last_row + 1) * self._row_count,
+                          self._model.getZ()))
+
+    def _all_labels(self):
+        """Return all imagelabel instances, including the recycled ones."""
+        return self.image_labels.values() + self._label_pool
         
     def display_type(self):
         return self._type
@@ -69,18 +144,20 @@ class GridView(QScrollArea):
 
     def set_label_mouse_tracking(self, t=False):
         """Set mouse tracking status."""
-        for label in self.image_labels:
+        self._mouse_tracking = t
+        for label in self._all_labels():
             label.setMouseTracking(t)
     
     def set_cursor(self, cursor_shape):
         """Set cursor shape."""
-        for label in self.image_labels:
+        self._cursor_shape = cursor_shape
+        for label in self._all_labels():
             label.setCursor(cursor_shape)
 
     def update_row_count(self, twidth=None):
         if twidth is None:
             twidth = self.size().width()
-        img_label_width = self.image_labels[0].size().width()
+        img_label_width = self._cell_size().width()
         row_count = twidth // (img_label_width+7)
         if row_count <= 0:
             row_count=1
@@ -88,12 +165,11 @@ class GridView(QScrollArea):
 
     def resize_item(self):
         """Resize images function."""
-        for image in self.image_labels:
-            self.layout.removeWidget(image)
         self.update_row_count(self.size().width())
         self.update_layout()
 
     def resizeEvent(self, e):
+        super(GridView, self).resizeEvent(e)
         self.update_row_count(e.size().width())
         self.update_layout()
         
@@ -105,6 +181,6 @@ class GridView(QScrollArea):
         """Set crosshair coordinate as a new value."""
         old_slice = self._cross_pos[2]
         self._cross_pos = self._model.get_cross_pos()
-        self.image_labels[old_slice].repaint()
-        self.image_labels[self._cross_pos[2]].repaint()
-
+        for n_slice in (old_slice, self._cross_pos[2]):
+            if n_slice in self.image_labels:
+                self.image_labels[n_slice].repaint()
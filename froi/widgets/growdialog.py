@@ -1,10 +1,12 @@
 # emacs: -*- mode: python; py-indent-offset: 4; indent-tabs-mode: nil -*-
 # vi: set ft=python sts=4 ts=4 sw=4 et:
 
+import numpy as np
 from PyQt4.QtCore import *
 from PyQt4.QtGui import *
 
 from froi.algorithm import regiongrow as rg
+from froi.algorithm import imtool
 
 
 class GrowDialog(QDialog):
@@ -25,6 +27,8 @@ class GrowDialog(QDialog):
         xyz = self._model.get_cross_pos()
         #source_label = QLabel("Source")
         self.source_combo = QComboBox()
+        seed_label = QLabel("Seeds")
+        self.seed_combo = QComboBox()
         pointx_label = QLabel("Seed point x")
         self.pointx_edit = QLineEdit()
         self.pointx_edit.setText(str(xyz[0]))
@@ -40,8 +44,14 @@ class GrowDialog(QDialog):
         self.number_edit = QLineEdit()
         self.number_edit.setText('100')
 
+        connectivity_label = QLabel("Connectivity")
+        self.connectivity_combo = QComboBox()
+        self.connectivity_combo.addItems(['6', '18', '26'])
+
         vol_list = self._model.getItemList()
         self.source_combo.addItems(vol_list)
+        self.seed_combo.addItem("Seed point")
+        self.seed_combo.addItems(vol_list)
         row = self._model.currentIndex().row()
         self.source_combo.setCurrentIndex(row)
         out_label = QLabel("Output volume name")
@@ -49,18 +59,23 @@ class GrowDialog(QDialog):
 
         # layout config
         grid_layout = QGridLayout()
-        grid_layout.addWidget(pointx_label, 0, 0)
-        grid_layout.addWidget(self.pointx_edit, 0, 1)
-        grid_layout.addWidget(pointy_label, 1, 0)
-        grid_layout.addWidget(self.pointy_edit, 1, 1)
-        grid_layout.addWidget(pointz_label, 2, 0)
-        grid_layout.addWidget(self.pointz_edit, 2, 1)
+        grid_layout.addWidget(seed_label, 0, 0)
+        grid_layout.addWidget(self.seed_combo, 0, 1)
+        grid_layout.addWidget(pointx_label, 1, 0)
+        grid_layout.addWidget(self.pointx_edit, 1, 1)
+        grid_layout.addWidget(pointy_label, 2, 0)
+        grid_layout.addWidget(self.pointy_edit, 2, 1)
+        grid_layout.addWidget(pointz_label, 3, 0)
+        grid_layout.addWidget(self.pointz_edit, 3, 1)
+
+        grid_layout.addWidget(number_label, 4, 0)
+        grid_layout.addWidget(self.number_edit, 4, 1)
 
-        grid_layout.addWidget(number_label, 3, 0)
-        grid_layout.addWidget(self.number_edit, 3, 1)
+        grid_layout.addWidget(connectivity_label, 5, 0)
+        grid_layout.addWidget(self.connectivity_combo, 5, 1)
 
-        grid_layout.addWidget(out_label, 4, 0)
-        grid_layout.addWidget(self.out_edit, 4, 1)
+        grid_layout.addWidget(out_label, 6, 0)
+        grid_layout.addWidget(self.out_edit, 6, 1)
 
         # button config
         self.run_button = QPushButton("Run")
@@ -79,15 +94,26 @@ class GrowDialog(QDialog):
 
     def _create_actions(self):
         self.source_combo.currentIndexChanged.connect(self._create_output)
+        self.seed_combo.currentIndexChanged.connect(self._update_seed_mode)
         self.run_button.clicked.connect(self._grow)
         self.cancel_button.clicked.connect(self.done)
 
+    def _update_seed_mode(self):
+        """Seed point coordinates are only used without a seed volume."""
+        point_mode = self.seed_combo.currentIndex() == 0
+        self.pointx_edit.setEnabled(point_mode)
+        self.pointy_edit.setEnabled(point_mode)
+        self.pointz_edit.setEnabled(point_mode)
+
     def _create_output(self):
         source_name = self.source_combo.currentText()
         output_name = '_'.join([str(source_name), 'grow'])
         self.out_edit.setText(output_name)
 
     def _grow(self):
+        if self.seed_combo.currentIndex() > 0:
+            self._grow_seeds()
+            return
         vol_name = str(self.out_edit.text())
         pointx = self.pointx_edit.text()
         pointy = self.pointy_edit.text()
@@ -138,7 +164,9 @@ class GrowDialog(QDialog):
         source_row = self.source_combo.currentIndex()
         source_data = self._model.data(self._model.index(source_row),
                                        Qt.UserRole + 5)
-        new_vol =rg.region_growing(source_data, (pointx,pointy,pointz),number)
+        connectivity = int(self.connectivity_combo.currentText())
+        new_vol = rg.region_growing(source_data, (pointx, pointy, pointz),
+                                    number, connectivity)
         self._model.addItem(new_vol,
                             None,
                             vol_name,
@@ -148,3 +176,37 @@ class GrowDialog(QDialog):
         #self._main_win.new_image_action()
         self.done(0)
 
+    def _grow_seeds(self):
+        """Grow all regions of the seed volume at once."""
+        vol_name = str(self.out_edit.text())
+        if not vol_name:
+            self.out_edit.setFocus()
+            return
+        try:
+            number = int(self.number_edit.text())
+        except ValueError:
+            self.number_edit.selectAll()
+            return
+        if number <= 0:
+            QMessageBox.about(self, self.tr("number error"),self.tr("voxel number is out of range"))
+            return
+
+        source_row = self.source_combo.currentIndex()
+        source_data = self._model.data(self._model.index(source_row),
+                                       Qt.UserRole + 12)
+        seed_row = self.seed_combo.currentIndex() - 1
+        seed_data = self._model.data(self._model.index(seed_row),
+                                     Qt.UserRole + 12)
+        if len(np.unique(seed_data[seed_data != 0])) == 1:
+            # seeds with one value, such as local maxima, are separated
+            # into clusters
+            seed_data = imtool.cluster_labeling(seed_data, 0)
+        connectivity = int(self.connectivity_combo.currentText())
+        new_vol = rg.seeded_region_growing(source_data, seed_data, number,
+                                           connectivity)
+        self._model.addItem(new_vol,
+                            None,
+                            vol_name,
+                            self._model._data[0].get_header(),
+                            None, None, 255, 'rainbow')
+        self.done(0)
@@ -5,7 +5,7 @@ import numpy as np
 from PyQt4.QtCore import *
 from PyQt4.QtGui import *
 
-from ..algorithm.array2qimage import composition, qrgba2qimage
+from ..algorithm.array2qimage import blank_qimage, blend2qimage, qrgba2qimage
 
 
 """ImageLabel class. It is used to show a slice of the 3D image"""
@@ -27,10 +27,10 @@ class ImageLabel(QLabel):
         self.set_model(model)
         self.painter_status = painter_status
         self.n_slice = n_slice
-        self.background = np.zeros((model.getX(), model.getY(), 3), 
-                                   dtype=np.uint8)
         self.image = None
+        self.image_version = None
         self.pm = None
+        self.pm_key = None
 
         # for drawing
         self.drawing = False
@@ -38,8 +38,7 @@ class ImageLabel(QLabel):
 
     def sizeHint(self):
         """ Size hint configuration."""
-        default_size = QSize(self.background.shape[1],
-                             self.background.shape[0])
+        default_size = QSize(self.model.getY(), self.model.getX())
         scale_factor = self.model.get_scale_factor('grid')
         return default_size * scale_factor
 
@@ -48,6 +47,15 @@ class ImageLabel(QLabel):
         self.model = model
         self.model.repaint_slices.connect(self.update_image)
 
+    def set_slice(self, n_slice):
+        """Display another slice, used when the label is recycled."""
+        self.n_slice = n_slice
+        self.image = None
+        self.image_version = None
+        self.pm_key = None
+        self.voxels = set()
+        self.update()
+
     def update_image(self, m_slice):
         """Repaint image."""
         # -1 for all
@@ -64,15 +72,14 @@ class ImageLabel(QLabel):
         self.voxels_painter = QPainter()
         self.voxels_painter.begin(self)
         if not self.image or not self.drawing:
-            background = self.background.copy()
-            blend = reduce(composition, 
-                           self.model.rgba_list(self.n_slice), 
-                           background)
-            image = qrgba2qimage(blend)
-            self.image = image
-        pm = QPixmap.fromImage(self.image)
-        pm = pm.scaled(pm.size() * self.model.get_scale_factor('grid'))
-        self.pm = pm
+            self.image, self.image_version = \
+                    self.model.composite_image(self.n_slice)
+        scale = self.model.get_scale_factor('grid')
+        if self.pm_key != (scale, self.image_version):
+            pm = QPixmap.fromImage(self.image)
+            self.pm = pm.scaled(pm.size() * scale)
+            self.pm_key = (scale, self.image_version)
+        pm = self.pm
         self.voxels_painter.drawPixmap(0, 0, pm, 0, 0, 
                                        pm.size().width(), pm.size().height())
         
@@ -221,7 +228,9 @@ class ImageLabel3d(QLabel):
         self.painter_status = painter_status
         self.background = self.make_background()
         self.image = None
+        self.image_version = None
         self.pm = None
+        self.pm_key = None
         self.pic_src_point = None
 
         # store parent widget
@@ -271,6 +280,25 @@ class ImageLabel3d(QLabel):
         """Update image."""
         self.repaint()
 
+    def composite_image(self, shape, plane):
+        """Composite visible layers of the plane into the image buffer."""
+        version = self.model.get_plane_version(plane)
+        if self.image is None or \
+           (self.image.height(), self.image.width()) != shape:
+            self.image = blank_qimage(*shape)
+            self.image_version = None
+        if self.image_version != version:
+            blend2qimage(self.image, self.model.get_plane_rgba_list(plane))
+            self.image_version = version
+
+    def scaled_pixmap(self, scale):
+        """Return the image scaled by the factor as a pixmap."""
+        if self.pm_key != (scale, self.image_version):
+            pm = QPixmap.fromImage(self.image)
+            self.pm = pm.scaled(pm.size() * scale)
+            self.pm_key = (scale, self.image_version)
+        return self.pm
+
     def make_background(self):
         """Create a whole black background."""
         background = np.zeros((self.size().height(), self.size().width(), 3),
@@ -364,13 +392,8 @@ class SagittalImageLabel(ImageLabel3d):
 
         # composite volume picture
         if not self.image or not self.drawing:
-            back_temp = np.zeros((self.model.getZ(), self.model.getX(), 3), 
-                                 dtype=np.uint8)
-            blend = reduce(composition, 
-                           self.model.get_sagital_rgba_list(),
-                           back_temp)
-            image = qrgba2qimage(blend)
-            self.image = image
+            self.composite_image((self.model.getZ(), self.model.getX()),
+                                 'sagital')
         
         # draw black background
         self.background = self.make_background()
@@ -378,9 +401,8 @@ class SagittalImageLabel(ImageLabel3d):
         self.voxels_painter.drawPixmap(0, 0, pm)
         
         # draw volume picture
-        pm = QPixmap.fromImage(self.image)
-        self.pm = pm.scaled(pm.size() * self.model.get_scale_factor('orth') * \
-                            self._expanding_factor)
+        self.scaled_pixmap(self.model.get_scale_factor('orth') *
+                           self._expanding_factor)
         if not self.pic_src_point:
             self.pic_src_point = self.center_src_point()
         self.voxels_painter.drawPixmap(self.pic_src_point[0],
@@ -464,13 +486,8 @@ class SagittalImageLabel(ImageLabel3d):
 
         # composite volume picture
         if not self.image or not self.drawing:
-            back_temp = np.zeros((self.model.getZ(), self.model.getX(), 3), 
-                                 dtype=np.uint8)
-            blend = reduce(composition, 
-                           self.model.get_sagital_rgba_list(),
-                           back_temp)
-            image = qrgba2qimage(blend)
-            self.image = image
+            self.composite_image((self.model.getZ(), self.model.getX()),
+                                 'sagital')
         
         # draw black background
         self.background = self.make_background()
@@ -478,9 +495,8 @@ class SagittalImageLabel(ImageLabel3d):
         self.voxels_painter.drawPixmap(0, 0, pm)
         
         # draw volume picture
-        pm = QPixmap.fromImage(self.image)
-        self.pm = pm.scaled(pm.size() * self.model.get_scale_factor('orth') * \
-                            self._expanding_factor)
+        self.scaled_pixmap(self.model.get_scale_factor('orth') *
+                           self._expanding_factor)
         if not self.pic_src_point:
             self.pic_src_point = self.center_src_point()
         self.voxels_painter.drawPixmap(self.pic_src_point[0],
@@ -688,13 +704,8 @@ class AxialImageLabel(ImageLabel3d):
 
         # composite volume picture
         if not self.image or not self.drawing:
-            back_temp = np.zeros((self.model.getX(), self.model.getY(), 3), 
-                                 dtype=np.uint8)
-            blend = reduce(composition, 
-                           self.model.get_axial_rgba_list(),
-                           back_temp)
-            image = qrgba2qimage(blend)
-            self.image = image
+            self.composite_image((self.model.getX(), self.model.getY()),
+                                 'axial')
 
         # draw black backgroud
         self.background = self.make_background()
@@ -702,9 +713,8 @@ class AxialImageLabel(ImageLabel3d):
         self.voxels_painter.drawPixmap(0, 0, pm)
 
         # draw volume picture
-        pm = QPixmap.fromImage(self.image)
-        self.pm = pm.scaled(pm.size() * self.model.get_scale_factor('orth') * 
-                            self._expanding_factor)
+        self.scaled_pixmap(self.model.get_scale_factor('orth') *
+                           self._expanding_factor)
         if not self.pic_src_point:
             self.pic_src_point = self.center_src_point()
         self.voxels_painter.drawPixmap(self.pic_src_point[0],
@@ -787,13 +797,8 @@ class AxialImageLabel(ImageLabel3d):
 
         # composite volume picture
         if not self.image or not self.drawing:
-            back_temp = np.zeros((self.model.getX(), self.model.getY(), 3), 
-                                 dtype=np.uint8)
-            blend = reduce(composition, 
-                           self.model.get_axial_rgba_list(),
-                           back_temp)
-            image = qrgba2qimage(blend)
-            self.image = image
+            self.composite_image((self.model.getX(), self.model.getY()),
+                                 'axial')
 
         # draw black backgroud
         self.background = self.make_background()
@@ -801,9 +806,8 @@ class AxialImageLabel(ImageLabel3d):
         self.voxels_painter.drawPixmap(0, 0, pm)
 
         # draw volume picture
-        pm = QPixmap.fromImage(self.image)
-        self.pm = pm.scaled(pm.size() * self.model.get_scale_factor('orth') * 
-                            self._expanding_factor)
+        self.scaled_pixmap(self.model.get_scale_factor('orth') *
+                           self._expanding_factor)
         if not self.pic_src_point:
             self.pic_src_point = self.center_src_point()
         self.voxels_painter.drawPixmap(self.pic_src_point[0],
@@ -1007,13 +1011,8 @@ class CoronalImageLabel(ImageLabel3d):
         self.voxels_painter.begin(self)
         self._expanding_factor = self.holder.get_expanding_factor()
         if not self.image or not self.drawing:
-            back_temp = np.zeros((self.model.getZ(), self.model.getY(), 3), 
-                                 dtype=np.uint8)
-            blend = reduce(composition, 
-                           self.model.get_coronal_rgba_list(),
-                           back_temp)
-            image = qrgba2qimage(blend)
-            self.image = image
+            self.composite_image((self.model.getZ(), self.model.getY()),
+                                 'coronal')
 
         # draw black background
         self.background = self.make_background()
@@ -1021,9 +1020,8 @@ class CoronalImageLabel(ImageLabel3d):
         self.voxels_painter.drawPixmap(0, 0, pm)
 
         # draw volume picture
-        pm = QPixmap.fromImage(self.image)
-        self.pm = pm.scaled(pm.size() * self.model.get_scale_factor('orth') *
-                            self._expanding_factor)
+        self.scaled_pixmap(self.model.get_scale_factor('orth') *
+                           self._expanding_factor)
         if not self.pic_src_point:
             self.pic_src_point = self.center_src_point()
         self.voxels_painter.drawPixmap(self.pic_src_point[0],
@@ -1102,13 +1100,8 @@ class CoronalImageLabel(ImageLabel3d):
         self.voxels_painter.begin(pic)
         self._expanding_factor = self.holder.get_expanding_factor()
         if not self.image or not self.drawing:
-            back_temp = np.zeros((self.model.getZ(), self.model.getY(), 3), 
-                                 dtype=np.uint8)
-            blend = reduce(composition, 
-                           self.model.get_coronal_rgba_list(),
-                           back_temp)
-            image = qrgba2qimage(blend)
-            self.image = image
+            self.composite_image((self.model.getZ(), self.model.getY()),
+                                 'coronal')
 
         # draw black background
         self.background = self.make_background()
@@ -1116,9 +1109,8 @@ class CoronalImageLabel(ImageLabel3d):
         self.voxels_painter.drawPixmap(0, 0, pm)
 
         # draw volume picture
-        pm = QPixmap.fromImage(self.image)
-        self.pm = pm.scaled(pm.size() * self.model.get_scale_factor('orth') *
-                            self._expanding_factor)
+        self.scaled_pixmap(self.model.get_scale_factor('orth') *
+                           self._expanding_factor)
         if not self.pic_src_point:
             self.pic_src_point = self.center_src_point()
         self.voxels_painter.drawPixmap(self.pic_src_point[0],
@@ -88,7 +88,7 @@ class LocalMaxDialog(QDialog):
 
         source_row = self.source_combo.currentIndex()
         source_data = self._model.data(self._model.index(source_row),
-                                       Qt.UserRole + 5)
+                                       Qt.UserRole + 13).filled(0)
         new_vol = imtool.local_maximum(source_data, dist)
         self._model.addItem(new_vol, 
                             None,
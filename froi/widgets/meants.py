@@ -74,7 +74,7 @@ class MeanTSDialog(QDialog):
             source_row = self.source_combo.currentIndex()
             mask_row = self.mask_combo.currentIndex()
             source_data = self._model.data(self._model.index(source_row),
-                                           Qt.UserRole + 6)
+                                           Qt.UserRole + 12)
             mask_data = self._model.data(self._model.index(mask_row),
                                          Qt.UserRole + 5)
             meants = imtool.extract_mean_ts(source_data, mask_data) 
@@ -11,7 +11,7 @@ def inverse_image(model):
     """Inverse current selected image by multiplying with -1."""
     # get data and name from current selected image
     current_row = model.currentIndex().row()
-    source_vol = model.data(model.index(current_row), Qt.UserRole + 6)
+    source_vol = model.data(model.index(current_row), Qt.UserRole + 12)
     source_name = model.data(model.index(current_row), Qt.DisplayRole)
     # inverse process
     inversed_vol =  imtool.inverse_transformation(source_vol)
@@ -26,7 +26,7 @@ def edge_detection(model):
     """Image edge detection."""
     # get data and name from current selected image
     current_row = model.currentIndex().row()
-    source_vol = model.data(model.index(current_row), Qt.UserRole + 6)
+    source_vol = model.data(model.index(current_row), Qt.UserRole + 12)
     source_name = model.data(model.index(current_row), Qt.DisplayRole)
     # detect the edge
     new_vol =  imtool.multi_label_edge_detection(source_vol)
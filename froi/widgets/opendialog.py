@@ -95,7 +95,7 @@ class OpenDialog(QDialog):
 
         source_row = self.source_combo.currentIndex()
         source_data = self._model.data(self._model.index(source_row),
-                                       Qt.UserRole + 5)
+                                       Qt.UserRole + 13).filled(0)
         new_vol = imtool.opening(source_data, radius)
         self._model.addItem(new_vol, 
                             None,
@@ -110,7 +110,7 @@ class RegularROIDialog(QDialog):
             roi_generater = imtool.cube_roi
 
         center_data = self._model.data(self._model.currentIndex(),
-                                       Qt.UserRole + 6)
+                                       Qt.UserRole + 12)
         coord_list, value_list = imtool.nonzero_coord(center_data)
         data = center_data.copy()
         for idx in range(len(coord_list)):
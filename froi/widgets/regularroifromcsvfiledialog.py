@@ -104,7 +104,7 @@ class RegularROIFromCSVFileDialog(QDialog):
 
         header = self._model.data(self._model.currentIndex(), Qt.UserRole + 11)
         image_affine = self._model.get_affine()
-        data = self._model.data(self._model.currentIndex(), Qt.UserRole + 6)
+        data = self._model.data(self._model.currentIndex(), Qt.UserRole + 12)
         new_data = np.zeros_like(data).astype(np.uint32)
         try:
             coord_list, radius_list, id_list = get_cord_from_file(header, cord_filepath, image_affine)
@@ -52,7 +52,7 @@ class ROIMergeDialog(QDialog):
         for idx, first in img_iter:
              if first.isChecked():
                 first_data = self._model.data(self._model.index(idx),
-                                              Qt.UserRole + 5)
+                                              Qt.UserRole + 13).filled(0)
                 tmp_idx = idx
                 vol_name.append(self.imgs[idx].text())
                 break
@@ -61,7 +61,7 @@ class ROIMergeDialog(QDialog):
             for idx, item in img_iter:
                 if item.isChecked():
                     data = self._model.data(self._model.index(idx),
-                                            Qt.UserRole + 5)
+                                            Qt.UserRole + 13).filled(0)
                     try:
                         first_data = merge(first_data, data)
                         vol_name.append(self.imgs[idx].text())
@@ -70,6 +70,9 @@ class ROIMergeDialog(QDialog):
                                              self.imgs[idx].text(),
                                              "Please modify ROI by hands")
                         return
+            # the merged data may still be the read-only view of an item
+            if not first_data.flags.writeable:
+                first_data = first_data.copy()
             self._model.addItem(first_data,
                                 None,
                                 '_'.join(map(str, vol_name)),
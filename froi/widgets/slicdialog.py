@@ -126,7 +126,7 @@ class SLICDialog(QDialog):
         if n_segments <=0 or compactness <=0 or sigma <= 0:
             return
 
-        vol_data = self._model.data(self._model.index(self.vol_combo.currentIndex()), Qt.UserRole + 6)
+        vol_data = self._model.data(self._model.index(self.vol_combo.currentIndex()), Qt.UserRole + 12)
         if len(vol_data.shape) > 3:
             return
         gray_image = (vol_data - vol_data.min()) * 255.0 / (vol_data.max() - vol_data.min())
@@ -81,7 +81,7 @@ class SmoothingDialog(QDialog):
 
         current_row = self._model.currentIndex().row()
         source_data = self._model.data(self._model.index(current_row),
-                                       Qt.UserRole + 6)
+                                       Qt.UserRole + 12)
         new_vol = imtool.gaussian_smoothing(source_data, sigma)
         self._model.addItem(new_vol,
                             None,
@@ -1,3 +1,5 @@
+import hashlib
+
 import numpy as np
 from PyQt4 import QtGui, QtCore
 import matplotlib.pyplot as plt
@@ -9,6 +11,15 @@ from ..algorithm.tools import get_curr_hemi, get_curr_overlay, slide_win_smooth,
 from ..algorithm.meshtool import get_n_ring_neighbor
 
 
+def _digest(array):
+    """Return a token of the array contents, None for no array."""
+    if array is None:
+        return None
+    array = np.ascontiguousarray(array)
+    return (array.shape, array.dtype.str,
+            hashlib.sha1(array.view(np.uint8)).hexdigest())
+
+
 class SurfaceRGDialog(QtGui.QDialog):
 
     rg_types = ['srg', 'arg', 'crg']
@@ -27,6 +38,11 @@ class SurfaceRGDialog(QtGui.QDialog):
         # NxM array, N is the number of vertices,
         # M is the number of measurements or time points.
         self.X = None
+        # the overlay which self.X comes from
+        self._X_overlay = None
+        # the key and the GrowthHistory of the last srg/arg run on
+        # scalar files
+        self._growth = None
 
         self.rg_type = 'arg'
         self.mask = None
@@ -133,6 +149,7 @@ class SurfaceRGDialog(QtGui.QDialog):
             data, _ = read_scalar_data(fpath, self.hemi_vtx_number)
             self.X = np.c_[self.X, data]
         self.X = np.delete(self.X, 0, 1)
+        self._X_overlay = None
 
     def _start_cutoff(self):
         self._cutoff_button1.setEnabled(False)
@@ -243,6 +260,7 @@ class SurfaceRGDialog(QtGui.QDialog):
                 if not ol:
                     return None
                 self.X = ol.get_data()
+                self._X_overlay = ol
 
             # ------------------select a assessment function-----------------
             assess_type, ok = QtGui.QInputDialog.getItem(
@@ -254,10 +272,11 @@ class SurfaceRGDialog(QtGui.QDialog):
 
             # ------------------If ok, start arg!-----------------
             if ok and assess_type != '':
-                rg.set_assessment(assess_type)
-                rg.surf2regions(self.surf, self.X, self.mask, self.n_ring)
-                rg_result, self.evolved_regions, self.region_assessments, self.assess_step, r_outer_value =\
-                    rg.arg_parcel(self.seeds_id, self.stop_criteria, whole_results=True)
+                history = self._growth_history(assess_type)
+                rg_result = history.max_assess_regions(self.stop_criteria)
+                self.evolved_regions = history.regions(self.stop_criteria)
+                self.region_assessments, r_outer_value = history.assessments(self.stop_criteria)
+                self.assess_step = history.assess_step
 
                 # -----------------plot diagrams------------------
                 num_axes = len(self.evolved_regions)
@@ -310,9 +329,9 @@ class SurfaceRGDialog(QtGui.QDialog):
                 if not ol:
                     return None
                 self.X = ol.get_data()
+                self._X_overlay = ol
 
-            rg.surf2regions(self.surf, self.X, self.mask, self.n_ring)
-            rg_result = rg.srg_parcel(self.seeds_id, self.stop_criteria)
+            rg_result = self._growth_history().regions(self.stop_criteria)
 
         elif self.rg_type == 'crg':
             ol = get_curr_overlay(self.tree_view_control.currentIndex())
@@ -336,6 +355,38 @@ class SurfaceRGDialog(QtGui.QDialog):
         self._show_result(rg_result)
         self.close()
 
+    def _growth_history(self, assess_type=None):
+        """
+        Grow the regions of srg or arg (with assess_type), and return the
+        GrowthHistory. The last run on the same data is reused if only the
+        stop criteria of a single evolving region is lowered.
+        """
+        key = (self.rg_type, assess_type, self.n_ring,
+               [list(seeds) for seeds in self.seeds_id],
+               _digest(self.surf.get_faces()), _digest(self.X),
+               _digest(self.mask))
+        if self._X_overlay is not None:
+            history = self._X_overlay.get_growth_history(key)
+        elif self._growth is not None and self._growth[0] == key:
+            history = self._growth[1]
+        else:
+            history = None
+        if history is not None and len(self.seeds_id) <= 1 and \
+                history.covers(self.stop_criteria):
+            return history
+
+        rg = RegionGrow()
+        if assess_type is not None:
+            rg.set_assessment(assess_type)
+        rg.surf2regions(self.surf, self.X, self.mask, self.n_ring)
+        history = rg.parcel_history(self.seeds_id, self.stop_criteria,
+                                    1 if assess_type is not None else 0)
+        if self._X_overlay is not None:
+            self._X_overlay.set_growth_history(key, history)
+        else:
+            self._growth = (key, history)
+        return history
+
     def _get_curr_hemi(self):
 
         hemi = get_curr_hemi(self.tree_view_control.currentIndex())
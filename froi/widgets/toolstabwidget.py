@@ -6,7 +6,6 @@ from PyQt4.QtGui import *
 
 from no_gui_tools import edge_detection
 from roimergedialog import ROIMergeDialog
-from roi2gwmidialog import Roi2gwmiDialog
 from regularroidialog import RegularROIDialog
 from ..utils import *
 
@@ -79,6 +78,7 @@ class ToolsTabWidget(QDialog):
     def _r2i_clicked(self):
         """Rroi2interface clicked."""
         if self.roi2interface_button.isEnabled():
+            from roi2gwmidialog import Roi2gwmiDialog
             new_dialog = Roi2gwmiDialog(self._model)
             new_dialog.exec_()
 
@@ -135,7 +135,7 @@ class WatershedDialog(QDialog):
         vol_row = self.vol_combo.currentIndex()
         seed_row = self.seed_combo.currentIndex()
         vol_data = self._model.data(self._model.index(vol_row),
-                                    Qt.UserRole + 6)
+                                    Qt.UserRole + 12)
         if seed_row < self._model.rowCount():
             seed_data = self._model.data(self._model.index(seed_row),
                                          Qt.UserRole + 6)
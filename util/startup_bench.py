@@ -0,0 +1,74 @@
+#! /usr/bin/env python
+# emacs: -*- mode: python; py-indent-offset: 4; indent-tabs-mode: nil -*-
+# vi: set ft=python sts=4 ts=4 sw=4 et:
+
+"""Measure the time to import the FreeROI main window.
+
+Each run imports froi.main in a fresh interpreter, the way bin/freeroi
+does. The script exits with status 1 if the median time exceeds the budget,
+or if a heavy optional dependency is loaded at startup.
+
+Usage: python startup_bench.py [-n runs] [-budget seconds]
+"""
+
+import os
+import sys
+import json
+import argparse
+import subprocess
+
+# modules which should only be loaded when the feature using them is
+heavy_modules = ['mayavi', 'matplotlib', 'skimage', 'networkx', 'traits',
+                 'tvtk', 'scipy.stats', 'scipy.spatial']
+
+_probe = r"""
+import os, sys, time, json
+os.environ['ETS_TOOLKIT'] = 'qt4'
+os.environ['QT_API'] = 'pyqt'
+start = time.time()
+import sip
+for name in ['QDate', 'QDateTime', 'QString', 'QTextStream', 'QTime',
+             'QUrl', 'QVariant']:
+    sip.setapi(name, 2)
+from froi.main import BpMainWindow
+cost = time.time() - start
+print json.dumps({'time': cost, 'modules': sorted(sys.modules.keys())})
+"""
+
+
+def run_once(root):
+    """Import froi.main in a new interpreter, return time and modules."""
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join([root, env.get('PYTHONPATH', '')])
+    output = subprocess.check_output([sys.executable, '-c', _probe], env=env)
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description='FreeROI startup benchmark')
+    parser.add_argument('-n', dest='runs', type=int, default=5,
+                        help='number of runs')
+    parser.add_argument('-budget', dest='budget', type=float, default=2.0,
+                        help='time budget of the median run, in seconds')
+    args = parser.parse_args()
+
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    results = [run_once(root) for i in range(args.runs)]
+    times = sorted(r['time'] for r in results)
+    median = times[len(times) // 2]
+    print 'import froi.main: median %.3fs, min %.3fs, max %.3fs (%d runs)' % \
+          (median, times[0], times[-1], args.runs)
+
+    loaded = set(results[-1]['modules'])
+    heavy = [m for m in heavy_modules if m in loaded]
+    if heavy:
+        print 'Heavy modules loaded at startup: ' + ', '.join(heavy)
+
+    if median > args.budget:
+        print 'Startup time exceeds the budget of %.3fs.' % args.budget
+    if median > args.budget or heavy:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()